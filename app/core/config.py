@@ -17,15 +17,125 @@ class Settings(BaseSettings):
         """Monta a URL de conexão no formato que o SQLAlchemy espera."""
         return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+    # Pool de conexões do banco (por processo: API e cada worker têm o seu)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+
     # MinIO
     MINIO_ENDPOINT: str
     MINIO_ACCESS_KEY: str
     MINIO_SECRET_KEY: str
     MINIO_BUCKET_RAW: str
     MINIO_SECURE: bool
+
+    # Backend de armazenamento: "minio" (produção), "local" (disco) ou "memory" (RAM).
+    # Nos backends local/memory, MINIO_BUCKET_RAW continua sendo o nome do bucket.
+    STORAGE_BACKEND: str = "minio"
+    STORAGE_LOCAL_ROOT: str = "/data/fozdocs-storage"
+
+    # Storage I/O: threads dedicadas às chamadas do MinIO (= conexões HTTP no pool)
+    STORAGE_IO_WORKERS: int = 16
+    STORAGE_CONNECT_TIMEOUT: float = 5.0
+    STORAGE_READ_TIMEOUT: float = 300.0
+
+    # Cache de URLs assinadas (list_chapters/get_chapter)
+    PRESIGN_CACHE_SIZE: int = 50000
+    # Só reaproveita URLs com pelo menos este tempo de vida restante
+    PRESIGN_CACHE_MIN_REMAINING_SECONDS: int = 900
+
+    # Cache local (disco) dos objetos lidos pelos workers (vídeos, intro/outro)
+    OBJECT_CACHE_DIR: str = "/tmp/fozdocs-cache"
+    OBJECT_CACHE_MAX_MB: int = 5120
+
+    # /stream: tamanho de cada leitura do MinIO enviada ao navegador
+    STREAM_CHUNK_SIZE: int = 256 * 1024
+
+    # GC do storage (mark-and-sweep): só apaga órfãos mais velhos que a carência,
+    # para não pegar uploads/stitches ainda em andamento. Intervalo 0 = só manual.
+    STORAGE_GC_GRACE_HOURS: int = 24
+    STORAGE_GC_INTERVAL_HOURS: int = 24
+    # Intervalo entre as leituras da fila de remoção (pending_deletions) quando ela está vazia
+    CLEANUP_POLL_SECONDS: float = 10.0
+
+    # Retenção dos originais brutos de capítulos publicados (cold tier).
+    # "recompress": re-encoda num perfil de arquivo bem menor; "drop": apaga (o vídeo final fica).
+    RAW_RETENTION_DAYS: int = 30
+    RAW_RETENTION_MODE: str = "recompress"
+    RAW_RETENTION_INTERVAL_HOURS: int = 24
+    RAW_ARCHIVE_CRF: int = 34
+    RAW_ARCHIVE_MAX_HEIGHT: int = 720
+
+    # Fila de jobs (Postgres) e workers (python -m app.run_worker).
+    # Jobs simultâneos por worker: o que limita CPU e cotas são os pools por estágio abaixo.
+    WORKER_CONCURRENCY: int = 8
+    JOB_POLL_INTERVAL: float = 1.0
+    # Lease do job: se o worker não renovar (heartbeat) neste prazo, outro worker pega o job
+    JOB_VISIBILITY_TIMEOUT: int = 300
+    JOB_HEARTBEAT_INTERVAL: int = 30
+    # De quanto em quanto tempo o worker confere se o job em execução foi cancelado
+    JOB_CANCEL_POLL_INTERVAL: float = 2.0
+    JOB_MAX_ATTEMPTS: int = 3
+    # Vezes que um job pode voltar para a fila por limite de taxa sem gastar tentativa
+    JOB_MAX_DEFERRALS: int = 20
+    # Fair share entre sistemas: peso por System.id (padrão 1.0), medido sobre os jobs
+    # iniciados na janela. Ex.: JOB_SYSTEM_WEIGHTS='{"3": 0.5}' para um sistema em reprocesso em massa.
+    JOB_SYSTEM_WEIGHTS: dict[int, float] = {}
+    JOB_FAIR_WINDOW_SECONDS: int = 900
+    # A cada quanto tempo de espera um job sobe uma faixa de prioridade (0 = nunca)
+    JOB_LANE_AGING_SECONDS: int = 1800
+
+    # Idempotency-Key (upload, reprocess, publish): por quanto tempo a resposta fica guardada
+    IDEMPOTENCY_TTL_HOURS: int = 24
+    # Quanto tempo um request em andamento segura a chave; vencido, uma repetição assume
+    IDEMPOTENCY_LOCK_SECONDS: int = 300
+
+    # Stream de progresso (SSE): intervalo do keep-alive quando não há eventos
+    PROGRESS_KEEPALIVE_SECONDS: float = 15.0
+
+    # Pools por estágio do pipeline (por processo worker).
+    # ffmpeg: núcleos / FFMPEG_THREADS processos por vez (0 = automático)
+    FFMPEG_CONCURRENCY: int = 0
+    FFMPEG_THREADS: int = 2
+    # Chamadas simultâneas ao Gemini (upload + processamento + análise)
+    AI_CONCURRENCY: int = 2
+    # Áudios de passos gerados ao mesmo tempo (Edge-TTS / gTTS)
+    TTS_CONCURRENCY: int = 4
+    # Tempo máximo de uma síntese no Edge-TTS antes de ir para o gTTS
+    EDGE_TTS_TIMEOUT_SECONDS: float = 20.0
+    # Quanto o POST regenerate_audio espera o job no worker antes de responder 202
+    # (o resultado chega depois pelo stream de progresso)
+    AUDIO_REGENERATE_WAIT_SECONDS: float = 30.0
+
+    # Disjuntores por provedor (Gemini, Edge-TTS, gTTS): abre após N falhas seguidas e
+    # sonda de novo depois de BREAKER_RESET_SECONDS (dobrando a cada sondagem que falha)
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_RESET_SECONDS: float = 30.0
+    BREAKER_MAX_RESET_SECONDS: float = 300.0
+
+    # Upload (Ingest)
+    # Tamanho de cada parte enviada ao MinIO (mínimo do S3: 5 MiB)
+    UPLOAD_PART_SIZE: int = 10 * 1024 * 1024
+    # Orçamento de memória para uploads simultâneos (define quantos rodam em paralelo)
+    UPLOAD_MEMORY_BUDGET_MB: int = 512
+    # /upload/complete interrompido (sessão presa em COMPLETING): depois disso, um retry assume
+    UPLOAD_COMPLETE_LOCK_SECONDS: int = 300
     
     # Google AI
     GOOGLE_API_KEY: str
+    # Preço por milhão de tokens (custo estimado em processing_jobs.cost_usd)
+    GEMINI_INPUT_USD_PER_MTOK: float = 0.10
+    GEMINI_OUTPUT_USD_PER_MTOK: float = 0.40
+    # Limite de análises por minuto somando todos os workers (token bucket no banco) e rajada máxima
+    GEMINI_REQUESTS_PER_MINUTE: float = 15
+    GEMINI_BURST: int = 5
+    # 429/cota esgotada: novas tentativas com backoff exponencial + jitter (ou o retry-after do Google)
+    GEMINI_MAX_RETRIES: int = 4
+    GEMINI_BACKOFF_BASE_SECONDS: float = 2.0
+    GEMINI_BACKOFF_MAX_SECONDS: float = 60.0
+    # Espera máxima dentro do job; acima disso o job volta para a fila e libera o worker
+    GEMINI_MAX_WAIT_SECONDS: float = 120.0
+    # Manual fictício quando a cota acaba ou o modelo não existe (só para desenvolvimento)
+    AI_MOCK_FALLBACK: bool = False
     
     # API
     API_PORT: int = 8000
@@ -0,0 +1,77 @@
+import time
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 1)
+
+
+class PoolMetrics:
+    """
+    Espera para pegar conexão do pool (checkout) e tempo que cada conexão fica emprestada.
+    Espera alta = sessões segurando conexão por muito tempo (ex.: job aberto durante a IA).
+    """
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self._wait_ms = deque(maxlen=5000)
+        self._held_ms = deque(maxlen=5000)
+        self._held_since: dict[int, float] = {}
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        self._wait_ms.append(seconds * 1000)
+        if timed_out:
+            self.timeouts += 1
+
+    def attach(self, engine):
+        """Registra os eventos de checkout/checkin no pool do engine (sync_engine no modo async)."""
+        @event.listens_for(engine, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            self.checkouts += 1
+            self._held_since[id(connection_record)] = time.monotonic()
+
+        @event.listens_for(engine, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            since = self._held_since.pop(id(connection_record), None)
+            if since is not None:
+                self._held_ms.append((time.monotonic() - since) * 1000)
+
+    def stats(self, pool) -> dict:
+        now = time.monotonic()
+        holding = sorted(((now - since) * 1000 for since in self._held_since.values()), reverse=True)
+        return {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "checkout_wait_ms_p50": _percentile(self._wait_ms, 0.5),
+            "checkout_wait_ms_p95": _percentile(self._wait_ms, 0.95),
+            "checkout_wait_ms_max": round(max(self._wait_ms), 1) if self._wait_ms else 0.0,
+            "held_ms_p50": _percentile(self._held_ms, 0.5),
+            "held_ms_p95": _percentile(self._held_ms, 0.95),
+            # Conexões emprestadas agora, da mais antiga para a mais nova
+            "holding_ms": [round(ms, 1) for ms in holding[:10]],
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """Pool padrão do engine async, medindo a espera de cada checkout."""
+    def _do_get(self):
+        started = time.monotonic()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except Exception:
+            timed_out = True
+            raise
+        finally:
+            pool_metrics.record_wait(time.monotonic() - started, timed_out)
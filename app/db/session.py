@@ -1,12 +1,18 @@
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from app.core.config import settings
+from app.db.pool_metrics import InstrumentedAsyncPool, pool_metrics
 
 # 1. Criamos o "Motor" (Engine) Assíncrono
 # echo=True faz o SQL ser logado no terminal (ótimo para debug)
 engine = create_async_engine(
     settings.SQLALCHEMY_DATABASE_URI,
-    echo=True
+    echo=True,
+    poolclass=InstrumentedAsyncPool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW
 )
+# Espera de checkout e tempo de empréstimo das conexões (GET /observability/db-pool)
+pool_metrics.attach(engine.sync_engine)
 
 # 2. Criamos a "Fábrica" de Sessões
 # Cada requisição vai pedir uma sessão nova a esta fábrica.
@@ -1,15 +1,35 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import upload, system, chapter, users, observability, configuration
+from app.routers import upload, upload_session, system, chapter, users, observability, configuration
 from app.db.init_db import init_tables
+from app.services.storage import async_storage
+from app.services.cleanup import cleanup_queue
+from app.services.storage_gc import storage_gc
+from app.services.retention import raw_retention
+from app.services.progress import progress_bus
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Cria tabelas e popula dados iniciais
     await init_tables()
+    # Verifica/cria o bucket aqui (e não no import) para o app subir sem o storage no ar
+    await async_storage.ensure_ready()
+    # Remoção em background dos objetos de capítulos/módulos/sistemas apagados
+    cleanup_queue.start()
+    # Coleta periódica de objetos órfãos (STORAGE_GC_INTERVAL_HOURS)
+    storage_gc.start()
+    # Enfileira a recompressão/descarte dos originais brutos já publicados (RAW_RETENTION_*);
+    # o ffmpeg roda nos workers
+    raw_retention.start()
+    # LISTEN do progresso dos jobs (NOTIFY dos workers) para os streams SSE
+    progress_bus.start()
     yield
     # Shutdown
+    await progress_bus.stop()
+    await raw_retention.stop()
+    await storage_gc.stop()
+    await cleanup_queue.stop()
 
 app = FastAPI(title="FozDocs API", version="1.0.0", lifespan=lifespan)
 
@@ -24,6 +44,7 @@ app.add_middleware(
 
 # app.include_router(auth.router, prefix="/api/v1", tags=["auth"]) # Auth not implemented as router yet
 app.include_router(upload.router, prefix="/api/v1", tags=["upload"])
+app.include_router(upload_session.router, prefix="/api/v1", tags=["upload"])
 app.include_router(system.router, prefix="/api/v1", tags=["systems"])
 app.include_router(chapter.router, prefix="/api/v1", tags=["chapters"])
 app.include_router(users.router, prefix="/api/v1", tags=["users"])
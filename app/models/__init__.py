@@ -8,3 +8,9 @@ from .observability import ProcessingJob, AuditLog, Feedback
 from .user import User, UserRole
 from .configuration import Configuration
 from .favorites import Favorite
+from .upload_session import UploadSession
+from .video_hash import VideoHash
+from .job import Job
+from .idempotency import IdempotencyKey
+from .rate_limit import RateLimitBucket
+from .pending_deletion import PendingDeletion
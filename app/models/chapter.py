@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import String, ForeignKey, Integer, Text, DateTime
+from sqlalchemy import String, ForeignKey, Integer, BigInteger, Text, DateTime, JSON
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.db.base import Base
 
@@ -20,10 +20,24 @@ class Chapter(Base):
     # URL do vídeo no MinIO (Bucket 'raw-videos')
     video_url: Mapped[str] = mapped_column(String(500))
     stitched_video_url: Mapped[str | None] = mapped_column(String(500), nullable=True)
+
+    # Original bruto (o publish troca video_url pelo vídeo com intro/outro).
+    # Depois da retenção vira a cópia de arquivo (recomprimida) ou None (descartado).
+    raw_video_url: Mapped[str | None] = mapped_column(String(500), nullable=True)
+    raw_archived_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    raw_bytes_saved: Mapped[int] = mapped_column(BigInteger, default=0)
     
+    # Objetivo passado à IA no upload: o reprocessamento usa o mesmo (o título pode ser editado
+    # depois) para o prompt bater com o checkpoint da análise
+    user_goal: Mapped[str | None] = mapped_column(Text, nullable=True)
+
     # Texto gerado pela IA (e editado pelo humano)
     text_content: Mapped[str | None] = mapped_column(Text, nullable=True)
     
+    # Checkpoints do processamento (app/services/checkpoints.py): artefato de cada estágio
+    # com o hash das entradas. O reprocessamento pula os estágios que não mudaram.
+    checkpoints: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    
     # Metadata para Filtros
     audience: Mapped[str | None] = mapped_column(String(200), nullable=True) # Ex: "Analistas, Gerentes"
     functionality: Mapped[str | None] = mapped_column(String(100), nullable=True) # Ex: "Cadastro de Usuário"
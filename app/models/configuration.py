@@ -14,7 +14,9 @@ class Configuration(Base):
     # 🎨 Identity / Branding
     primary_color: Mapped[str] = mapped_column(String, default="#0099ff")
     secondary_color: Mapped[str] = mapped_column(String, default="#2b8a3e")
-    logo_url: Mapped[str] = mapped_column(String, nullable=True) # URL ou Base64
+    logo_url: Mapped[str] = mapped_column(String, nullable=True) # Chave da variante padrão no storage (ou URL externa)
+    # Variantes redimensionadas no storage: {"original": chave, "64": chave, "128": chave, "256": chave}
+    logo_variants: Mapped[dict | None] = mapped_column(JSON, nullable=True)
     
     # 🎥 Recorder / Extension Configs
     blur_intensity: Mapped[int] = mapped_column(Integer, default=6) # 0-20px
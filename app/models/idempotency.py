@@ -0,0 +1,22 @@
+from datetime import datetime
+from sqlalchemy import String, Integer, DateTime, JSON
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.base import Base
+
+class IdempotencyKey(Base):
+    """
+    Resposta de um request com header Idempotency-Key (upload, reprocess, publish).
+    Repetir o request com a mesma chave devolve a resposta gravada em vez de agendar outro job.
+    Linha sem resposta = request original ainda em andamento, até locked_until: depois disso
+    o original é dado como perdido (processo caiu) e uma repetição assume a chave.
+    """
+    __tablename__ = "idempotency_keys"
+
+    key: Mapped[str] = mapped_column(String(200), primary_key=True)
+    # "POST /api/v1/chapters/12/publish": a mesma chave não vale para outro endpoint
+    scope: Mapped[str] = mapped_column(String(300))
+    status_code: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    response: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    locked_until: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
@@ -0,0 +1,74 @@
+from datetime import datetime
+from sqlalchemy import String, Integer, Float, DateTime, JSON, Text, Index, text
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.base import Base
+
+# Faixas de prioridade (menor = mais urgente). Um job de faixa melhor sempre sai antes;
+# dentro da faixa, a vez é dividida entre os sistemas (fair share por System.id).
+PRIORITY_INTERACTIVE = 0   # usuário esperando na tela (publish, regenerar áudio)
+PRIORITY_UPLOAD = 1        # manual novo
+PRIORITY_REPROCESS = 2     # reprocessamento (inclusive em massa)
+PRIORITY_MAINTENANCE = 3   # retenção, migrações, tarefas de fundo
+
+LANES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_UPLOAD: "upload",
+    PRIORITY_REPROCESS: "reprocess",
+    PRIORITY_MAINTENANCE: "maintenance",
+}
+
+# Job ativo (na fila ou rodando, sem cancelamento pedido)
+ACTIVE_JOB_PREDICATE = "status IN ('QUEUED', 'RUNNING') AND cancel_requested_at IS NULL AND chapter_id IS NOT NULL"
+
+class Job(Base):
+    """
+    Fila de jobs persistente (Postgres). Os workers (app/run_worker.py) pegam jobs
+    com SELECT ... FOR UPDATE SKIP LOCKED e renovam o lease (locked_until) por heartbeat.
+    Job RUNNING com lease vencido (worker morreu) volta a ser elegível.
+    """
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_claim", "status", "run_after"),
+        Index("ix_jobs_lane", "status", "priority", "system_id"),
+        Index("ix_jobs_started", "started_at"),
+        # Um job ativo por capítulo e tipo: um segundo trigger se junta ao que já existe
+        Index(
+            "ux_jobs_active_chapter", "chapter_id", "kind",
+            unique=True,
+            postgresql_where=text(ACTIVE_JOB_PREDICATE)
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+
+    # Tipo do job (handler registrado em app/services/jobs.py): process_video, stitch_publish
+    kind: Mapped[str] = mapped_column(String(50))
+    chapter_id: Mapped[int | None] = mapped_column(Integer, nullable=True, index=True)
+    payload: Mapped[dict] = mapped_column(JSON, default=dict)
+
+    # Faixa (PRIORITY_*) e sistema do capítulo (chave do fair share entre sistemas)
+    priority: Mapped[int] = mapped_column(Integer, default=PRIORITY_UPLOAD)
+    system_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+    # QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED
+    status: Mapped[str] = mapped_column(String(20), default="QUEUED")
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    # Voltas para a fila por limite de taxa do provedor (não contam como tentativa)
+    deferrals: Mapped[int] = mapped_column(Integer, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, default=3)
+    # Só pode ser pego a partir deste momento (backoff entre tentativas)
+    run_after: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    # Lease do worker que está rodando o job
+    locked_by: Mapped[str | None] = mapped_column(String(200), nullable=True)
+    locked_until: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # Cancelamento pedido (POST /chapters/{id}/cancel): o worker interrompe o job e não grava resultado
+    cancel_requested_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    started_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # Espera na fila (run_after -> claim) da última tentativa, para as métricas por faixa
+    wait_seconds: Mapped[float | None] = mapped_column(Float, nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
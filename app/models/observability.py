@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, Text, Integer, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import String, Text, Integer, BigInteger, Float, DateTime, ForeignKey, Boolean, JSON
 from sqlalchemy.sql import func
 from app.db.base import Base
 from datetime import datetime
@@ -15,9 +15,20 @@ class ProcessingJob(Base):
     tokens_output: Mapped[int] = mapped_column(Integer, default=0)
     cost_usd: Mapped[float] = mapped_column(Float, default=0.0)
     error_log: Mapped[str] = mapped_column(Text, nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
     finished_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
 
+    # Uma linha por execução de process_video (app/services/job_metrics.py)
+    chapter_id: Mapped[int | None] = mapped_column(Integer, nullable=True, index=True)
+    job_id: Mapped[int | None] = mapped_column(Integer, nullable=True) # Job da fila (jobs.id)
+    # Tempo de parede por estágio em ms: download, ffmpeg, gemini_upload, gemini_wait, generate, tts, save
+    stage_ms: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    # Processos filhos (ffmpeg): CPU somada e maior RSS
+    child_cpu_seconds: Mapped[float] = mapped_column(Float, default=0.0)
+    child_max_rss_kb: Mapped[int] = mapped_column(Integer, default=0)
+    input_bytes: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    proxy_bytes: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
 
@@ -0,0 +1,15 @@
+from datetime import datetime
+from sqlalchemy import String, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.base import Base
+
+class PendingDeletion(Base):
+    """
+    Objeto do storage a remover depois de um delete no banco (app/services/cleanup.py).
+    Gravado na mesma transação do delete: se a API reiniciar antes da remoção, a fila continua.
+    """
+    __tablename__ = "pending_deletions"
+
+    # Nome do objeto no bucket (normalize_key)
+    object_key: Mapped[str] = mapped_column(String(500), primary_key=True)
+    enqueued_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
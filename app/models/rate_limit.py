@@ -0,0 +1,18 @@
+from datetime import datetime
+from sqlalchemy import String, Integer, Float, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.base import Base
+
+class RateLimitBucket(Base):
+    """
+    Token bucket compartilhado entre os workers (app/services/rate_limit.py).
+    Cada chamada ao provedor consome um token; os tokens voltam à taxa configurada.
+    blocked_until: o provedor mandou esperar (429 com retry-after), vale para todos.
+    """
+    __tablename__ = "rate_limits"
+
+    name: Mapped[str] = mapped_column(String(100), primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float)
+    updated_at: Mapped[datetime] = mapped_column(DateTime)
+    blocked_until: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    throttled: Mapped[int] = mapped_column(Integer, default=0)
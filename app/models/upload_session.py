@@ -0,0 +1,37 @@
+from datetime import datetime
+from sqlalchemy import String, Integer, BigInteger, DateTime, JSON
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.base import Base
+
+class UploadSession(Base):
+    """
+    Sessão de upload retomável (gravação enviada em pedaços).
+    Cada pedaço vira uma parte do multipart upload do MinIO.
+    """
+    __tablename__ = "upload_sessions"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True) # uuid4
+
+    # Destino no MinIO (sem o bucket) e ID do multipart upload
+    object_key: Mapped[str] = mapped_column(String(500))
+    upload_id: Mapped[str | None] = mapped_column(String(500), nullable=True)
+
+    # Dados para criar o Guia/Capítulo no finalize
+    module_id: Mapped[int] = mapped_column(Integer)
+    title: Mapped[str] = mapped_column(String(200))
+    content_type: Mapped[str] = mapped_column(String(100), default="video/webm")
+
+    # Todos os pedaços têm chunk_size bytes, exceto o último
+    chunk_size: Mapped[int] = mapped_column(Integer)
+    committed_offset: Mapped[int] = mapped_column(BigInteger, default=0)
+    # Tamanho declarado pelo cliente (upload direto/presigned): conferido no /upload/complete
+    expected_size: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    # Lista de partes confirmadas: [{"part_number": 1, "etag": "...", "size": 123}]
+    parts: Mapped[list] = mapped_column(JSON, default=list)
+
+    # OPEN, COMPLETING (/upload/complete falando com o MinIO), COMPLETED, ABORTED
+    status: Mapped[str] = mapped_column(String(20), default="OPEN")
+    chapter_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
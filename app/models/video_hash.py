@@ -0,0 +1,17 @@
+from datetime import datetime
+from sqlalchemy import String, BigInteger, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.base import Base
+
+class VideoHash(Base):
+    """
+    Índice conteúdo -> objeto: SHA-256 do vídeo enviado e onde ele está no MinIO.
+    Permite reaproveitar o arquivo (e a análise da IA) quando o mesmo vídeo é reenviado.
+    """
+    __tablename__ = "video_hashes"
+
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # Mesmo formato do Chapter.video_url ("bucket/arquivo")
+    video_url: Mapped[str] = mapped_column(String(500), index=True)
+    size: Mapped[int] = mapped_column(BigInteger)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -1,39 +1,83 @@
+import asyncio
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Body, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Body, Header, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
-from app.db.session import get_db
+from app.db.session import AsyncSessionLocal, get_db
 from app.models import Chapter, Collection, Module, System
 from pydantic import BaseModel
 from app.core.config import settings
+from app.models.job import PRIORITY_INTERACTIVE, PRIORITY_REPROCESS
+from app.services.idempotency import idempotent
+from app.services.jobs import active_job, enqueue, request_cancel, PROCESS_VIDEO, REGENERATE_AUDIO, STITCH_PUBLISH
+from app.services import progress
+from app.services.progress import progress_bus
 
 router = APIRouter()
 
 @router.post("/chapters/{chapter_id}/reprocess")
 async def reprocess_chapter(
     chapter_id: int,
-    background_tasks: BackgroundTasks,
+    request: Request,
+    force: bool = False,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Retriggers the AI analysis for an existing video.
     Useful if the previous attempt failed due to API errors.
+    Stages whose inputs did not change (1 FPS proxy, analysis, step audio) are reused
+    from the chapter checkpoints; force=true discards them and runs everything again.
+    If the chapter is already being processed, the request attaches to that job without
+    touching the chapter; force=true is then rejected (409), since it would wipe the
+    checkpoints of the running job.
     """
-    chapter = await db.get(Chapter, chapter_id)
-    if not chapter:
-        raise HTTPException(status_code=404, detail="Chapter not found")
-    
-    # Reset status
-    chapter.status = "PENDING"
-    # Optional: Clear previous error content if you want
-    await db.commit()
-    
-    # Trigger Worker
-    from app.services.worker import process_video_job
-    background_tasks.add_task(process_video_job, chapter.id, "Criar um manual passo a passo detalhado.")
-    print(f"DEBUG: Reprocess triggering for {chapter_id}")
-    return {"message": "Reprocessing started", "status": "PENDING"}
+    async def run():
+        # Lock no capítulo: o reset abaixo não corre com outro reprocess do mesmo capítulo
+        chapter = await db.scalar(select(Chapter).where(Chapter.id == chapter_id).with_for_update())
+        if not chapter:
+            raise HTTPException(status_code=404, detail="Chapter not found")
+
+        # Job já rodando: status e checkpoints são dele (still_current guarda as gravações)
+        running = await active_job(db, PROCESS_VIDEO, chapter_id)
+        if running:
+            if force:
+                raise HTTPException(status_code=409, detail="Chapter is being processed; cancel it before forcing a reprocess")
+            await db.commit()
+            return {
+                "message": "Reprocessing already in progress",
+                "status": chapter.status,
+                "job_id": running.id,
+                "attached": True
+            }
+
+        # Reset status
+        chapter.status = "PENDING"
+        # Optional: Clear previous error content if you want
+        if force:
+            chapter.checkpoints = None # Artefatos antigos viram órfãos e saem no GC
+
+        # Trigger Worker (status + job no mesmo commit)
+        job, created = await enqueue(
+            db,
+            PROCESS_VIDEO,
+            # Mesmo objetivo do upload (gravado no capítulo): com o prompt igual, a análise vem do checkpoint
+            {"chapter_id": chapter.id, "user_goal": chapter.user_goal or "Criar um manual passo a passo detalhado."},
+            chapter_id=chapter.id,
+            priority=PRIORITY_REPROCESS
+        )
+        if created:
+            await progress.report("queued", chapter_id=chapter_id, status="PENDING")
+        return {
+            "message": "Reprocessing started" if created else "Reprocessing already in progress",
+            "status": "PENDING",
+            "job_id": job.id,
+            "attached": not created
+        }
+
+    return await idempotent(request, idempotency_key, db, run)
 
 @router.post("/chapters/{chapter_id}/cancel")
 async def cancel_chapter(
@@ -41,88 +85,70 @@ async def cancel_chapter(
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Cancels the AI processing by forcing status to FAILED (or DRAFT).
-    Does not stop the actual thread if running, but updates DB so UI stops polling.
+    Cancels the processing: queued jobs leave the queue and running jobs are stopped
+    by the worker (ffmpeg killed, Gemini upload deleted). The chapter goes to FAILED in the
+    same commit, so a job that is finishing can no longer write its result.
     """
     chapter = await db.get(Chapter, chapter_id)
     if not chapter:
         raise HTTPException(status_code=404, detail="Chapter not found")
     
+    jobs_cancelled = await request_cancel(db, chapter_id)
     chapter.status = "FAILED"
     # Optional: Update content to explain cancel
     import json
     chapter.text_content = json.dumps({"error": "Cancelled by user"})
+    await progress.notify(db, chapter_id, "cancelled", status="FAILED")
     
     await db.commit()
-    return {"message": "Processing cancelled", "status": "FAILED"}
+    return {"message": "Processing cancelled", "status": "FAILED", "jobs_cancelled": jobs_cancelled}
 
-from app.services.video_processor import video_processor
 from app.models.configuration import Configuration
 
-async def background_stitch_and_publish(chapter_id: int, db_session_factory):
-    # Create a new session for the background task
-    async with db_session_factory() as db:
-        chapter = await db.get(Chapter, chapter_id)
-        if not chapter: return
-        
-        # Get Config
-        config = await db.scalar(select(Configuration).limit(1))
-        intro = config.intro_video_url if config else None
-        outro = config.outro_video_url if config else None
-        
-        try:
-            # Stitch
-            if intro or outro:
-                print(f"Stitching chapter {chapter_id} with intro={intro}, outro={outro}")
-                final_url = await video_processor.stitch_videos(chapter.video_url, intro, outro)
-                chapter.stitched_video_url = final_url
-                chapter.video_url = final_url # Update main URL to pointed to stitched? Or keep raw?
-                # User asked: "inserido no vídeo automaticamente". 
-                # Let's update `video_url` to be the stitched one so the player plays the final version.
-                # But keep `stitched_video_url` just in case we want to revert/debug.
-            
-            chapter.status = "COMPLETED"
-            await db.commit()
-            print(f"Chapter {chapter_id} published successfully.")
-            
-        except Exception as e:
-            print(f"Stitching failed: {e}")
-            chapter.status = "FAILED" # Or revert to draft?
-            await db.commit()
-
 @router.post("/chapters/{chapter_id}/publish")
 async def publish_chapter(
     chapter_id: int,
-    background_tasks: BackgroundTasks,
+    request: Request,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Marks a chapter as PUBLISHED.
     Triggers automatic stitching if Intro/Outro are configured.
+    A publish already stitching for this chapter is reused instead of starting another one.
     """
-    chapter = await db.get(Chapter, chapter_id)
-    if not chapter:
-        raise HTTPException(status_code=404, detail="Chapter not found")
-    
-    # Check if stitching is needed
-    config = await db.scalar(select(Configuration).limit(1))
-    has_assets = config and (config.intro_video_url or config.outro_video_url)
-    
-    if has_assets:
-        chapter.status = "PROCESSING" # Use PROCESSING to show spinner in UI
-        await db.commit()
+    async def run():
+        chapter = await db.get(Chapter, chapter_id)
+        if not chapter:
+            raise HTTPException(status_code=404, detail="Chapter not found")
         
-        # We need to pass a session factory or handle session inside background task
-        # app.db.session.AsyncSessionLocal is what we need
-        from app.db.session import AsyncSessionLocal
-        background_tasks.add_task(background_stitch_and_publish, chapter_id, AsyncSessionLocal)
+        # Check if stitching is needed
+        config = await db.scalar(select(Configuration).limit(1))
+        has_assets = config and (config.intro_video_url or config.outro_video_url)
         
-        return {"message": "Publishing process started (Stitching)", "status": "PROCESSING"}
-    else:
-        # Instant publish if no intro/outro
-        chapter.status = "COMPLETED"
-        await db.commit()
-        return {"message": "Chapter published", "status": "COMPLETED"}
+        if has_assets:
+            chapter.status = "PROCESSING" # Use PROCESSING to show spinner in UI
+            # Stitching (ffmpeg) roda num worker, fora do processo da API
+            # Faixa interativa: o usuário está olhando o spinner do publish
+            job, created = await enqueue(
+                db, STITCH_PUBLISH, {"chapter_id": chapter_id}, chapter_id=chapter_id, priority=PRIORITY_INTERACTIVE
+            )
+            if created:
+                await progress.report("queued", chapter_id=chapter_id, status="PROCESSING")
+            
+            return {
+                "message": "Publishing process started (Stitching)",
+                "status": "PROCESSING",
+                "job_id": job.id,
+                "attached": not created
+            }
+        else:
+            # Instant publish if no intro/outro
+            chapter.status = "COMPLETED"
+            await db.commit()
+            return {"message": "Chapter published", "status": "COMPLETED"}
+
+    return await idempotent(request, idempotency_key, db, run)
 
 class ChapterResponse(BaseModel):
     id: int
@@ -144,7 +170,8 @@ class ChapterResponse(BaseModel):
     class Config:
         from_attributes = True
 
-from app.services.storage import storage
+from app.services.storage import async_storage
+from app.services.cleanup import chapter_object_keys, cleanup_queue
 
 from app.models import Chapter, Collection, Module, System, Favorite
 from pydantic import BaseModel
@@ -258,7 +285,7 @@ async def list_chapters(
         if chap.status == "COMPLETED" and chap.stitched_video_url:
              final_url = chap.stitched_video_url
              
-        full_video_url = storage.get_presigned_url(final_url)
+        full_video_url = await async_storage.get_presigned_url(final_url)
         
         response.append(ChapterResponse(
             id=chap.id,
@@ -283,8 +310,11 @@ async def delete_chapter(chapter_id: int, db: AsyncSession = Depends(get_db)):
     
     if not chapter:
         raise HTTPException(status_code=404, detail="Chapter not found")
-        
+
+    # Vídeos e áudios saem do storage em background (a fila é gravada no mesmo commit)
+    keys = chapter_object_keys(chapter)
     await db.delete(chapter)
+    await cleanup_queue.enqueue(db, keys)
     await db.commit()
     return {"ok": True}
 
@@ -315,6 +345,66 @@ async def update_chapter(chapter_id: int, payload: ChapterUpdate, db: AsyncSessi
     await db.commit()
     return {"ok": True}
 
+# Limite de capítulos observados por stream (a query string vira um IN no snapshot)
+PROGRESS_MAX_CHAPTERS = 200
+
+def _sse(event: dict) -> str:
+    import json
+    return f"event: progress\ndata: {json.dumps(event)}\n\n"
+
+@router.get("/chapters/progress")
+async def chapter_progress(request: Request, ids: str):
+    """
+    Server-Sent Events com o progresso do processamento: ?ids=1,2,3 observa vários
+    capítulos no mesmo stream (um por dashboard). Cada evento traz chapter_id, stage
+    (queued, download, proxy, gemini_upload, gemini_wait, generate, tts, save, done,
+    failed, cancelled) e percent. O primeiro lote é o estado atual de cada capítulo.
+    Substitui o polling de GET /chapters/{id} enquanto o capítulo está PENDING.
+    """
+    try:
+        chapter_ids = {int(part) for part in ids.split(",") if part.strip()}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of chapter IDs")
+    if not chapter_ids or len(chapter_ids) > PROGRESS_MAX_CHAPTERS:
+        raise HTTPException(status_code=400, detail=f"Watch between 1 and {PROGRESS_MAX_CHAPTERS} chapters per stream")
+
+    # Sessão curta (não get_db): a dependência ficaria com a conexão enquanto o stream estiver aberto
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(Chapter.id, Chapter.status).where(Chapter.id.in_(chapter_ids)))).all()
+
+    queue = progress_bus.subscribe(chapter_ids)
+    snapshot = []
+    for chapter_id, status in rows:
+        last = progress_bus.last(chapter_id)
+        # Evento em memória só vale enquanto o capítulo está em processamento
+        if last and status in ("PENDING", "PROCESSING"):
+            snapshot.append(last)
+        else:
+            snapshot.append(progress.status_event(chapter_id, status))
+
+    async def events():
+        try:
+            for event in snapshot:
+                yield _sse(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.PROGRESS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comentário SSE: mantém proxies e o navegador com a conexão aberta
+                    yield ": ping\n\n"
+                    continue
+                yield _sse(event)
+        finally:
+            progress_bus.unsubscribe(queue, chapter_ids)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/chapters/{chapter_id}", response_model=ChapterResponse)
 async def get_chapter(chapter_id: int, db: AsyncSession = Depends(get_db)):
     """
@@ -343,7 +433,7 @@ async def get_chapter(chapter_id: int, db: AsyncSession = Depends(get_db)):
             sys_name = chapter.collection.module.system.name
 
     # Presigned URL
-    full_video_url = storage.get_presigned_url(chapter.video_url)
+    full_video_url = await async_storage.get_presigned_url(chapter.video_url)
 
     # Content Parsing (text_content armazena JSON na nossa impl)
     content_parsed = None
@@ -376,55 +466,143 @@ async def get_chapter(chapter_id: int, db: AsyncSession = Depends(get_db)):
         content=content_parsed
     )
 
-from fastapi.responses import StreamingResponse
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from email.utils import format_datetime
+import mimetypes
 
-@router.get("/stream")
-async def stream_file(path: str):
+def _parse_range(range_header: str, size: int) -> tuple[int, int] | None | bool:
+    """
+    Interpreta um header Range de intervalo único (bytes=a-b, bytes=a-, bytes=-n).
+    Retorna (inicio, fim) inclusivo; None se não dá para atender (416);
+    False se o header deve ser ignorado (sintaxe inválida ou múltiplos intervalos -> 200).
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return False
+    start_s, _, end_s = spec.strip().partition("-")
+    try:
+        if start_s == "":
+            # Sufixo: últimos N bytes
+            suffix = int(end_s)
+            if suffix <= 0:
+                return None
+            return max(size - suffix, 0), size - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+    except ValueError:
+        return False
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+@router.api_route("/stream", methods=["GET", "HEAD"])
+async def stream_file(path: str, request: Request):
     """
     Proxy para streamar arquivos do MinIO diretamente pela API.
     Evita problemas de CORS e Hostname (Docker vs Localhost).
+    Suporta Range (206) para o player poder buscar (seek) sem baixar do byte zero,
+    e ETag/If-None-Match (304) para o navegador reaproveitar o que já tem.
     """
+    # Se path vier com bucket (ex: "documentacao/audio/xyz.mp3"), removemos o bucket
+    filename = async_storage.object_name(path)
     try:
-        # Pega o arquivo do MinIO (stream)
-        # Se path vier com bucket (ex: "bucket/file.mp3"), removemos o bucket
-        # pois o storage client já sabe o bucket configured
-        
-        filename = path
-        if "/" in filename:
-            # Remove o nome do bucket se estiver no inicio
-            # Ex: "documentacao/audio/xyz.mp3" -> "audio/xyz.mp3"
-            parts = filename.split("/", 1)
-            if parts[0] == storage.bucket_name:
-                filename = parts[1]
-        
-        # storage.client.get_object retorna um HTTPResponse que é um stream
-        data = storage.client.get_object(storage.bucket_name, filename)
-        
-        return StreamingResponse(
-            data, 
-            media_type="audio/mpeg"
-        )
+        stat = await async_storage.stat_object(filename)
     except Exception as e:
         print(f"Erro no stream: {e}")
         raise HTTPException(status_code=404, detail="File not found")
 
+    size = stat["size"]
+    etag = f'"{stat["etag"]}"'
+    media_type = stat["content_type"]
+    if not media_type or media_type == "application/octet-stream":
+        media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    headers = {"Accept-Ranges": "bytes", "ETag": etag}
+    # Cache-Control gravado junto com o objeto (ex: variantes do logo, imutáveis)
+    cache_control = next(
+        (v for k, v in (stat.get("metadata") or {}).items() if k.lower() == "cache-control"), None
+    )
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    if stat.get("last_modified"):
+        headers["Last-Modified"] = format_datetime(stat["last_modified"], usegmt=True)
+
+    # 1. Condicional: o navegador já tem esta versão
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        if "*" in tags or etag in tags:
+            return Response(status_code=304, headers=headers)
+
+    # 2. Range (ignorado se If-Range não bater com a versão atual)
+    byte_range = False
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        byte_range = _parse_range(range_header, size)
+        if byte_range is None:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+
+    if byte_range:
+        start, end = byte_range
+        status_code = 206
+        length = end - start + 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    else:
+        status_code = 200
+        start, length = 0, size
+    headers["Content-Length"] = str(length)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+
+    # Leitura em pedaços pelo pool de I/O (não bloqueia o event loop)
+    return StreamingResponse(
+        async_storage.iter_object(
+            filename,
+            chunk_size=settings.STREAM_CHUNK_SIZE,
+            offset=start,
+            length=length
+        ),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers
+    )
+
 class RegenerateRequest(BaseModel):
     step_index: int
     text: str
 
-from app.services.tts import tts_service
 import json
 
+async def _wait_job_event(queue: asyncio.Queue, job_id: int, timeout: float) -> dict | None:
+    """Primeiro evento terminal (done/failed/cancelled) do job no stream, ou None no timeout."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return None
+        try:
+            event = await asyncio.wait_for(queue.get(), timeout=remaining)
+        except asyncio.TimeoutError:
+            return None
+        if event.get("job_id") == job_id and event["stage"] in progress.TERMINAL:
+            return event
+
 @router.post("/chapters/{chapter_id}/regenerate_audio")
 async def regenerate_audio(chapter_id: int, payload: RegenerateRequest, db: AsyncSession = Depends(get_db)):
     """
     Regenera o áudio de um passo específico usando o novo texto.
-    Atualiza o campo `text_content` no banco de dados.
+    O TTS roda num worker (job na faixa interativa) que atualiza o `text_content`; o request
+    espera o job por até AUDIO_REGENERATE_WAIT_SECONDS. Se passar disso responde 202 com o
+    job_id e o resultado chega no stream de progresso (evento done com step_index e audio_url).
     """
-    stmt = select(Chapter).where(Chapter.id == chapter_id)
-    result = await db.execute(stmt)
-    chapter = result.scalar_one_or_none()
-    
+    chapter = await db.get(Chapter, chapter_id)
     if not chapter:
         raise HTTPException(status_code=404, detail="Chapter not found")
         
@@ -435,22 +613,30 @@ async def regenerate_audio(chapter_id: int, payload: RegenerateRequest, db: Asyn
         
     if payload.step_index < 0 or payload.step_index >= len(content.get("steps", [])):
         raise HTTPException(status_code=400, detail="Invalid step index")
-        
-    # Generate new audio
-    audio_path, duration = await tts_service.generate_audio(payload.text)
-    
-    if not audio_path:
-        raise HTTPException(status_code=500, detail="Failed to generate audio")
-        
-    # Update JSON
-    content["steps"][payload.step_index]["description"] = payload.text
-    content["steps"][payload.step_index]["audio_url"] = audio_path
-    content["steps"][payload.step_index]["duration"] = duration
-    
-    # Save to DB
-    chapter.text_content = json.dumps(content, ensure_ascii=False)
-    await db.commit()
-    
+
+    # Inscreve antes de enfileirar: o worker pode terminar antes de o request começar a esperar
+    queue = progress_bus.subscribe({chapter_id})
+    try:
+        job_payload = {"chapter_id": chapter_id, "step_index": payload.step_index, "text": payload.text}
+        job, created = await enqueue(
+            db, REGENERATE_AUDIO, job_payload, chapter_id=chapter_id, priority=PRIORITY_INTERACTIVE
+        )
+        # Um job ativo por capítulo e tipo: clique duplo no mesmo passo se junta ao job,
+        # outro passo espera este terminar
+        if not created and job.payload != job_payload:
+            raise HTTPException(status_code=409, detail="Outro áudio deste capítulo está sendo gerado. Tente de novo em instantes.")
+        event = await _wait_job_event(queue, job.id, settings.AUDIO_REGENERATE_WAIT_SECONDS)
+    finally:
+        progress_bus.unsubscribe(queue, {chapter_id})
+
+    if event is None:
+        return JSONResponse(
+            status_code=202,
+            content={"status": "queued", "job_id": job.id, "step_index": payload.step_index}
+        )
+    if event["stage"] != "done":
+        raise HTTPException(status_code=500, detail=event.get("error") or "Failed to generate audio")
+
     # Return formatted URL (Proxy)
-    proxy_url = f"/api/v1/stream?path={audio_path}"
-    return {"audio_url": proxy_url, "duration": duration}
+    proxy_url = f"/api/v1/stream?path={event['audio_url']}"
+    return {"audio_url": proxy_url, "duration": event["duration"]}
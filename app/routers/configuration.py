@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from pydantic import BaseModel
@@ -6,6 +6,7 @@ from typing import Optional, Dict, Any
 
 from app.db.session import get_db
 from app.models.configuration import Configuration
+from app.services.branding import default_logo_key, logo_urls, proxy_url, store_logo, store_logo_data_uri
 
 router = APIRouter()
 
@@ -23,17 +24,69 @@ class ConfigurationBase(BaseModel):
 
 class ConfigurationResponse(ConfigurationBase):
     id: int
-    
+    # URLs das variantes do logo por tamanho: {"64": url, "128": url, "256": url, "original": url}
+    logo_variants: Dict[str, str] = {}
+
     class Config:
         from_attributes = True
 
 class ConfigurationUpdate(ConfigurationBase):
     pass
 
+# --- Helpers ---
+
+def _is_external(url: str) -> bool:
+    return url.startswith(("http://", "https://")) and "/api/v1/stream?path=" not in url
+
+async def _migrate_inline_logo(config: Configuration) -> bool:
+    """
+    Logos antigos ficavam em base64 dentro da linha (e iam em todo GET /configuration).
+    Converte para variantes no storage. Retorna True se alterou o registro.
+    """
+    if not config.logo_url or not config.logo_url.startswith("data:"):
+        return False
+    variants = await store_logo_data_uri(config.logo_url)
+    if not variants:
+        return False
+    config.logo_variants = variants
+    config.logo_url = default_logo_key(variants)
+    return True
+
+def _to_response(config: Configuration, request: Request) -> ConfigurationResponse:
+    """Monta a resposta só com referências (URLs) do logo, nunca o conteúdo."""
+    base_url = str(request.base_url)
+    variants = logo_urls(config.logo_variants, base_url)
+    logo_url = config.logo_url
+    if logo_url and not _is_external(logo_url) and not logo_url.startswith("data:"):
+        # Chave no storage (variante padrão ou upload antigo sem variantes)
+        logo_url = proxy_url(logo_url, base_url)
+
+    return ConfigurationResponse(
+        id=config.id,
+        primary_color=config.primary_color,
+        secondary_color=config.secondary_color,
+        logo_url=logo_url,
+        logo_variants=variants,
+        blur_intensity=config.blur_intensity,
+        mask_style=config.mask_style,
+        privacy_default_enabled=config.privacy_default_enabled,
+        tooltips=config.tooltips or {},
+        intro_video_url=config.intro_video_url,
+        outro_video_url=config.outro_video_url,
+    )
+
+async def _get_or_create(db: AsyncSession) -> Configuration:
+    result = await db.execute(select(Configuration).where(Configuration.id == 1))
+    config = result.scalars().first()
+    if not config:
+        config = Configuration(id=1)
+        db.add(config)
+    return config
+
 # --- Endpoints ---
 
 @router.get("/configuration", response_model=ConfigurationResponse)
-async def get_configuration(db: AsyncSession = Depends(get_db)):
+async def get_configuration(request: Request, db: AsyncSession = Depends(get_db)):
     """
     Retorna a configuração global. Cria uma padrão se não existir.
     """
@@ -46,47 +99,57 @@ async def get_configuration(db: AsyncSession = Depends(get_db)):
         db.add(config)
         await db.commit()
         await db.refresh(config)
+    elif await _migrate_inline_logo(config):
+        await db.commit()
         
-    return config
+    return _to_response(config, request)
 
 @router.put("/configuration", response_model=ConfigurationResponse)
-async def update_configuration(config_in: ConfigurationUpdate, db: AsyncSession = Depends(get_db)):
+async def update_configuration(config_in: ConfigurationUpdate, request: Request, db: AsyncSession = Depends(get_db)):
     """
     Atualiza a configuração global (ID=1).
     """
-    result = await db.execute(select(Configuration).where(Configuration.id == 1))
-    config = result.scalars().first()
-    
-    if not config:
-        # Create if missing (should be rare if GET called first)
-        config = Configuration(id=1)
-        db.add(config)
+    config = await _get_or_create(db)
     
     # Update fields
     config.primary_color = config_in.primary_color
     config.secondary_color = config_in.secondary_color
-    config.logo_url = config_in.logo_url
     config.blur_intensity = config_in.blur_intensity
     config.mask_style = config_in.mask_style
     config.privacy_default_enabled = config_in.privacy_default_enabled
     config.tooltips = config_in.tooltips
+
+    # Logo: o cliente devolve o que recebeu no GET (URL do proxy) -> mantém as variantes.
+    # Base64 vira variantes no storage; URL externa é guardada como está.
+    logo_in = config_in.logo_url
+    if not logo_in:
+        config.logo_url = None
+        config.logo_variants = None
+    elif logo_in.startswith("data:"):
+        config.logo_url = logo_in
+        if not await _migrate_inline_logo(config):
+            raise HTTPException(status_code=400, detail="Logo em base64 inválido")
+    elif _is_external(logo_in):
+        config.logo_url = logo_in
+        config.logo_variants = None
     
     # Do not update intro/outro urls here, handled by specific upload endpoints
     # or expose them if manual URL entry is allowed? For now, keep separate.
     
     await db.commit()
     await db.refresh(config)
-    return config
+    return _to_response(config, request)
 
 # --- File Uploads ---
 from fastapi import UploadFile, File
-from app.services.storage import storage
+from app.services.storage import async_storage
 import os
 import uuid
 
 @router.post("/configuration/assets/{asset_type}")
 async def upload_asset(
     asset_type: str,
+    request: Request,
     file: UploadFile = File(...),
     db: AsyncSession = Depends(get_db)
 ):
@@ -116,8 +179,14 @@ async def upload_asset(
         tmp_path = tmp.name
         
     import traceback
+    logo_variants = None
     try:
-        await storage.upload_file(tmp_path, filename, content_type=file.content_type)
+        if asset_type == "logo":
+            # Original + variantes redimensionadas, servidas com cache longo
+            logo_variants = await store_logo(tmp_path, ext, file.content_type)
+            filename = default_logo_key(logo_variants)
+        else:
+            await async_storage.upload_file(tmp_path, filename, content_type=file.content_type)
     except Exception as e:
         print(f"UPLOAD ERROR: {e}")
         traceback.print_exc()
@@ -140,10 +209,18 @@ async def upload_asset(
             config.outro_video_url = filename
         elif asset_type == "logo":
             config.logo_url = filename
+            config.logo_variants = logo_variants
             
         await db.commit()
     except Exception as e:
         print(f"DB UPDATE ERROR: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to update configuration: {str(e)}")
     
+    if asset_type == "logo":
+        base_url = str(request.base_url)
+        return {
+            "url": proxy_url(filename, base_url),
+            "type": asset_type,
+            "variants": logo_urls(logo_variants, base_url)
+        }
     return {"url": filename, "type": asset_type}
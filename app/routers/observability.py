@@ -5,7 +5,7 @@ from app.db.session import get_db
 from app.models.observability import AuditLog, ProcessingJob
 from app.models.collection import Collection
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 router = APIRouter()
 
@@ -92,3 +92,234 @@ async def get_dashboard_stats(db: AsyncSession = Depends(get_db)):
         processing_count=processing_count,
         total_views=total_views
     )
+
+@router.get("/processing/stages")
+async def get_processing_stage_stats(hours: int = 24, db: AsyncSession = Depends(get_db)):
+    """
+    p50/p95 do tempo de parede por estágio (download, ffmpeg, gemini_upload, gemini_wait,
+    generate, tts, save) e dos recursos por execução, nas execuções terminadas nas últimas `hours`.
+    """
+    from sqlalchemy import Float, cast, true
+    from app.services.job_metrics import STAGES
+    # processing_jobs usa timestamptz
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    finished = [ProcessingJob.finished_at >= since, ProcessingJob.stage_ms.is_not(None)]
+
+    stage = func.json_each_text(ProcessingJob.stage_ms).table_valued("key", "value").render_derived("stage")
+    ms = cast(stage.c.value, Float)
+    stage_rows = (await db.execute(
+        select(
+            stage.c.key,
+            func.count(),
+            func.percentile_cont(0.5).within_group(ms),
+            func.percentile_cont(0.95).within_group(ms),
+            func.max(ms)
+        )
+        .select_from(ProcessingJob)
+        .join(stage, true())
+        .where(*finished)
+        .group_by(stage.c.key)
+    )).all()
+
+    def percentiles(column):
+        return [func.percentile_cont(0.5).within_group(column), func.percentile_cont(0.95).within_group(column)]
+
+    wall = func.extract("epoch", ProcessingJob.finished_at - ProcessingJob.created_at)
+    resources = {
+        "wall_s": wall,
+        "tokens_input": ProcessingJob.tokens_input,
+        "tokens_output": ProcessingJob.tokens_output,
+        "cost_usd": ProcessingJob.cost_usd,
+        "child_cpu_seconds": ProcessingJob.child_cpu_seconds,
+        "child_max_rss_kb": ProcessingJob.child_max_rss_kb,
+        "input_bytes": ProcessingJob.input_bytes,
+        "proxy_bytes": ProcessingJob.proxy_bytes,
+    }
+    row = (await db.execute(
+        select(func.count(ProcessingJob.id), *[p for column in resources.values() for p in percentiles(column)])
+        .where(*finished)
+    )).one()
+
+    stages = {name: {"runs": 0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0} for name in STAGES}
+    for name, runs, p50, p95, worst in stage_rows:
+        stages[name] = {"runs": runs, "p50_ms": round(p50 or 0, 1), "p95_ms": round(p95 or 0, 1), "max_ms": round(worst or 0, 1)}
+    values = iter(row[1:])
+    return {
+        "window_hours": hours,
+        "runs": row[0],
+        "stages": stages,
+        "per_run": {name: {"p50": round(next(values) or 0, 4), "p95": round(next(values) or 0, 4)} for name in resources},
+    }
+
+@router.get("/storage")
+async def get_storage_stats():
+    """Fila, chamadas em andamento e latência do pool de I/O do MinIO."""
+    from app.services.storage import async_storage
+    return async_storage.stats()
+
+@router.get("/object-cache")
+async def get_object_cache_stats():
+    """Taxa de acerto e bytes economizados pelo cache local de objetos dos workers."""
+    from app.services.object_cache import object_cache
+    return object_cache.stats()
+
+@router.get("/uploads")
+async def get_upload_stats():
+    """Throughput e memória dos uploads recentes (ingestão em streaming)."""
+    from app.services.ingest import ingest_service
+    return ingest_service.summary()
+
+@router.get("/stages")
+async def get_stage_pool_stats():
+    """
+    Vagas, fila e tempos de espera dos pools por estágio (ffmpeg, IA, TTS) deste processo.
+    Os workers (app.run_worker) têm os próprios pools e registram as métricas no log.
+    """
+    from app.services.stages import stage_stats
+    return stage_stats()
+
+@router.get("/progress")
+async def get_progress_stats():
+    """Streams SSE de progresso abertos nesta instância da API e eventos recebidos via LISTEN."""
+    from app.services.progress import progress_bus
+    return progress_bus.stats()
+
+@router.get("/circuit-breakers")
+async def get_circuit_breaker_stats():
+    """
+    Estado dos disjuntores por provedor (Gemini, Edge-TTS, gTTS) deste processo: closed, open
+    ou half_open, falhas seguidas e tempo até a próxima sondagem. Os workers têm os próprios
+    disjuntores e registram cada transição no log.
+    """
+    from app.services.circuit_breaker import breaker_stats
+    return breaker_stats()
+
+@router.get("/rate-limits")
+async def get_rate_limit_stats(db: AsyncSession = Depends(get_db)):
+    """
+    Token buckets compartilhados (tabela rate_limits): tokens, bloqueio por retry-after e 429s
+    de todos os workers, mais esperas e adiamentos vistos por este processo.
+    """
+    from app.models.rate_limit import RateLimitBucket
+    from app.services.rate_limit import gemini_limiter
+    rows = (await db.execute(select(RateLimitBucket))).scalars().all()
+    now = datetime.utcnow()
+    return {
+        "buckets": {
+            row.name: {
+                "tokens": round(row.tokens, 2),
+                "blocked_for_seconds": round(max(0.0, (row.blocked_until - now).total_seconds()), 1) if row.blocked_until else 0.0,
+                "throttled_total": row.throttled,
+            }
+            for row in rows
+        },
+        "local": {gemini_limiter.name: gemini_limiter.stats()},
+    }
+
+@router.get("/db-pool")
+async def get_db_pool_stats():
+    """
+    Pool de conexões do banco deste processo: espera de checkout (p50/p95/máx),
+    tempo que as conexões ficam emprestadas e as que estão emprestadas agora.
+    """
+    from app.db.session import engine
+    from app.db.pool_metrics import pool_metrics
+    return pool_metrics.stats(engine.sync_engine.pool)
+
+@router.get("/cleanup")
+async def get_cleanup_stats():
+    """Fila de remoção de objetos órfãos (após deletes de capítulos, módulos e sistemas)."""
+    from app.services.cleanup import cleanup_queue
+    return await cleanup_queue.stats()
+
+@router.post("/storage-gc")
+async def run_storage_gc(dry_run: bool = True, grace_hours: int | None = None):
+    """
+    Roda o GC de objetos órfãos do storage. Por padrão é dry-run:
+    só relata quantos objetos/bytes seriam recuperados.
+    """
+    from app.services.storage_gc import storage_gc
+    return await storage_gc.collect(dry_run=dry_run, grace_hours=grace_hours)
+
+@router.get("/storage-gc")
+async def get_storage_gc_report():
+    """Relatório da última coleta (manual ou periódica)."""
+    from app.services.storage_gc import storage_gc
+    return storage_gc.last_report or {}
+
+@router.get("/raw-retention")
+async def get_raw_retention_summary():
+    """Bytes economizados pela retenção dos originais brutos (total e por capítulo)."""
+    from app.services.retention import raw_retention
+    return await raw_retention.summary()
+
+@router.post("/raw-retention")
+async def run_raw_retention():
+    """
+    Enfileira agora os jobs de retenção (normalmente a cada RAW_RETENTION_INTERVAL_HOURS).
+    O trabalho roda nos workers, na faixa de manutenção.
+    """
+    from app.services.retention import raw_retention
+    return await raw_retention.run_once()
+
+@router.get("/jobs")
+async def get_job_queue_stats(db: AsyncSession = Depends(get_db)):
+    """Fila de jobs: quantidade por tipo/status e idade do job mais antigo esperando."""
+    from app.models.job import Job
+    rows = (await db.execute(
+        select(Job.kind, Job.status, func.count(Job.id)).group_by(Job.kind, Job.status)
+    )).all()
+    oldest_queued = await db.scalar(select(func.min(Job.created_at)).where(Job.status == "QUEUED"))
+    running = (await db.execute(
+        select(Job.id, Job.kind, Job.chapter_id, Job.locked_by, Job.heartbeat_at, Job.attempts)
+        .where(Job.status == "RUNNING")
+        .order_by(Job.started_at)
+    )).all()
+    return {
+        "counts": [{"kind": k, "status": s, "count": c} for k, s, c in rows],
+        "oldest_queued_seconds": round((datetime.utcnow() - oldest_queued).total_seconds(), 1) if oldest_queued else 0.0,
+        "running": [
+            {"id": r[0], "kind": r[1], "chapter_id": r[2], "worker": r[3], "heartbeat_at": r[4], "attempts": r[5]}
+            for r in running
+        ],
+    }
+
+@router.get("/jobs/lanes")
+async def get_job_lane_stats(hours: int = 24, db: AsyncSession = Depends(get_db)):
+    """
+    Espera na fila por faixa de prioridade (p50/p95 dos jobs iniciados nas últimas `hours`)
+    e fila atual por faixa e sistema, para calibrar JOB_SYSTEM_WEIGHTS e JOB_LANE_AGING_SECONDS.
+    """
+    from app.models.job import Job, LANES
+    since = datetime.utcnow() - timedelta(hours=hours)
+    waits = (await db.execute(
+        select(
+            Job.priority,
+            func.count(Job.id),
+            func.percentile_cont(0.5).within_group(Job.wait_seconds),
+            func.percentile_cont(0.95).within_group(Job.wait_seconds),
+            func.max(Job.wait_seconds)
+        )
+        .where(Job.started_at >= since, Job.wait_seconds.is_not(None))
+        .group_by(Job.priority)
+    )).all()
+    queued = (await db.execute(
+        select(Job.priority, Job.system_id, func.count(Job.id), func.min(Job.run_after))
+        .where(Job.status == "QUEUED")
+        .group_by(Job.priority, Job.system_id)
+    )).all()
+
+    now = datetime.utcnow()
+    lanes = {name: {"started": 0, "wait_p50_s": 0.0, "wait_p95_s": 0.0, "wait_max_s": 0.0, "queued": 0, "queued_by_system": {}}
+             for name in LANES.values()}
+    for priority, count, p50, p95, worst in waits:
+        lane = lanes.setdefault(LANES.get(priority, str(priority)), {"queued": 0, "queued_by_system": {}})
+        lane.update({"started": count, "wait_p50_s": round(p50 or 0, 1), "wait_p95_s": round(p95 or 0, 1), "wait_max_s": round(worst or 0, 1)})
+    for priority, system_id, count, oldest in queued:
+        lane = lanes.setdefault(LANES.get(priority, str(priority)), {"queued": 0, "queued_by_system": {}})
+        lane["queued"] += count
+        lane["queued_by_system"][str(system_id)] = {
+            "count": count,
+            "oldest_seconds": round(max(0.0, (now - oldest).total_seconds()), 1),
+        }
+    return {"window_hours": hours, "lanes": lanes}
@@ -3,7 +3,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from app.db.session import get_db
-from app.models import System, Module
+from app.models import System, Module, Collection
+from app.services.cleanup import collect_object_keys, cleanup_queue
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -107,8 +108,11 @@ async def delete_system(system_id: int, db: AsyncSession = Depends(get_db)):
     system = await db.get(System, system_id)
     if not system:
         raise HTTPException(status_code=404, detail="System not found")
-    
+
+    # Coleta os objetos antes do cascade apagar os capítulos
+    keys = await collect_object_keys(db, Module.system_id == system_id)
     await db.delete(system)
+    await cleanup_queue.enqueue(db, keys)
     await db.commit()
     return {"ok": True}
 
@@ -154,7 +158,9 @@ async def delete_module(module_id: int, db: AsyncSession = Depends(get_db)):
     module = await db.get(Module, module_id)
     if not module:
         raise HTTPException(status_code=404, detail="Module not found")
-    
+
+    keys = await collect_object_keys(db, Collection.module_id == module_id)
     await db.delete(module)
+    await cleanup_queue.enqueue(db, keys)
     await db.commit()
     return {"ok": True}
@@ -1,86 +1,300 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Header, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.session import get_db, AsyncSessionLocal
-from app.services.storage import storage
-from app.services.ai_processor import ai_processor
+from app.db.session import get_db
+from app.services.storage import async_storage
+from app.services.ingest import ingest_service, create_manual, create_manual_for_upload, find_video_by_hash
 from app.models.chapter import Chapter
 from app.models.collection import Collection
+from app.models.upload_session import UploadSession
+from app.core.config import settings
+from pydantic import BaseModel
+import math
 import uuid
-from sqlalchemy import select
-import json
+from sqlalchemy import select, update
+from datetime import datetime, timedelta
 
 router = APIRouter()
 
-from app.services.tts import tts_service
+from app.services.idempotency import idempotent
+from app.services.jobs import enqueue, PROCESS_VIDEO
+from app.services import progress
 
-from app.services.worker import process_video_job
+async def _enqueue_and_respond(db: AsyncSession, collection: Collection, chapter: Chapter, title: str, dedup: bool = False, **extra) -> dict:
+    """
+    Enfileira a IA para capítulos PENDING (roda no worker) e monta a resposta padrão de upload.
+    dedup: o hash do vídeo ainda não foi calculado; o worker calcula e deduplica antes da IA.
+    """
+    if chapter.status == "PENDING":
+        payload = {"chapter_id": chapter.id, "user_goal": title}
+        if dedup:
+            payload["dedup"] = True
+        await enqueue(db, PROCESS_VIDEO, payload, chapter_id=chapter.id)
+        await progress.report("queued", chapter_id=chapter.id, status="PENDING")
+        message = "Upload recebido! Manual criado e processamento iniciado."
+    else:
+        message = "Vídeo já analisado anteriormente. Manual criado reaproveitando a análise."
+
+    return {
+        "status": "success",
+        "chapter_id": chapter.id,
+        "collection_id": collection.id,
+        "video_url": chapter.video_url,
+        "reused_analysis": chapter.status != "PENDING",
+        **extra,
+        "message": message
+    }
 
 @router.post("/upload")
 async def upload_video(
-    background_tasks: BackgroundTasks,
+    request: Request,
     file: UploadFile = File(...),
     title: str = Form(...),
     module_id: int = Form(...),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Recebe um vídeo (.webm, .mp4) e Título, salva no MinIO, cria registro e agenda IA.
     Agora cria um Guia (Collection) novo para cada vídeo (MVP: 1 Video = 1 Manual).
+    Com Idempotency-Key, o reenvio (retry do cliente, clique duplo) devolve o manual já criado.
+
+    O corpo é multipart/form-data (arquivo + título + módulo): o Starlette já o gravou num
+    SpooledTemporaryFile (em disco acima de 1 MB) antes do handler rodar. Daqui em diante
+    vai ao MinIO parte por parte, sem passar inteiro pela RAM. Para não gravar em disco na
+    API, use a sessão retomável (PUT do corpo cru) ou o upload direto (URLs assinadas).
     """
     # 1. Validação Simples
     if not file.filename.endswith((".webm", ".mp4")):
         raise HTTPException(status_code=400, detail="Apenas arquivos .webm ou .mp4 são permitidos.")
 
-    try:
-        # 2. Ler o arquivo (Cuidado com memória em produção! Para MVP ok)
-        file_content = await file.read()
-        
-        # 3. Gerar nome único para não sobrescrever
-        unique_filename = f"{uuid.uuid4()}_{file.filename}"
-        
-        # 4. Salvar no MinIO
-        video_path = storage.save_video(file_content, unique_filename, file.content_type)
-        
-        # 5. Criar registro no Banco
-        
-        # Cria uma nova Collection (Guia) para este manual
-        new_collection = Collection(
-            module_id=module_id,
-            title=title,
-            description=f"Manual gerado automaticamente a partir do vídeo '{title}'"
-        )
-        db.add(new_collection)
-        await db.flush() # Para gerar o ID da collection
-
-        new_chapter = Chapter(
-            collection_id=new_collection.id,
-            title=title, # Capítulo 1 tem o mesmo titulo do Guia
-            video_url=video_path,
-            status="PENDING"
+    async def run():
+        try:
+            # 2. Gerar nome único para não sobrescrever
+            unique_filename = f"{uuid.uuid4()}_{file.filename}"
+            
+            # 3. Enviar ao MinIO em streaming a partir do spool (parte por parte, sem ler o vídeo inteiro na RAM)
+            video_path, ingest_stats = await ingest_service.save_stream(
+                file.file, unique_filename, file.content_type
+            )
+            
+            # 4. Criar registro no Banco (Guia + Capítulo), reaproveitando vídeo duplicado
+            new_collection, new_chapter = await create_manual_for_upload(
+                db, module_id, title, video_path, ingest_stats["sha256"], ingest_stats["bytes"]
+            )
+            
+            # 5. Agendar Processamento IA (se a análise não foi reaproveitada)
+            return await _enqueue_and_respond(db, new_collection, new_chapter, title, ingest=ingest_stats)
+
+        except Exception as e:
+            print(f"Erro no upload: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return await idempotent(request, idempotency_key, db, run)
+
+# --- Upload direto ao MinIO (URLs assinadas) ---
+# O navegador envia os bytes direto ao MinIO; a API só assina as URLs
+# e, no /upload/complete, confere o objeto antes de criar o Capítulo.
+
+class PresignRequest(BaseModel):
+    title: str
+    module_id: int
+    filename: str
+    size: int # bytes; define se o envio é um PUT único ou multipart
+    content_type: str = "video/webm"
+
+class CompletedPart(BaseModel):
+    part_number: int
+    etag: str # Header ETag devolvido pelo MinIO em cada PUT de parte
+
+class CompleteRequest(BaseModel):
+    session_id: str
+    parts: list[CompletedPart] = []
+
+@router.post("/upload/presign")
+async def presign_upload(payload: PresignRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Gera URL(s) assinada(s) para o cliente enviar o vídeo direto ao MinIO.
+    Arquivos maiores que UPLOAD_PART_SIZE usam multipart (uma URL por parte).
+    """
+    if not payload.filename.endswith((".webm", ".mp4")):
+        raise HTTPException(status_code=400, detail="Apenas arquivos .webm ou .mp4 são permitidos.")
+    if payload.size <= 0:
+        raise HTTPException(status_code=400, detail="size deve ser maior que zero")
+    if not async_storage.supports_presigned_upload:
+        raise HTTPException(
+            status_code=501,
+            detail=f"Upload direto não suportado pelo backend '{settings.STORAGE_BACKEND}'. Use POST /upload."
         )
-        
-        db.add(new_chapter)
-        await db.commit()
-        await db.refresh(new_chapter)
-        
-        # 6. Agendar Processamento IA
-        background_tasks.add_task(process_video_job, new_chapter.id, title)
-        
+
+    session_id = str(uuid.uuid4())
+    object_key = f"{session_id}_{payload.filename}"
+    part_size = settings.UPLOAD_PART_SIZE
+    part_count = math.ceil(payload.size / part_size)
+
+    upload_id = None
+    if part_count > 1:
+        upload_id = await async_storage.create_multipart_upload(object_key, payload.content_type)
+
+    session = UploadSession(
+        id=session_id,
+        object_key=object_key,
+        upload_id=upload_id,
+        module_id=payload.module_id,
+        title=payload.title,
+        content_type=payload.content_type,
+        chunk_size=part_size,
+        expected_size=payload.size,
+        parts=[],
+        status="OPEN"
+    )
+    db.add(session)
+    await db.commit()
+
+    if upload_id is None:
         return {
-            "status": "success",
-            "chapter_id": new_chapter.id,
-            "collection_id": new_collection.id,
-            "video_url": new_chapter.video_url,
-            "message": "Upload recebido! Manual criado e processamento iniciado."
+            "session_id": session_id,
+            "method": "PUT",
+            "url": await async_storage.get_presigned_put_url(object_key),
+            "headers": {"Content-Type": payload.content_type}
         }
 
+    return {
+        "session_id": session_id,
+        "method": "PUT",
+        "part_size": part_size,
+        "parts": [
+            {
+                "part_number": n,
+                "url": await async_storage.get_presigned_part_url(object_key, upload_id, n)
+            }
+            for n in range(1, part_count + 1)
+        ]
+    }
+
+async def _locked_session(db: AsyncSession, session_id: str) -> UploadSession:
+    result = await db.execute(
+        select(UploadSession).where(UploadSession.id == session_id).with_for_update()
+    )
+    session = result.scalar_one_or_none()
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+@router.post("/upload/complete")
+async def complete_upload(
+    payload: CompleteRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Callback do cliente após o envio direto. Confere tamanho e content-type
+    do objeto (stat no MinIO) e só então cria o Guia/Capítulo e agenda a IA.
+    A deduplicação por hash fica para o worker (o objeto não é lido aqui).
+    A sessão fica COMPLETING enquanto o MinIO junta as partes: nem o lock da linha
+    nem a conexão do banco ficam presos nessas chamadas.
+    """
+    # 1. Reserva a sessão e faz commit (solta o lock e devolve a conexão ao pool)
+    session = await _locked_session(db, payload.session_id)
+    if session.status == "COMPLETED":
+        return {"status": "success", "chapter_id": session.chapter_id, "message": "Upload já confirmado."}
+    stale = datetime.utcnow() - timedelta(seconds=settings.UPLOAD_COMPLETE_LOCK_SECONDS)
+    if session.status == "COMPLETING" and session.updated_at > stale:
+        raise HTTPException(status_code=409, detail="Confirmação deste upload já em andamento")
+    if session.status not in ("OPEN", "COMPLETING"):
+        raise HTTPException(status_code=409, detail=f"Sessão está {session.status}")
+    if session.upload_id and not payload.parts:
+        raise HTTPException(status_code=400, detail="Informe as partes (part_number + etag)")
+
+    session.status = "COMPLETING"
+    session.updated_at = datetime.utcnow() # Também na retomada de uma confirmação interrompida
+    object_key, upload_id, expected_size = session.object_key, session.upload_id, session.expected_size
+    await db.commit()
+
+    # 2. MinIO, sem lock nem conexão
+    try:
+        if upload_id:
+            try:
+                await async_storage.complete_multipart_upload(
+                    object_key, upload_id, [p.model_dump() for p in payload.parts]
+                )
+            except Exception as e:
+                # Retomada: as partes podem já ter sido juntadas pela confirmação interrompida
+                # (o stat abaixo decide)
+                print(f"Erro ao juntar as partes do upload direto: {e}")
+        stat = await async_storage.stat_object(object_key)
     except Exception as e:
-        print(f"Erro no upload: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        print(f"Erro ao confirmar upload direto: {e}")
+        await _release_completing(db, payload.session_id, "OPEN")
+        raise HTTPException(status_code=400, detail="Objeto não encontrado no storage. Envie o arquivo antes de confirmar.")
 
-# ... imports mantidos ...
+    # Verificação: o objeto precisa bater com o que foi assinado
+    problems = []
+    if expected_size is not None and stat["size"] != expected_size:
+        problems.append(f"tamanho {stat['size']} != {expected_size}")
+    if not (stat["content_type"] or "").startswith("video/"):
+        problems.append(f"content-type inválido ({stat['content_type']})")
+    if problems:
+        await async_storage.remove_object(object_key)
+        await _release_completing(db, payload.session_id, "ABORTED")
+        raise HTTPException(status_code=400, detail="Upload rejeitado: " + "; ".join(problems))
+
+    # 3. Cria o manual com a sessão travada de novo (só se ninguém concluiu no meio tempo)
+    session = await _locked_session(db, payload.session_id)
+    if session.status == "COMPLETED":
+        await db.commit()
+        return {"status": "success", "chapter_id": session.chapter_id, "message": "Upload já confirmado."}
+    if session.status != "COMPLETING":
+        raise HTTPException(status_code=409, detail=f"Sessão está {session.status}")
 
-# Endpoint moved to routers/chapter.py
+    # Sem hash aqui: ler o objeto inteiro prenderia o request pelo tempo do download.
+    # O worker calcula o SHA-256 e deduplica.
+    video_path = f"{async_storage.bucket_name}/{object_key}"
+    session.status = "COMPLETED"
+    session.committed_offset = stat["size"]
+    new_collection, new_chapter = await create_manual(db, session.module_id, session.title, video_path)
+    session.chapter_id = new_chapter.id
+    await db.commit()
+
+    return await _enqueue_and_respond(db, new_collection, new_chapter, session.title, dedup=True)
+
+async def _release_completing(db: AsyncSession, session_id: str, status: str):
+    """Confirmação falhou: OPEN (cliente pode reenviar e confirmar de novo) ou ABORTED."""
+    await db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == session_id, UploadSession.status == "COMPLETING")
+        .values(status=status, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+# --- Deduplicação: checagem prévia por hash ---
+
+class UploadByHashRequest(BaseModel):
+    sha256: str
+    title: str
+    module_id: int
+
+@router.api_route("/upload/hash/{sha256}", methods=["GET", "HEAD"])
+async def check_video_hash(sha256: str, db: AsyncSession = Depends(get_db)):
+    """
+    Checagem barata (HEAD) se o servidor já tem um vídeo com este SHA-256.
+    200 = já existe (use POST /upload/by-hash, sem enviar os bytes); 404 = envie o vídeo.
+    """
+    known = await find_video_by_hash(db, sha256)
+    if not known:
+        raise HTTPException(status_code=404, detail="Vídeo não encontrado")
+    return {"sha256": known.sha256, "size": known.size}
+
+@router.post("/upload/by-hash")
+async def upload_by_hash(
+    payload: UploadByHashRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Cria um manual a partir de um vídeo que o servidor já possui (sem reenviar bytes)."""
+    known = await find_video_by_hash(db, payload.sha256)
+    if not known:
+        raise HTTPException(status_code=404, detail="Vídeo não encontrado. Faça o upload completo.")
 
-# Import necessário para a query provisória
-from sqlalchemy import select
+    new_collection, new_chapter = await create_manual_for_upload(
+        db, payload.module_id, payload.title, known.video_url, known.sha256, known.size
+    )
+    return await _enqueue_and_respond(db, new_collection, new_chapter, payload.title)
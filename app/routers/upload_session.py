@@ -0,0 +1,394 @@
+from fastapi import APIRouter, HTTPException, Depends, Request, WebSocket, WebSocketDisconnect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from pydantic import BaseModel
+from app.db.session import get_db, AsyncSessionLocal
+from app.core.config import settings
+from app.models.upload_session import UploadSession
+from app.services.storage import async_storage
+from app.services.ingest import create_manual, create_manual_for_upload
+from app.services.jobs import enqueue, PROCESS_VIDEO
+from app.services import progress
+import hashlib
+import json
+import uuid
+
+router = APIRouter()
+
+# O S3/MinIO exige partes de no mínimo 5 MiB (exceto a última)
+MIN_CHUNK_SIZE = 5 * 1024 * 1024
+
+# --- Schemas ---
+
+class UploadSessionCreate(BaseModel):
+    title: str
+    module_id: int
+    filename: str = "capture.webm"
+    content_type: str = "video/webm"
+    chunk_size: int | None = None
+
+class UploadSessionResponse(BaseModel):
+    session_id: str
+    status: str
+    chunk_size: int
+    committed_offset: int
+    parts: int
+    chapter_id: int | None = None
+
+class UploadSessionFinalize(BaseModel):
+    total_size: int | None = None # Opcional: confere com o que foi recebido
+
+def _to_response(session: UploadSession) -> UploadSessionResponse:
+    return UploadSessionResponse(
+        session_id=session.id,
+        status=session.status,
+        chunk_size=session.chunk_size,
+        committed_offset=session.committed_offset,
+        parts=len(session.parts or []),
+        chapter_id=session.chapter_id
+    )
+
+async def _get_session(db: AsyncSession, session_id: str, for_update: bool = False) -> UploadSession:
+    stmt = select(UploadSession).where(UploadSession.id == session_id)
+    if for_update:
+        stmt = stmt.with_for_update()
+    session = (await db.execute(stmt)).scalar_one_or_none()
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+async def _open_session(
+    db: AsyncSession,
+    title: str,
+    module_id: int,
+    filename: str,
+    content_type: str,
+    chunk_size: int
+) -> UploadSession:
+    """Inicia o multipart upload no MinIO e grava a sessão OPEN."""
+    session_id = str(uuid.uuid4())
+    object_key = f"{session_id}_{filename}"
+    upload_id = await async_storage.create_multipart_upload(object_key, content_type)
+
+    session = UploadSession(
+        id=session_id,
+        object_key=object_key,
+        upload_id=upload_id,
+        module_id=module_id,
+        title=title,
+        content_type=content_type,
+        chunk_size=chunk_size,
+        committed_offset=0,
+        parts=[],
+        status="OPEN"
+    )
+    db.add(session)
+    await db.commit()
+    return session
+
+async def _record_part(db: AsyncSession, session_id: str, part_number: int, etag: str, size: int) -> UploadSession:
+    """
+    Registra uma parte enviada (com lock na linha) e recalcula o offset confirmado.
+    O status é conferido de novo sob o lock: um pedaço que chega junto com o finalize
+    (ou o abort) não entra numa sessão já fechada.
+    """
+    session = await _get_session(db, session_id, for_update=True)
+    if session.status != "OPEN":
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=f"Sessão está {session.status}")
+    parts = [p for p in (session.parts or []) if p["part_number"] != part_number]
+    parts.append({"part_number": part_number, "etag": etag, "size": size})
+    parts.sort(key=lambda p: p["part_number"])
+    session.parts = parts
+
+    # Offset confirmado = fim da sequência contígua de partes a partir da 1
+    committed = 0
+    for expected, part in enumerate(parts, start=1):
+        if part["part_number"] != expected:
+            break
+        committed += part["size"]
+        if part["size"] < session.chunk_size:
+            break # Pedaço curto = último pedaço
+    session.committed_offset = committed
+
+    await db.commit()
+    return session
+
+async def _complete_session(db: AsyncSession, session: UploadSession, sha256: str | None = None) -> tuple:
+    """
+    Junta as partes no MinIO e cria o manual (com deduplicação se o hash veio do envio).
+    `session` deve estar travada (FOR UPDATE) e com status OPEN.
+    Sem hash, o objeto não é lido aqui (o lock da sessão ficaria preso durante a leitura):
+    o job da IA é enfileirado com dedup e o worker calcula o hash.
+    """
+    parts = session.parts or []
+    video_path = await async_storage.complete_multipart_upload(
+        session.object_key, session.upload_id, parts
+    )
+    size = sum(p["size"] for p in parts)
+
+    session.status = "COMPLETED"
+    if sha256 is None:
+        new_collection, new_chapter = await create_manual(db, session.module_id, session.title, video_path)
+    else:
+        new_collection, new_chapter = await create_manual_for_upload(
+            db, session.module_id, session.title, video_path, sha256, size
+        )
+    session.chapter_id = new_chapter.id
+    await db.commit()
+    return new_collection, new_chapter
+
+def _completion_response(collection, chapter) -> dict:
+    return {
+        "status": "success",
+        "chapter_id": chapter.id,
+        "collection_id": collection.id,
+        "video_url": chapter.video_url,
+        "reused_analysis": chapter.status != "PENDING",
+        "message": "Upload recebido! Manual criado e processamento iniciado."
+    }
+
+# --- Endpoints ---
+
+@router.post("/upload/sessions", response_model=UploadSessionResponse)
+async def create_upload_session(payload: UploadSessionCreate, db: AsyncSession = Depends(get_db)):
+    """
+    Abre uma sessão de upload retomável.
+    O cliente envia o vídeo em pedaços de `chunk_size` bytes (o último pode ser menor).
+    """
+    if not payload.filename.endswith((".webm", ".mp4")):
+        raise HTTPException(status_code=400, detail="Apenas arquivos .webm ou .mp4 são permitidos.")
+
+    chunk_size = payload.chunk_size or settings.UPLOAD_PART_SIZE
+    if chunk_size < MIN_CHUNK_SIZE:
+        raise HTTPException(status_code=400, detail=f"chunk_size mínimo é {MIN_CHUNK_SIZE} bytes")
+
+    session = await _open_session(
+        db, payload.title, payload.module_id, payload.filename, payload.content_type, chunk_size
+    )
+    return _to_response(session)
+
+@router.get("/upload/sessions/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session(session_id: str, db: AsyncSession = Depends(get_db)):
+    """Retorna o offset já confirmado. O cliente retoma o envio a partir dele."""
+    session = await _get_session(db, session_id)
+    return _to_response(session)
+
+@router.put("/upload/sessions/{session_id}/chunks", response_model=UploadSessionResponse)
+async def upload_chunk(
+    session_id: str,
+    offset: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Recebe um pedaço (corpo cru, application/octet-stream) começando em `offset`.
+    Cada pedaço vira a parte (offset / chunk_size + 1) do multipart do MinIO,
+    então reenviar um pedaço já confirmado apenas substitui a mesma parte.
+    """
+    session = await _get_session(db, session_id)
+    if session.status != "OPEN":
+        raise HTTPException(status_code=409, detail=f"Sessão está {session.status}")
+    if offset % session.chunk_size != 0:
+        raise HTTPException(status_code=400, detail="offset deve ser múltiplo de chunk_size")
+    if offset > session.committed_offset:
+        raise HTTPException(
+            status_code=409,
+            detail=f"offset à frente do confirmado ({session.committed_offset}). Retome a partir dele."
+        )
+
+    # Lê o corpo com limite (um pedaço nunca passa de chunk_size)
+    data = bytearray()
+    async for piece in request.stream():
+        data.extend(piece)
+        if len(data) > session.chunk_size:
+            raise HTTPException(status_code=413, detail="Pedaço maior que chunk_size")
+    if not data:
+        raise HTTPException(status_code=400, detail="Pedaço vazio")
+
+    part_number = offset // session.chunk_size + 1
+    object_key, upload_id = session.object_key, session.upload_id
+    # Libera a conexão do banco enquanto o MinIO recebe a parte
+    await db.rollback()
+    etag = await async_storage.upload_part(object_key, upload_id, part_number, bytes(data))
+
+    # Registra a parte com lock na linha. O envio é sequencial (offset só até o confirmado);
+    # o lock cobre o reenvio de um pedaço correndo com o original e o finalize/abort
+    session = await _record_part(db, session_id, part_number, etag, len(data))
+    return _to_response(session)
+
+@router.post("/upload/sessions/{session_id}/finalize")
+async def finalize_upload_session(
+    session_id: str,
+    payload: UploadSessionFinalize | None = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Junta as partes no MinIO, cria o Guia/Capítulo e agenda a IA (igual ao /upload).
+    """
+    session = await _get_session(db, session_id, for_update=True)
+    if session.status == "COMPLETED":
+        return {
+            "status": "success",
+            "chapter_id": session.chapter_id,
+            "message": "Sessão já finalizada."
+        }
+    if session.status != "OPEN":
+        raise HTTPException(status_code=409, detail=f"Sessão está {session.status}")
+
+    parts = session.parts or []
+    if not parts:
+        raise HTTPException(status_code=400, detail="Nenhum pedaço recebido")
+    total = sum(p["size"] for p in parts)
+    if total != session.committed_offset:
+        raise HTTPException(status_code=409, detail="Existem lacunas entre os pedaços enviados")
+    if payload and payload.total_size is not None and payload.total_size != total:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Tamanho recebido ({total}) difere do esperado ({payload.total_size})"
+        )
+
+    try:
+        new_collection, new_chapter = await _complete_session(db, session)
+
+        if new_chapter.status == "PENDING":
+            await enqueue(
+                db, PROCESS_VIDEO, {"chapter_id": new_chapter.id, "user_goal": session.title, "dedup": True}, chapter_id=new_chapter.id
+            )
+            await progress.report("queued", chapter_id=new_chapter.id, status="PENDING")
+
+        return _completion_response(new_collection, new_chapter)
+    except Exception as e:
+        print(f"Erro ao finalizar sessão de upload: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/upload/sessions/{session_id}")
+async def abort_upload_session(session_id: str, db: AsyncSession = Depends(get_db)):
+    """Cancela a sessão e descarta as partes já enviadas ao MinIO."""
+    session = await _get_session(db, session_id, for_update=True)
+    if session.status != "OPEN":
+        raise HTTPException(status_code=409, detail=f"Sessão está {session.status}")
+
+    await async_storage.abort_multipart_upload(session.object_key, session.upload_id)
+    session.status = "ABORTED"
+    await db.commit()
+    return {"ok": True}
+
+# --- Ingestão ao vivo (durante a gravação) ---
+
+@router.websocket("/upload/live")
+async def live_upload(websocket: WebSocket):
+    """
+    Recebe os pedaços do MediaRecorder (timeslice) enquanto o usuário ainda grava,
+    anexando-os a um multipart upload do MinIO.
+
+    Protocolo:
+    1. Cliente envia JSON {"title", "module_id", "filename"?, "content_type"?}
+       (ou {"session_id"} para retomar). Resposta: {"type": "ready", "session_id", "committed_offset"}.
+    2. Cliente envia frames binários, na ordem. A cada chunk_size acumulado uma parte
+       vai para o MinIO e o servidor responde {"type": "ack", "committed_offset"}.
+    3. Cliente envia {"type": "stop"}: o restante vira a última parte, o manual é
+       criado e a IA é agendada na hora. Resposta: {"type": "done", ...}.
+
+    Se a conexão cair, o que veio depois do último ack se perde: o cliente reconecta
+    com session_id e reenvia a partir de committed_offset.
+    """
+    await websocket.accept()
+    try:
+        start = await websocket.receive_json()
+
+        # Sessões curtas de banco: a conexão não fica presa durante a gravação
+        async with AsyncSessionLocal() as db:
+            if start.get("session_id"):
+                session = await _get_session(db, start["session_id"])
+                if session.status != "OPEN":
+                    raise HTTPException(status_code=409, detail=f"Sessão está {session.status}")
+            else:
+                filename = start.get("filename", "capture.webm")
+                if not filename.endswith((".webm", ".mp4")):
+                    raise HTTPException(status_code=400, detail="Apenas arquivos .webm ou .mp4 são permitidos.")
+                session = await _open_session(
+                    db,
+                    start["title"],
+                    int(start["module_id"]),
+                    filename,
+                    start.get("content_type", "video/webm"),
+                    settings.UPLOAD_PART_SIZE
+                )
+
+        session_id, title = session.id, session.title
+        object_key, upload_id = session.object_key, session.upload_id
+        chunk_size, offset = session.chunk_size, session.committed_offset
+        # O hash incremental só vale se o vídeo inteiro passar por esta conexão
+        hasher = hashlib.sha256() if offset == 0 else None
+
+        await websocket.send_json({"type": "ready", "session_id": session_id, "committed_offset": offset})
+
+        async def flush(data: bytes):
+            nonlocal offset
+            part_number = offset // chunk_size + 1
+            etag = await async_storage.upload_part(object_key, upload_id, part_number, data)
+            async with AsyncSessionLocal() as db:
+                await _record_part(db, session_id, part_number, etag, len(data))
+            offset += len(data)
+            await websocket.send_json({"type": "ack", "committed_offset": offset})
+
+        buffer = bytearray()
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                print(f"[Live] Conexão encerrada sem 'stop' (sessão {session_id}, offset {offset})")
+                return
+            if message.get("bytes"):
+                buffer.extend(message["bytes"])
+                if hasher:
+                    hasher.update(message["bytes"])
+                while len(buffer) >= chunk_size:
+                    await flush(bytes(buffer[:chunk_size]))
+                    del buffer[:chunk_size]
+            elif message.get("text") and json.loads(message["text"]).get("type") == "stop":
+                break
+
+        if buffer:
+            await flush(bytes(buffer))
+        if offset == 0:
+            raise HTTPException(status_code=400, detail="Nenhum pedaço recebido")
+
+        async with AsyncSessionLocal() as db:
+            session = await _get_session(db, session_id, for_update=True)
+            # Outro caminho (finalize/abort) pode ter fechado a sessão durante a gravação
+            if session.status == "COMPLETED":
+                await websocket.send_json({
+                    "type": "done",
+                    "status": "success",
+                    "chapter_id": session.chapter_id,
+                    "message": "Sessão já finalizada."
+                })
+                await websocket.close()
+                return
+            if session.status != "OPEN":
+                raise HTTPException(status_code=409, detail=f"Sessão está {session.status}")
+            new_collection, new_chapter = await _complete_session(
+                db, session, sha256=hasher.hexdigest() if hasher else None
+            )
+
+            # Gravação terminou: a IA já pode começar (o upload já está no MinIO)
+            if new_chapter.status == "PENDING":
+                payload = {"chapter_id": new_chapter.id, "user_goal": title}
+                if hasher is None:
+                    payload["dedup"] = True
+                await enqueue(db, PROCESS_VIDEO, payload, chapter_id=new_chapter.id)
+                await progress.report("queued", chapter_id=new_chapter.id, status="PENDING")
+
+        await websocket.send_json({"type": "done", **_completion_response(new_collection, new_chapter)})
+        await websocket.close()
+
+    except WebSocketDisconnect:
+        print("[Live] Cliente desconectou.")
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "detail": e.detail})
+        await websocket.close(code=1008)
+    except Exception as e:
+        print(f"[Live] Erro na ingestão ao vivo: {e}")
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1011)
@@ -0,0 +1,31 @@
+"""
+Processo worker: executa os jobs da fila (tabela jobs) fora da API.
+
+Uso:
+    python -m app.run_worker
+    docker compose up --scale worker=3
+
+Pode rodar em quantos processos/nós forem necessários: cada job é pego por
+um único worker (SELECT ... FOR UPDATE SKIP LOCKED) e, se o worker morrer,
+o lease vence e outro worker retoma o job.
+"""
+import asyncio
+import signal
+from app.core.config import settings
+from app.services.jobs import JobWorker
+import app.services.worker  # noqa: F401 (registra os handlers dos jobs)
+
+
+async def main():
+    worker = JobWorker(concurrency=settings.WORKER_CONCURRENCY)
+
+    # SIGTERM (docker stop) / Ctrl+C: para de pegar jobs e termina os que estão rodando
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    await worker.run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
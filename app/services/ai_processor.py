@@ -1,75 +1,123 @@
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from app.core.config import settings
-from app.services.storage import storage
+from app.services.checkpoints import Checkpoints, input_hash, ANALYSIS, GEMINI_FILE, PROXY
+from app.services.object_cache import object_cache
+from app.services.storage import async_storage
+from app.services.jobs import JobCancelled, JobDeferred, can_defer, check_cancelled, final_attempt
+from app.services.circuit_breaker import gemini_breaker
+from app.services.rate_limit import RateLimited, backoff_seconds, gemini_limiter, retry_after_seconds
+from app.services.stages import ai_pool, run_ffmpeg
+from app.services import job_metrics, progress
+from contextlib import AsyncExitStack
 import os
 import json
 import asyncio
+import shutil
+import tempfile
 import time
 
+# Usando 'gemini-2.0-flash' (Mais rápido e com cotas melhores)
+MODEL_NAME = "gemini-2.0-flash"
+# Proxy enviado ao Gemini: 1 frame por segundo
+PROXY_FFMPEG_ARGS = ["-r", "1"]
+
+def _is_throttled(error: Exception) -> bool:
+    """429 / cota esgotada do Gemini (exceção do SDK ou só a mensagem, conforme o transporte)."""
+    if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        return True
+    message = str(error)
+    return "429" in message or "Quota exceeded" in message or "RESOURCE_EXHAUSTED" in message
+
+def _not_outage(error: Exception) -> bool:
+    """Cota (429) e erros 4xx do próprio request não indicam Gemini fora do ar: não abrem o disjuntor."""
+    return _is_throttled(error) or isinstance(error, google_exceptions.ClientError)
+
+def _requeues(error: Exception) -> bool:
+    """O job volta para a fila com este erro: adiado (cota, disjuntor) ou com tentativa sobrando."""
+    if isinstance(error, JobDeferred):
+        return can_defer()
+    return not final_attempt()
+
 class AIProcessor:
     def __init__(self):
         genai.configure(api_key=settings.GOOGLE_API_KEY)
-        # Usando 'gemini-2.0-flash' (Mais rápido e com cotas melhores)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.model = genai.GenerativeModel(MODEL_NAME)
+
+    async def _upload(self, path: str):
+        """
+        Envia o vídeo ao Gemini. A chamada roda numa thread e não pode ser interrompida:
+        se o job for cancelado no meio, espera o upload terminar e apaga o arquivo no Google.
+        """
+        upload = asyncio.ensure_future(ai_pool.run_blocking(genai.upload_file, path=path))
+        try:
+            return await asyncio.shield(upload)
+        except asyncio.CancelledError:
+            try:
+                orphan = await upload
+                await ai_pool.run_blocking(genai.delete_file, orphan.name)
+                print(f"Upload interrompido: arquivo {orphan.name} apagado no Google")
+            except Exception as e:
+                print(f"Falha ao apagar upload interrompido no Google: {e}")
+            raise
+
+    async def _generate(self, video_file, prompt: str):
+        """
+        Análise no Gemini dentro do limite de taxa compartilhado (gemini_limiter).
+        429/cota: espera o retry-after do Google (e bloqueia o bucket para os outros workers)
+        ou backoff exponencial com jitter. Se a espera passar de GEMINI_MAX_WAIT_SECONDS,
+        levanta RateLimited e o job volta para a fila.
+        """
+        started = time.monotonic()
+        for attempt in range(settings.GEMINI_MAX_RETRIES + 1):
+            remaining = settings.GEMINI_MAX_WAIT_SECONDS - (time.monotonic() - started)
+            await gemini_limiter.acquire(max_wait=max(0.0, remaining))
+            try:
+                with gemini_breaker.guard(ignore=_not_outage), job_metrics.stage("generate"):
+                    return await ai_pool.run_blocking(
+                        self.model.generate_content,
+                        [video_file, prompt],
+                        generation_config={"response_mime_type": "application/json"}
+                    )
+            except Exception as e:
+                if not _is_throttled(e):
+                    raise
+                retry_after = retry_after_seconds(e)
+                if retry_after:
+                    await gemini_limiter.block(retry_after)
+                delay = max(retry_after or 0.0, backoff_seconds(attempt))
+                remaining = settings.GEMINI_MAX_WAIT_SECONDS - (time.monotonic() - started)
+                if attempt == settings.GEMINI_MAX_RETRIES or delay > remaining:
+                    raise RateLimited(f"Gemini sem cota após {attempt + 1} tentativa(s): {e}", delay) from e
+                print(f"⚠️ Gemini limitou a taxa (tentativa {attempt + 1}); nova tentativa em {delay:.1f}s")
+                await asyncio.sleep(delay)
 
-    async def analyze_video(self, video_path_minio: str, system_context: str = "", module_context: str = "", user_goal: str = "") -> dict:
+    async def _delete_remote(self, video_file):
+        try:
+            await ai_pool.run_blocking(genai.delete_file, video_file.name)
+        except Exception as e:
+            print(f"Falha ao apagar {video_file.name} no Google: {e}")
+
+    async def analyze_video(
+        self,
+        video_path_minio: str,
+        system_context: str = "",
+        module_context: str = "",
+        user_goal: str = "",
+        checkpoints: Checkpoints | None = None
+    ) -> dict:
         """
         1. Baixa vídeo do MinIO
         2. Upload pro Google
         3. Analisa com Prompt Contextualizado
         4. Retorna JSON
+        Com checkpoints, cada estágio (proxy 1 FPS, arquivo no Google, análise) é pulado
+        se as entradas não mudaram desde a última execução.
         """
-        temp_file = f"/tmp/{video_path_minio.split('/')[-1]}"
-        
-        try:
-            # 1. Download
-            print(f"Baixando vídeo: {video_path_minio}")
-            try:
-                storage.download_file(video_path_minio, temp_file)
-            except Exception as e:
-                # Se falhar o download, não adianta continuar
-                print(f"Erro no download do MinIO: {e}")
-                raise e
-            
-            # 2. Otimização: Converter para 1 FPS (Reduz tamanho e custo)
-            print("Otimizando vídeo (1 FPS)...")
-            optimized_file = temp_file.replace(".webm", "_opt.mp4").replace(".mp4", "_opt.mp4")
-            
-            import subprocess
-            # ffmpeg -i input -r 1 output
-            # -y (overwrite), -r 1 (1 frame per sec)
-            cmd = [
-                "ffmpeg", "-y", 
-                "-i", temp_file, 
-                "-r", "1", 
-                optimized_file
-            ]
-            
-            process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if process.returncode != 0:
-                print(f"Erro no FFmpeg: {process.stderr.decode()}")
-                # Fallback: Se falhar, usa o arquivo original mesmo
-                final_file_path = temp_file
-            else:
-                print("Vídeo otimizado com sucesso.")
-                final_file_path = optimized_file
-
-            # 3. Upload to Gemini
-            print(f"Enviando para o Google ({final_file_path})...")
-            video_file = genai.upload_file(path=final_file_path)
-            print(f"Upload concluído: {video_file.uri}")
-            
-            # Aguarda processamento do vídeo no lado do Google
-            while video_file.state.name == "PROCESSING":
-                print("Aguardando processamento do vídeo no Google...")
-                await asyncio.sleep(2)
-                video_file = genai.get_file(video_file.name)
-                
-            if video_file.state.name == "FAILED":
-                raise ValueError("Falha no processamento do vídeo pelo Google.")
+        ckpt = checkpoints or Checkpoints(None, {})
 
-            # 3. Engenharia de Prompt com Contexto
-            prompt = f"""
+        # 3. Engenharia de Prompt com Contexto (antes de tudo: entra no hash da análise)
+        prompt = f"""
             Role: Tech Writer Specialist (Senior).
             Context Hierarchy:
             - System Identity: {system_context}
@@ -97,27 +145,102 @@ class AIProcessor:
                 ]
             }}
             """
-            
-            print("Solicitando análise com contexto...")
-            response = self.model.generate_content(
-                [video_file, prompt],
-                generation_config={"response_mime_type": "application/json"}
-            )
+
+        # Entradas dos estágios: o vídeo (chave + etag), os parâmetros do proxy, o modelo e o prompt
+        source = await async_storage.stat_object(video_path_minio)
+        job_metrics.record_sizes(input_bytes=source.get("size"))
+        proxy_hash = input_hash(PROXY, video_path_minio, source.get("etag"), PROXY_FFMPEG_ARGS)
+        analysis_hash = input_hash(ANALYSIS, proxy_hash, MODEL_NAME, prompt)
+
+        cached = ckpt.get(ANALYSIS, analysis_hash)
+        if cached is not None:
+            print("Análise reaproveitada do checkpoint (vídeo e prompt inalterados).")
+            return cached
+
+        # Gemini fora do ar (disjuntor aberto): volta para a fila antes de baixar e converter o vídeo
+        gemini_breaker.check()
+
+        # O original vem do cache local (compartilhado, somente leitura);
+        # o proxy 1 FPS é gerado num diretório temporário só deste job.
+        work_dir = tempfile.mkdtemp(prefix="fozdocs_ai_")
+        resources = AsyncExitStack()
+        video_file = None
+        # Se a análise falhar e o job voltar para a fila, o arquivo no Google fica para a
+        # próxima tentativa não reenviar; falha definitiva apaga (senão ninguém apaga)
+        keep_remote = False
+        
+        try:
+            final_file_path = None
+            proxy = ckpt.get(PROXY, proxy_hash)
+            if proxy:
+                try:
+                    with job_metrics.stage("download"):
+                        final_file_path = await resources.enter_async_context(object_cache.open(proxy["object_key"]))
+                    job_metrics.record_sizes(proxy_bytes=proxy.get("size"))
+                    print("Proxy 1 FPS reaproveitado do checkpoint.")
+                except Exception as e:
+                    print(f"Proxy do checkpoint indisponível ({e}); gerando de novo")
+
+            if final_file_path is None:
+                final_file_path = await self._make_proxy(video_path_minio, proxy_hash, work_dir, resources, ckpt)
+            check_cancelled()
+
+            # 4. Estágio de IA: upload, espera e análise ocupam uma vaga do pool do Gemini
+            # (as chamadas do SDK são bloqueantes e rodam no executor do pool)
+            async with ai_pool.slot():
+                remote = ckpt.get(GEMINI_FILE, proxy_hash)
+                if remote:
+                    video_file = await self._reuse_remote(remote["name"])
+
+                if video_file is None:
+                    print(f"Enviando para o Google ({final_file_path})...")
+                    await progress.report("gemini_upload")
+                    with gemini_breaker.guard(ignore=_not_outage), job_metrics.stage("gemini_upload"):
+                        video_file = await self._upload(final_file_path)
+                    print(f"Upload concluído: {video_file.uri}")
+                    await ckpt.put(GEMINI_FILE, proxy_hash, {"name": video_file.name, "uri": video_file.uri})
+                check_cancelled()
+                
+                # Aguarda processamento do vídeo no lado do Google
+                await progress.report("gemini_wait")
+                with job_metrics.stage("gemini_wait"):
+                    while video_file.state.name == "PROCESSING":
+                        print("Aguardando processamento do vídeo no Google...")
+                        await asyncio.sleep(2)
+                        check_cancelled()
+                        with gemini_breaker.guard(ignore=_not_outage):
+                            video_file = await ai_pool.run_blocking(genai.get_file, video_file.name)
+                    
+                if video_file.state.name == "FAILED":
+                    raise ValueError("Falha no processamento do vídeo pelo Google.")
+
+                print("Solicitando análise com contexto...")
+                await progress.report("generate")
+                response = await self._generate(video_file, prompt)
+                job_metrics.record_usage(getattr(response, "usage_metadata", None))
             
             print("Análise recebida.")
             try:
-                return json.loads(response.text)
+                analysis = json.loads(response.text)
             except json.JSONDecodeError:
                 # Fallback simples se o JSON vier quebrado (markdown block etc)
                 print("JSON Inválido recebido, tentando limpar...")
                 clean_text = response.text.replace("```json", "").replace("```", "")
-                return json.loads(clean_text)
+                analysis = json.loads(clean_text)
+
+            await ckpt.put(ANALYSIS, analysis_hash, analysis)
+            return analysis
 
+        except JobCancelled:
+            raise
         except Exception as e:
             print(f"Erro na IA: {e}")
             error_str = str(e)
-            if "Quota exceeded" in error_str or "429" in error_str or "404" in error_str or "not found" in error_str.lower():
-                print("⚠️ Erro na API do Google (Cota ou Modelo). Ativando MOCK MODE Automático.")
+            throttled = isinstance(e, RateLimited) or _is_throttled(e)
+            model_missing = "404" in error_str or "not found" in error_str.lower()
+            # Manual fictício só se habilitado: em produção, cota esgotada = job volta para a fila
+            if settings.AI_MOCK_FALLBACK and (throttled or model_missing):
+                print("⚠️ Erro na API do Google (Cota ou Modelo). AI_MOCK_FALLBACK ativo: usando manual fictício.")
                 return {
                     "title": "Manual de Teste (Mock AI)",
                     "steps": [
@@ -129,15 +252,67 @@ class AIProcessor:
                         {"timestamp": "00:25", "description": "Clicou em 'Salvar' e o sistema confirmou a operação."}
                     ]
                 }
+            keep_remote = (
+                video_file is not None
+                and video_file.state.name != "FAILED"
+                and _requeues(e)
+            )
             raise e
         finally:
-            # Limpeza
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-            # Remove arquivo otimizado também, se existir
-            opt_file = temp_file.replace(".webm", "_opt.mp4").replace(".mp4", "_opt.mp4")
-            if os.path.exists(opt_file):
-                os.remove(opt_file)
-            # Todo: Deletar arquivo do Google (genai.delete_file(video_file.name))
+            # Limpeza: libera o arquivo do cache e remove o proxy temporário
+            await resources.aclose()
+            shutil.rmtree(work_dir, ignore_errors=True)
+            # O arquivo no Google só serve para esta análise (também quando o job é cancelado)
+            if video_file is not None and not keep_remote:
+                await self._delete_remote(video_file)
+                await ckpt.drop(GEMINI_FILE)
+
+    async def _make_proxy(self, video_path_minio: str, proxy_hash: str, work_dir: str, resources: AsyncExitStack, ckpt: Checkpoints) -> str:
+        """Gera o proxy 1 FPS (reduz tamanho e custo) e guarda no storage para os próximos reprocessamentos."""
+        # 1. Download (read-through: reprocessar o mesmo vídeo não baixa de novo)
+        print(f"Baixando vídeo: {video_path_minio}")
+        await progress.report("download")
+        try:
+            with job_metrics.stage("download"):
+                temp_file = await resources.enter_async_context(object_cache.open(video_path_minio))
+        except Exception as e:
+            # Se falhar o download, não adianta continuar
+            print(f"Erro no download do MinIO: {e}")
+            raise e
+
+        # 2. Otimização: Converter para 1 FPS (Reduz tamanho e custo)
+        print("Otimizando vídeo (1 FPS)...")
+        await progress.report("proxy")
+        optimized_file = os.path.join(work_dir, "proxy_1fps.mp4")
+        # ffmpeg -i input -r 1 output
+        # -y (overwrite), -r 1 (1 frame per sec)
+        cmd = ["ffmpeg", "-y", "-i", temp_file, *PROXY_FFMPEG_ARGS, "-threads", str(settings.FFMPEG_THREADS), optimized_file]
+
+        # Pool de CPU: o ffmpeg de um job não disputa núcleos com o de outro
+        with job_metrics.stage("ffmpeg"):
+            returncode, stderr = await run_ffmpeg(cmd)
+        if returncode != 0:
+            print(f"Erro no FFmpeg: {stderr.decode()}")
+            # Fallback: Se falhar, usa o arquivo original mesmo
+            return temp_file
+
+        print("Vídeo otimizado com sucesso.")
+        proxy_size = os.path.getsize(optimized_file)
+        job_metrics.record_sizes(proxy_bytes=proxy_size)
+        key = await async_storage.upload_file(optimized_file, f"proxies/{proxy_hash[:32]}.mp4", "video/mp4")
+        await ckpt.put(PROXY, proxy_hash, {"object_key": key, "size": proxy_size})
+        return optimized_file
+
+    async def _reuse_remote(self, name: str):
+        """Arquivo já enviado ao Google numa tentativa anterior (expira em ~48h)."""
+        try:
+            video_file = await ai_pool.run_blocking(genai.get_file, name)
+        except Exception as e:
+            print(f"Arquivo {name} não está mais no Google ({e}); reenviando")
+            return None
+        if video_file.state.name == "FAILED":
+            return None
+        print(f"Arquivo no Google reaproveitado do checkpoint: {name}")
+        return video_file
 
 ai_processor = AIProcessor()
@@ -0,0 +1,98 @@
+import base64
+import binascii
+import mimetypes
+import os
+import tempfile
+import uuid
+from urllib.parse import quote
+from app.services.stages import run_ffmpeg
+from app.services.storage import async_storage
+
+# Alturas/larguras máximas (px) das variantes do logo. Os componentes da extensão
+# mostram o logo entre 16 e 40px; 64/128 cobrem telas 2x, 256 fica para o painel.
+LOGO_SIZES = [64, 128, 256]
+DEFAULT_LOGO_SIZE = "128"
+# Cada upload gera chaves novas (uuid), então as variantes nunca mudam de conteúdo
+LOGO_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+async def _resize(src: str, dest: str, size: int) -> bool:
+    """Reduz a imagem para caber em size x size (sem ampliar) e grava PNG comprimido."""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-y",
+        "-i", src,
+        "-vf", f"scale='min(iw,{size})':'min(ih,{size})':force_original_aspect_ratio=decrease",
+        "-frames:v", "1",
+        "-compression_level", "9",
+        dest
+    ]
+    try:
+        returncode, stderr = await run_ffmpeg(cmd)
+    except FileNotFoundError:
+        print("[Branding] ffmpeg não encontrado; logo salvo sem variantes")
+        return False
+    if returncode != 0:
+        print(f"[Branding] Falha ao redimensionar logo ({size}px): {stderr.decode()[-300:]}")
+        return False
+    return True
+
+
+async def store_logo(file_path: str, ext: str, content_type: str | None) -> dict[str, str]:
+    """
+    Salva o logo original e as variantes redimensionadas em assets/logo/<id>/.
+    Retorna {"original": chave, "64": chave, ...}. SVG é vetorial: vai só o original.
+    """
+    ext = ext.lower()
+    content_type = content_type or mimetypes.guess_type(f"logo{ext}")[0] or "application/octet-stream"
+    prefix = f"assets/logo/{uuid.uuid4()}"
+    metadata = {"Cache-Control": LOGO_CACHE_CONTROL}
+
+    variants = {"original": f"{prefix}/original{ext}"}
+    await async_storage.upload_file(file_path, variants["original"], content_type, metadata)
+
+    if ext == ".svg":
+        return variants
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in LOGO_SIZES:
+            out = os.path.join(temp_dir, f"{size}.png")
+            if not await _resize(file_path, out, size):
+                break
+            key = f"{prefix}/{size}.png"
+            await async_storage.upload_file(out, key, "image/png", metadata)
+            variants[str(size)] = key
+    return variants
+
+
+async def store_logo_data_uri(data_uri: str) -> dict[str, str] | None:
+    """Converte um logo em base64 (data:image/...;base64,...) em variantes no storage."""
+    header, _, payload = data_uri.partition(",")
+    if not header.startswith("data:") or ";base64" not in header:
+        return None
+    content_type = header[len("data:"):].split(";")[0] or "image/png"
+    ext = mimetypes.guess_extension(content_type) or ".png"
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+    with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
+        tmp.write(data)
+        tmp_path = tmp.name
+    try:
+        return await store_logo(tmp_path, ext, content_type)
+    finally:
+        os.remove(tmp_path)
+
+
+def proxy_url(key: str, base_url: str) -> str:
+    """Chave no storage -> URL absoluta do proxy /stream (a extensão roda em outra origem)."""
+    return f"{base_url.rstrip('/')}/api/v1/stream?path={quote(key)}"
+
+
+def logo_urls(variants: dict | None, base_url: str) -> dict[str, str]:
+    return {name: proxy_url(key, base_url) for name, key in (variants or {}).items()}
+
+
+def default_logo_key(variants: dict) -> str:
+    return variants.get(DEFAULT_LOGO_SIZE) or variants.get(str(LOGO_SIZES[-1])) or variants["original"]
@@ -0,0 +1,90 @@
+import asyncio
+import copy
+import hashlib
+import json
+from datetime import datetime
+from sqlalchemy import update
+from app.db.session import AsyncSessionLocal
+from app.models.chapter import Chapter
+from app.services.jobs import JobCancelled, still_current
+
+# Estágios com checkpoint (TTS é um por passo: "tts:<hash do texto>")
+PROXY = "proxy"
+GEMINI_FILE = "gemini_file"
+ANALYSIS = "analysis"
+TTS_PREFIX = "tts:"
+
+
+def input_hash(*parts) -> str:
+    """Hash estável das entradas de um estágio (qualquer coisa serializável em JSON)."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def checkpoint_object_keys(data: dict | None) -> set[str]:
+    """Objetos do storage usados pelos artefatos (proxy 1 FPS, áudios dos passos)."""
+    keys = set()
+    for entry in (data or {}).values():
+        artifact = entry.get("artifact") if isinstance(entry, dict) else None
+        if isinstance(artifact, dict):
+            for field in ("object_key", "audio_url"):
+                if artifact.get(field):
+                    keys.add(artifact[field])
+    return keys
+
+
+class Checkpoints:
+    """
+    Artefatos por estágio do processamento de um capítulo (Chapter.checkpoints),
+    cada um com o hash das entradas que o produziram:
+        {"analysis": {"input": "<sha256>", "artifact": {...}, "at": "..."}, ...}
+    Reprocessar pula o estágio cujo hash de entrada não mudou. Cada put grava na hora,
+    numa sessão curta: se o job cair depois, o que já ficou pronto não é refeito.
+    """
+    def __init__(self, chapter_id: int | None, data: dict | None):
+        self.chapter_id = chapter_id
+        self.data = copy.deepcopy(data or {})
+        self.hits: list[str] = []
+        self._lock = asyncio.Lock()
+
+    def get(self, stage: str, input_hash: str) -> dict | None:
+        entry = self.data.get(stage)
+        if not entry or entry.get("input") != input_hash:
+            return None
+        self.hits.append(stage)
+        return copy.deepcopy(entry["artifact"])
+
+    def stages(self, prefix: str) -> list[str]:
+        return [stage for stage in self.data if stage.startswith(prefix)]
+
+    async def put(self, stage: str, input_hash: str, artifact: dict):
+        self.data[stage] = {
+            "input": input_hash,
+            "artifact": copy.deepcopy(artifact),
+            "at": datetime.utcnow().isoformat(),
+        }
+        await self._save()
+
+    async def drop(self, *stages: str):
+        removed = [stage for stage in stages if self.data.pop(stage, None) is not None]
+        if removed:
+            await self._save()
+
+    async def _save(self):
+        if self.chapter_id is None:
+            return
+        # Um put por vez: gravações fora de ordem perderiam entradas (o JSON vai inteiro)
+        async with self._lock:
+            snapshot = copy.deepcopy(self.data)
+            async with AsyncSessionLocal() as db:
+                # Só o job dono do capítulo grava: um job cancelado (ou com o lease perdido)
+                # não sobrescreve os checkpoints do job que o substituiu
+                result = await db.execute(
+                    update(Chapter)
+                    .where(Chapter.id == self.chapter_id, still_current())
+                    .values(checkpoints=snapshot)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount == 0:
+                    raise JobCancelled(f"Checkpoints do chapter {self.chapter_id} não gravados: job cancelado")
+                await db.commit()
@@ -0,0 +1,145 @@
+import time
+from contextlib import contextmanager
+from typing import Callable
+from app.core.config import settings
+from app.services.jobs import JobCancelled, JobDeferred
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(JobDeferred):
+    """
+    Provedor com circuito aberto: a chamada nem é feita. Quem tem alternativa (TTS) vai
+    direto para ela; num job sem alternativa (Gemini), o job volta para a fila até a
+    próxima sondagem em vez de esperar os timeouts do provedor fora do ar.
+    """
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuito '{name}' aberto; nova sondagem em {retry_in:.0f}s", retry_in)
+        self.name = name
+
+
+class CircuitBreaker:
+    """
+    Disjuntor por provedor (por processo). Fechado: as chamadas passam e as falhas seguidas
+    são contadas; com failure_threshold falhas, abre. Aberto: rejeita na hora (CircuitOpen)
+    durante reset_seconds. Depois fica meio-aberto: deixa passar uma chamada de sondagem;
+    se der certo fecha, se falhar abre de novo com o dobro do tempo (até max_reset_seconds).
+    """
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float, max_reset_seconds: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.max_reset_seconds = max(reset_seconds, max_reset_seconds)
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._open_for = reset_seconds
+        self._probing = False
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+        self.last_error: str | None = None
+
+    def _transition(self, state: str, reason: str = ""):
+        print(f"[Breaker] {self.name}: {self.state} -> {state}{f' ({reason})' if reason else ''}")
+        self.state = state
+
+    def retry_in(self) -> float:
+        return max(0.0, self._opened_at + self._open_for - time.monotonic())
+
+    def allow(self) -> bool:
+        """Sem efeito colateral além de passar para meio-aberto quando o tempo venceu."""
+        if self.state == OPEN and self.retry_in() == 0:
+            self._transition(HALF_OPEN, "sondando")
+        if self.state == HALF_OPEN:
+            return not self._probing
+        return self.state == CLOSED
+
+    def check(self):
+        """Falha rápido se o circuito está aberto (antes de começar trabalho que depende do provedor)."""
+        if not self.allow():
+            self.rejected += 1
+            raise CircuitOpen(self.name, self.retry_in() or self.reset_seconds)
+
+    def _open(self, reason: str):
+        self._open_for = (
+            min(self.max_reset_seconds, self._open_for * 2) if self.state == HALF_OPEN else self.reset_seconds
+        )
+        self._opened_at = time.monotonic()
+        self.opened += 1
+        self._transition(OPEN, reason)
+
+    def _success(self):
+        self._failures = 0
+        if self.state == HALF_OPEN:
+            self._transition(CLOSED, "sondagem ok")
+
+    def _failure(self, error: Exception):
+        self.failures += 1
+        self._failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"[:300]
+        if self.state == HALF_OPEN:
+            self._open("sondagem falhou")
+        elif self.state == CLOSED and self._failures >= self.failure_threshold:
+            self._open(f"{self._failures} falhas seguidas")
+
+    @contextmanager
+    def guard(self, ignore: Callable[[Exception], bool] | None = None):
+        """
+        Envolve uma chamada ao provedor. Erros em que ignore(e) é verdadeiro (ex.: 429, erro
+        do próprio request) e cancelamentos não contam como falha do provedor.
+        """
+        self.check()
+        probe = self.state == HALF_OPEN
+        if probe:
+            self._probing = True
+        self.calls += 1
+        try:
+            yield
+        except JobCancelled:
+            raise
+        except Exception as e:
+            if ignore is None or not ignore(e):
+                self._failure(e)
+            raise
+        else:
+            self._success()
+        finally:
+            if probe:
+                self._probing = False
+
+    def stats(self) -> dict:
+        self.allow()
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "retry_in_seconds": round(self.retry_in(), 1) if self.state == OPEN else 0.0,
+            "calls": self.calls,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "opened": self.opened,
+            "last_error": self.last_error,
+        }
+
+
+def _breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        settings.BREAKER_FAILURE_THRESHOLD,
+        settings.BREAKER_RESET_SECONDS,
+        settings.BREAKER_MAX_RESET_SECONDS
+    )
+
+
+gemini_breaker = _breaker("gemini")
+edge_tts_breaker = _breaker("edge_tts")
+gtts_breaker = _breaker("gtts")
+
+BREAKERS = {breaker.name: breaker for breaker in (gemini_breaker, edge_tts_breaker, gtts_breaker)}
+
+
+def breaker_stats() -> dict:
+    return {name: breaker.stats() for name, breaker in BREAKERS.items()}
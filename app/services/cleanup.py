@@ -0,0 +1,173 @@
+import asyncio
+import json
+from urllib.parse import unquote
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.chapter import Chapter
+from app.models.collection import Collection
+from app.models.module import Module
+from app.models.pending_deletion import PendingDeletion
+from app.models.video_hash import VideoHash
+from app.services.checkpoints import checkpoint_object_keys
+from app.services.storage import async_storage
+
+# Limite do DeleteObjects do S3/MinIO por requisição
+BATCH_SIZE = 1000
+PROXY_PREFIX = "/api/v1/stream?path="
+
+
+def normalize_key(path: str | None) -> str | None:
+    """Caminho salvo no banco (bucket/nome, nome ou URL do proxy) -> nome do objeto."""
+    if not path:
+        return None
+    if path.startswith(PROXY_PREFIX):
+        path = unquote(path[len(PROXY_PREFIX):])
+    return async_storage.object_name(path)
+
+
+def chapter_object_keys(chapter) -> set[str]:
+    """
+    Todos os objetos referenciados por um capítulo (objeto ORM ou linha com as mesmas colunas):
+    vídeo, vídeo final, original bruto, áudios dos passos e artefatos dos checkpoints.
+    """
+    keys = {
+        normalize_key(chapter.video_url),
+        normalize_key(chapter.stitched_video_url),
+        normalize_key(chapter.raw_video_url),
+    }
+    keys.update(normalize_key(key) for key in checkpoint_object_keys(chapter.checkpoints))
+    if chapter.text_content:
+        try:
+            content = json.loads(chapter.text_content)
+        except ValueError:
+            content = None
+        if isinstance(content, dict):
+            for step in content.get("steps") or []:
+                if isinstance(step, dict):
+                    keys.add(normalize_key(step.get("audio_url")))
+    keys.discard(None)
+    return keys
+
+
+async def collect_object_keys(db: AsyncSession, *where) -> set[str]:
+    """
+    Objetos dos capítulos que casam com `where` (sobre Chapter/Collection/Module).
+    Chame ANTES de apagar as linhas: depois do delete não há mais o que consultar.
+    """
+    stmt = (
+        select(Chapter.video_url, Chapter.stitched_video_url, Chapter.raw_video_url, Chapter.text_content, Chapter.checkpoints)
+        .join(Collection, Chapter.collection_id == Collection.id)
+        .outerjoin(Module, Collection.module_id == Module.id)
+        .where(*where)
+    )
+    keys = set()
+    for row in (await db.execute(stmt)).all():
+        keys |= chapter_object_keys(row)
+    return keys
+
+
+class CleanupQueue:
+    """
+    Fila persistente (tabela pending_deletions) de objetos a remover do storage após
+    deletes no banco. O endpoint grava os nomes na mesma transação do delete; um loop
+    em background pega lotes (SKIP LOCKED: várias réplicas da API não pegam o mesmo
+    lote), confere contra o conjunto de referências do banco, montado uma vez por lote
+    como na fase "mark" do GC (com a deduplicação por hash, vários capítulos apontam
+    para o mesmo vídeo e copiam os mesmos áudios), e remove o resto (multi-object delete).
+    Remoção que falha no storage não volta para a fila: o GC periódico recolhe o órfão.
+    """
+    def __init__(self, batch_size: int = BATCH_SIZE):
+        self.batch_size = batch_size
+        self._task: asyncio.Task | None = None
+        self.enqueued = 0
+        self.deleted = 0
+        self.skipped = 0
+        self.failed = 0
+
+    async def enqueue(self, db: AsyncSession, keys: set[str]):
+        """Grava os nomes na transação de `db` (sem commit: vai junto com o delete)."""
+        names = sorted(keys)
+        # Em partes: um sistema inteiro pode passar do limite de parâmetros por statement
+        for i in range(0, len(names), self.batch_size):
+            await db.execute(
+                insert(PendingDeletion)
+                .values([{"object_key": name} for name in names[i:i + self.batch_size]])
+                .on_conflict_do_nothing(index_elements=["object_key"])
+            )
+        self.enqueued += len(names)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.process_batch()
+            except Exception as e:
+                print(f"[Cleanup] Erro ao processar lote: {e}")
+                processed = 0
+            # Lote cheio: provavelmente tem mais na fila
+            if processed < self.batch_size:
+                await asyncio.sleep(settings.CLEANUP_POLL_SECONDS)
+
+    async def process_batch(self) -> int:
+        """Processa um lote da fila. Retorna quantos nomes saíram da fila."""
+        from app.services.storage_gc import referenced_keys
+
+        async with AsyncSessionLocal() as db:
+            batch = set((await db.scalars(
+                select(PendingDeletion.object_key)
+                .order_by(PendingDeletion.enqueued_at)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )).all())
+            if not batch:
+                await db.rollback()
+                return 0
+
+            referenced = await referenced_keys(db, include_hashes=False)
+            orphans = sorted(batch - referenced)
+            self.skipped += len(batch) - len(orphans)
+            if orphans:
+                # Hash apontando para objeto apagado faria a deduplicação reaproveitar um vídeo inexistente
+                paths = orphans + [f"{async_storage.bucket_name}/{name}" for name in orphans]
+                await db.execute(delete(VideoHash).where(VideoHash.video_url.in_(paths)))
+                failed = await async_storage.remove_objects(orphans)
+                self.deleted += len(orphans) - len(failed)
+                self.failed += len(failed)
+                print(f"[Cleanup] {len(orphans) - len(failed)} objetos removidos, {len(failed)} falharam")
+
+            # Sai da fila só no commit: se o processo cair antes, o lote é refeito
+            await db.execute(delete(PendingDeletion).where(PendingDeletion.object_key.in_(batch)))
+            await db.commit()
+            return len(batch)
+
+    async def stats(self) -> dict:
+        async with AsyncSessionLocal() as db:
+            pending, oldest = (await db.execute(
+                select(func.count(), func.min(PendingDeletion.enqueued_at))
+            )).one()
+        return {
+            "pending": pending,
+            "oldest_pending_at": oldest,
+            "enqueued": self.enqueued,
+            "deleted": self.deleted,
+            "skipped_still_referenced": self.skipped,
+            "failed": self.failed,
+        }
+
+# Instância única
+cleanup_queue = CleanupQueue()
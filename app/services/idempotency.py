@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, or_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.idempotency import IdempotencyKey
+
+
+async def _reserve(key: str, scope: str) -> datetime | None:
+    """
+    Grava a chave (sem resposta ainda) com um lease de IDEMPOTENCY_LOCK_SECONDS.
+    Uma chave sem resposta cujo lease venceu é de um request que morreu: é assumida aqui.
+    Retorna o lease (identifica o dono da chave) ou None se ela existe e não está livre.
+    """
+    now = datetime.utcnow()
+    locked_until = now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+    async with AsyncSessionLocal() as db:
+        # Chaves vencidas saem aqui mesmo (índice em expires_at)
+        await db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < now))
+        stmt = insert(IdempotencyKey).values(
+            key=key,
+            scope=scope,
+            locked_until=locked_until,
+            created_at=now,
+            expires_at=now + timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS)
+        )
+        result = await db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[IdempotencyKey.key],
+                set_={"locked_until": locked_until, "created_at": now, "expires_at": stmt.excluded.expires_at},
+                where=(
+                    IdempotencyKey.response.is_(None)
+                    & (IdempotencyKey.scope == stmt.excluded.scope)
+                    # Linhas de antes do lease (locked_until nulo) também contam como perdidas
+                    & or_(IdempotencyKey.locked_until.is_(None), IdempotencyKey.locked_until < now)
+                )
+            )
+        )
+        await db.commit()
+        return locked_until if result.rowcount == 1 else None
+
+
+async def _release(key: str, lease: datetime):
+    """Request falhou: libera a chave para o cliente poder tentar de novo (se ainda é nossa)."""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.key == key, IdempotencyKey.locked_until == lease, IdempotencyKey.response.is_(None))
+        )
+        await db.commit()
+
+
+async def _store(key: str, lease: datetime, response: dict):
+    """Grava a resposta. Se outro request assumiu a chave (lease vencido), a dele vale."""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key == key, IdempotencyKey.locked_until == lease)
+            .values(status_code=200, response=jsonable_encoder(response), locked_until=None)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+async def idempotent(
+    request: Request,
+    key: str | None,
+    db: AsyncSession,
+    handler: Callable[[], Awaitable[dict]]
+):
+    """
+    Executa `handler` uma vez por Idempotency-Key. Repetições devolvem a resposta original
+    (header Idempotent-Replayed: true); enquanto o original roda, 409 (com Retry-After até o
+    lease vencer; depois disso a repetição assume a chave e executa).
+    Sem header, só executa. Só respostas de sucesso ficam gravadas.
+    """
+    if not key:
+        return await handler()
+
+    scope = f"{request.method} {request.url.path}"
+    lease = await _reserve(key, scope)
+    if lease is None:
+        stored = await db.get(IdempotencyKey, key)
+        if stored is None:
+            # Venceu entre o insert e a leitura: trata como chave nova
+            return await idempotent(request, key, db, handler)
+        if stored.scope != scope:
+            raise HTTPException(status_code=422, detail="Idempotency-Key já usada em outro endpoint")
+        if stored.response is None:
+            retry_in = (stored.locked_until - datetime.utcnow()).total_seconds() if stored.locked_until else 0
+            raise HTTPException(
+                status_code=409,
+                detail="Request com esta Idempotency-Key ainda em andamento",
+                headers={"Retry-After": str(max(1, int(retry_in) + 1))}
+            )
+        return JSONResponse(
+            content=stored.response,
+            status_code=stored.status_code or 200,
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+    try:
+        response = await handler()
+    except BaseException:
+        await _release(key, lease)
+        raise
+
+    await _store(key, lease, response)
+    return response
@@ -0,0 +1,241 @@
+import asyncio
+import hashlib
+import resource
+import time
+from collections import deque
+from typing import BinaryIO
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.models.chapter import Chapter
+from app.models.collection import Collection
+from app.models.video_hash import VideoHash
+from app.services.storage import async_storage
+
+
+def _current_rss_mb() -> float:
+    """Lê o RSS atual do processo (Linux). Retorna 0 se não disponível."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _peak_rss_mb() -> float:
+    """Pico de RSS do processo desde o início (ru_maxrss vem em KB no Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class MeteredReader:
+    """
+    Envolve um file-like e mede o que passa por ele: bytes lidos,
+    maior bloco mantido em memória, tempo total e SHA-256 do conteúdo.
+    O MinIO chama read(part_size) repetidamente, então o maior bloco
+    é o quanto de vídeo este upload segura na RAM de cada vez.
+    """
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self.bytes_read = 0
+        self.peak_buffer_bytes = 0
+        self.started_at = time.monotonic()
+        self._hasher = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        self._hasher.update(data)
+        self.bytes_read += len(data)
+        if len(data) > self.peak_buffer_bytes:
+            self.peak_buffer_bytes = len(data)
+        return data
+
+    def stats(self, filename: str) -> dict:
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        mb = self.bytes_read / (1024 * 1024)
+        return {
+            "filename": filename,
+            "bytes": self.bytes_read,
+            "sha256": self._hasher.hexdigest(),
+            "seconds": round(elapsed, 3),
+            "throughput_mb_s": round(mb / elapsed, 2),
+            "peak_buffer_mb": round(self.peak_buffer_bytes / (1024 * 1024), 2),
+            "rss_mb": round(_current_rss_mb(), 1),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+        }
+
+
+def _max_parallel_uploads() -> int:
+    """
+    Quantos uploads podem rodar ao mesmo tempo dentro do orçamento de RSS.
+    Cada upload segura ~2 partes (a lida + a cópia enviada pelo minio).
+    """
+    per_upload_mb = 2 * settings.UPLOAD_PART_SIZE / (1024 * 1024)
+    return max(1, int(settings.UPLOAD_MEMORY_BUDGET_MB // per_upload_mb))
+
+
+class IngestService:
+    """Ingestão de vídeos em streaming (arquivo do request -> partes no MinIO) com métricas por upload."""
+
+    def __init__(self):
+        self.max_parallel = _max_parallel_uploads()
+        self._slots = asyncio.Semaphore(self.max_parallel)
+        self.in_flight = 0
+        self.waiting = 0
+        self.recent = deque(maxlen=100)
+
+    async def save_stream(self, stream: BinaryIO, filename: str, content_type: str) -> tuple[str, dict]:
+        """
+        Envia o stream ao MinIO parte por parte (no pool de I/O, para não travar o loop).
+        Retorna (caminho_minio, estatisticas).
+        """
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            reader = MeteredReader(stream)
+            video_path = await async_storage.save_stream(
+                reader,
+                filename,
+                content_type,
+                settings.UPLOAD_PART_SIZE
+            )
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+        stats = reader.stats(filename)
+        self.recent.append(stats)
+        print(
+            f"[Ingest] {filename}: {stats['bytes']} bytes em {stats['seconds']}s "
+            f"({stats['throughput_mb_s']} MB/s, buffer {stats['peak_buffer_mb']} MB, RSS {stats['rss_mb']} MB)"
+        )
+        return video_path, stats
+
+    def summary(self) -> dict:
+        """Resumo dos uploads recentes (para observabilidade)."""
+        uploads = list(self.recent)
+        throughputs = [u["throughput_mb_s"] for u in uploads]
+        return {
+            "max_parallel_uploads": self.max_parallel,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "part_size_mb": settings.UPLOAD_PART_SIZE / (1024 * 1024),
+            "memory_budget_mb": settings.UPLOAD_MEMORY_BUDGET_MB,
+            "avg_throughput_mb_s": round(sum(throughputs) / len(throughputs), 2) if throughputs else 0.0,
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+            "recent": uploads[-20:],
+        }
+
+
+async def create_manual(
+    db: AsyncSession,
+    module_id: int,
+    title: str,
+    video_path: str,
+    text_content: str | None = None
+) -> tuple[Collection, Chapter]:
+    """
+    Cria o Guia (Collection) e o Capítulo para um vídeo já salvo no MinIO.
+    MVP: 1 Video = 1 Manual. Usado por todos os caminhos de upload.
+    Se `text_content` vier preenchido (análise reaproveitada), o capítulo já nasce DRAFT.
+    """
+    new_collection = Collection(
+        module_id=module_id,
+        title=title,
+        description=f"Manual gerado automaticamente a partir do vídeo '{title}'"
+    )
+    db.add(new_collection)
+    await db.flush() # Para gerar o ID da collection
+
+    new_chapter = Chapter(
+        collection_id=new_collection.id,
+        title=title, # Capítulo 1 tem o mesmo titulo do Guia
+        user_goal=title, # Objetivo da IA nos uploads (payload do PROCESS_VIDEO)
+        video_url=video_path,
+        text_content=text_content,
+        status="DRAFT" if text_content else "PENDING"
+    )
+
+    db.add(new_chapter)
+    await db.commit()
+    await db.refresh(new_chapter)
+    return new_collection, new_chapter
+
+
+# --- Deduplicação por conteúdo (SHA-256) ---
+
+async def find_video_by_hash(db: AsyncSession, sha256: str) -> VideoHash | None:
+    """Procura um vídeo já armazenado com o mesmo conteúdo."""
+    return await db.get(VideoHash, sha256.lower())
+
+async def find_existing_analysis(db: AsyncSession, video_path: str) -> str | None:
+    """Retorna o text_content de um capítulo que já analisou este vídeo (se houver)."""
+    stmt = (
+        select(Chapter.text_content)
+        .where(
+            Chapter.video_url == video_path,
+            Chapter.status.in_(["DRAFT", "COMPLETED"]),
+            Chapter.text_content.is_not(None)
+        )
+        .order_by(Chapter.id.desc())
+        .limit(1)
+    )
+    return await db.scalar(stmt)
+
+async def register_video_hash(db: AsyncSession, sha256: str, video_path: str, size: int, remove_duplicate: bool = True) -> str:
+    """
+    Registra o hash do vídeo recém-enviado. Se o conteúdo já existia,
+    apaga a cópia nova do MinIO (remove_duplicate) e retorna o caminho do objeto original.
+    """
+    stmt = (
+        insert(VideoHash)
+        .values(sha256=sha256, video_url=video_path, size=size)
+        .on_conflict_do_nothing(index_elements=["sha256"])
+    )
+    await db.execute(stmt)
+    await db.commit()
+
+    existing = await db.get(VideoHash, sha256, populate_existing=True)
+    if existing.video_url == video_path:
+        return video_path
+
+    # Confere se o original ainda existe antes de descartar a cópia nova
+    try:
+        await async_storage.stat_object(existing.video_url)
+    except Exception:
+        existing.video_url = video_path
+        existing.size = size
+        await db.commit()
+        return video_path
+
+    print(f"[Ingest] Vídeo duplicado ({sha256[:12]}...): reaproveitando {existing.video_url}")
+    if remove_duplicate:
+        await async_storage.remove_object(video_path)
+    return existing.video_url
+
+async def create_manual_for_upload(
+    db: AsyncSession,
+    module_id: int,
+    title: str,
+    video_path: str,
+    sha256: str,
+    size: int
+) -> tuple[Collection, Chapter]:
+    """
+    Finaliza qualquer upload: deduplica pelo hash e cria o manual.
+    Se o vídeo já tinha sido analisado, reaproveita a análise (capítulo DRAFT,
+    sem chamar a IA de novo). Caso contrário o capítulo nasce PENDING.
+    """
+    video_path = await register_video_hash(db, sha256, video_path, size)
+    text_content = await find_existing_analysis(db, video_path)
+    return await create_manual(db, module_id, title, video_path, text_content=text_content)
+
+# Instância única
+ingest_service = IngestService()
@@ -0,0 +1,152 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from sqlalchemy import update
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.observability import ProcessingJob
+
+# Estágios medidos no processamento de um capítulo (ordem do pipeline)
+STAGES = ["download", "ffmpeg", "gemini_upload", "gemini_wait", "generate", "tts", "save"]
+
+
+class RunMetrics:
+    """
+    Medições de uma execução de process_video: tempo de parede por estágio, tokens do
+    Gemini, CPU/RSS dos processos filhos (ffmpeg) e tamanhos do vídeo e do proxy.
+    Vive num ContextVar durante o job; os serviços registram sem receber o objeto.
+    """
+    def __init__(self, row_id: int | None = None):
+        self.row_id = row_id
+        self.started = time.monotonic()
+        self.stage_ms: dict[str, float] = {}
+        self.tokens_input = 0
+        self.tokens_output = 0
+        self.child_cpu_seconds = 0.0
+        self.child_max_rss_kb = 0
+        self.input_bytes: int | None = None
+        self.proxy_bytes: int | None = None
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            # Soma: um estágio pode rodar mais de uma vez (ex.: retry do upload)
+            self.stage_ms[name] = round(self.stage_ms.get(name, 0.0) + (time.monotonic() - started) * 1000, 1)
+
+    def record_usage(self, usage_metadata):
+        if usage_metadata is None:
+            return
+        self.tokens_input += getattr(usage_metadata, "prompt_token_count", 0) or 0
+        self.tokens_output += getattr(usage_metadata, "candidates_token_count", 0) or 0
+
+    def record_child(self, usage):
+        """resource.struct_rusage de um filho (os.wait4). ru_maxrss vem em KB no Linux."""
+        self.child_cpu_seconds += usage.ru_utime + usage.ru_stime
+        self.child_max_rss_kb = max(self.child_max_rss_kb, usage.ru_maxrss)
+
+    @property
+    def cost_usd(self) -> float:
+        return (
+            self.tokens_input * settings.GEMINI_INPUT_USD_PER_MTOK
+            + self.tokens_output * settings.GEMINI_OUTPUT_USD_PER_MTOK
+        ) / 1_000_000
+
+
+current_run: ContextVar[RunMetrics | None] = ContextVar("current_run", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Mede o estágio na execução atual (fora de um job não mede nada)."""
+    run = current_run.get()
+    if run is None:
+        yield
+        return
+    with run.stage(name):
+        yield
+
+
+def record_child(usage):
+    run = current_run.get()
+    if run is not None:
+        run.record_child(usage)
+
+
+def record_usage(usage_metadata):
+    run = current_run.get()
+    if run is not None:
+        run.record_usage(usage_metadata)
+
+
+def record_sizes(input_bytes: int | None = None, proxy_bytes: int | None = None):
+    run = current_run.get()
+    if run is None:
+        return
+    if input_bytes is not None:
+        run.input_bytes = input_bytes
+    if proxy_bytes is not None:
+        run.proxy_bytes = proxy_bytes
+
+
+async def start_run(chapter_id: int, video_id: str | None, model: str, job_id: int | None) -> RunMetrics:
+    """
+    Cria a linha em processing_jobs (status processing) e ativa as medições no contexto.
+    Linhas processing antigas do capítulo são de um worker que morreu: viram failed.
+    """
+    run = RunMetrics()
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ProcessingJob)
+                .where(ProcessingJob.chapter_id == chapter_id, ProcessingJob.status == "processing")
+                .values(status="failed", error_log="Execução interrompida (worker perdido)", finished_at=datetime.now(timezone.utc))
+                .execution_options(synchronize_session=False)
+            )
+            row = ProcessingJob(
+                video_id=video_id or "",
+                status="processing",
+                model_used=model,
+                chapter_id=chapter_id,
+                job_id=job_id,
+            )
+            db.add(row)
+            await db.commit()
+            run.row_id = row.id
+    except Exception as e:
+        # Métrica não pode derrubar o job
+        print(f"[Metrics] Falha ao registrar execução do capítulo {chapter_id}: {e}")
+    current_run.set(run)
+    return run
+
+
+async def finish_run(run: RunMetrics, status: str, error: str | None = None):
+    """Grava status final e medições (completed, failed, retrying, throttled ou cancelled)."""
+    if run.row_id is None:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ProcessingJob)
+                .where(ProcessingJob.id == run.row_id)
+                .values(
+                    status=status,
+                    error_log=error,
+                    finished_at=datetime.now(timezone.utc),
+                    stage_ms=run.stage_ms,
+                    tokens_input=run.tokens_input,
+                    tokens_output=run.tokens_output,
+                    cost_usd=round(run.cost_usd, 6),
+                    child_cpu_seconds=round(run.child_cpu_seconds, 3),
+                    child_max_rss_kb=run.child_max_rss_kb,
+                    input_bytes=run.input_bytes,
+                    proxy_bytes=run.proxy_bytes,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+    except Exception as e:
+        print(f"[Metrics] Falha ao gravar métricas da execução {run.row_id}: {e}")
@@ -0,0 +1,504 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+from sqlalchemy import and_, exists, func, or_, select, true, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.pool_metrics import pool_metrics
+from app.db.session import AsyncSessionLocal, engine
+from app.models.chapter import Chapter
+from app.models.collection import Collection
+from app.models.job import Job, LANES, PRIORITY_UPLOAD
+from app.models.module import Module
+from app.services import progress
+from app.services.stages import job_priority, stage_stats
+
+# Tipos de job
+PROCESS_VIDEO = "process_video"
+STITCH_PUBLISH = "stitch_publish"
+ARCHIVE_RAW = "archive_raw"
+REGENERATE_AUDIO = "regenerate_audio"
+
+# Status do capítulo enquanto o job do tipo está pendente: a fila só marca o capítulo
+# FAILED (lease vencido na última tentativa) se ele ainda estiver nesse status
+CHAPTER_STATUS = {PROCESS_VIDEO: "PENDING", STITCH_PUBLISH: "PROCESSING"}
+
+# kind -> handler(job_payload). Registrados com @job_handler nos módulos dos workers.
+JOB_HANDLERS: dict[str, Callable[..., Awaitable[None]]] = {}
+
+
+def job_handler(kind: str):
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+class JobCancelled(Exception):
+    """O job foi cancelado (POST /chapters/{id}/cancel) e não pode gravar resultado."""
+
+
+class JobDeferred(Exception):
+    """
+    O job não pode continuar agora (ex.: cota do Gemini esgotada). Volta para a fila
+    depois de `delay` segundos sem gastar tentativa (até JOB_MAX_DEFERRALS vezes).
+    """
+    def __init__(self, message: str, delay: float):
+        super().__init__(message)
+        self.delay = delay
+
+
+class JobContext:
+    """
+    Token de cancelamento cooperativo do job em execução (visível aos estágios via current_job).
+    Leva também as contagens do claim, para o handler saber se um erro é definitivo
+    e se ainda pode adiar o job.
+    """
+    def __init__(self, job_id: int, worker_id: str, attempts: int = 1, max_attempts: int = 1, deferrals: int = 0):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.deferrals = deferrals
+        self.cancelled = False
+
+    def check(self):
+        if self.cancelled:
+            raise JobCancelled(f"Job {self.job_id} cancelado")
+
+    @property
+    def final_attempt(self) -> bool:
+        """Um erro agora é definitivo (a fila não tenta de novo)."""
+        return self.attempts >= self.max_attempts
+
+    @property
+    def can_defer(self) -> bool:
+        """JobDeferred ainda devolve o job para a fila (senão o job termina FAILED)."""
+        return self.deferrals < settings.JOB_MAX_DEFERRALS
+
+
+current_job: ContextVar[JobContext | None] = ContextVar("current_job", default=None)
+
+
+def check_cancelled():
+    """Ponto de cancelamento entre estágios. Fora de um job (ex.: request da API) não faz nada."""
+    ctx = current_job.get()
+    if ctx:
+        ctx.check()
+
+
+def final_attempt() -> bool:
+    """Fora de um job não há nova tentativa."""
+    ctx = current_job.get()
+    return ctx is None or ctx.final_attempt
+
+
+def can_defer() -> bool:
+    """Fora de um job não há fila para onde voltar."""
+    ctx = current_job.get()
+    return ctx is not None and ctx.can_defer
+
+
+def still_current():
+    """
+    Condição SQL para o UPDATE final dos handlers: o job ainda é deste worker e ninguém
+    pediu cancelamento. Vai no mesmo statement do UPDATE (sem janela entre conferir e gravar).
+    """
+    ctx = current_job.get()
+    if ctx is None:
+        return true()
+    return exists().where(
+        Job.id == ctx.job_id,
+        Job.locked_by == ctx.worker_id,
+        Job.status == "RUNNING",
+        Job.cancel_requested_at.is_(None)
+    )
+
+
+async def request_cancel(db: AsyncSession, chapter_id: int) -> int:
+    """
+    Cancela os jobs ativos do capítulo (sem commit: vai junto com a mudança de status).
+    QUEUED sai da fila na hora; RUNNING recebe o pedido e o worker interrompe o job.
+    """
+    now = datetime.utcnow()
+    queued = await db.execute(
+        update(Job)
+        .where(Job.chapter_id == chapter_id, Job.status == "QUEUED")
+        .values(status="CANCELLED", cancel_requested_at=now, finished_at=now)
+    )
+    running = await db.execute(
+        update(Job)
+        .where(Job.chapter_id == chapter_id, Job.status == "RUNNING", Job.cancel_requested_at.is_(None))
+        .values(cancel_requested_at=now)
+    )
+    return queued.rowcount + running.rowcount
+
+
+async def active_job(db: AsyncSession, kind: str, chapter_id: int) -> Job | None:
+    """Job do capítulo na fila ou rodando (sem cancelamento pedido)."""
+    return await db.scalar(
+        select(Job)
+        .where(
+            Job.chapter_id == chapter_id,
+            Job.kind == kind,
+            Job.status.in_(["QUEUED", "RUNNING"]),
+            Job.cancel_requested_at.is_(None)
+        )
+        .limit(1)
+    )
+
+
+async def enqueue(
+    db: AsyncSession,
+    kind: str,
+    payload: dict,
+    chapter_id: int | None = None,
+    priority: int = PRIORITY_UPLOAD,
+    system_id: int | None = None
+) -> tuple[Job, bool]:
+    """
+    Coloca um job na fila (commit incluso). É tudo o que os routers fazem:
+    o processamento roda nos workers, fora do processo da API.
+    O sistema do capítulo (chave do fair share) é resolvido aqui se não for informado.
+    Se o capítulo já tem um job ativo do mesmo tipo, não cria outro: devolve (job existente, False).
+    """
+    if chapter_id is not None:
+        existing = await active_job(db, kind, chapter_id)
+        if existing:
+            await db.commit()
+            return existing, False
+        if system_id is None:
+            system_id = await db.scalar(
+                select(Module.system_id)
+                .select_from(Chapter)
+                .join(Collection, Chapter.collection_id == Collection.id)
+                .join(Module, Collection.module_id == Module.id)
+                .where(Chapter.id == chapter_id)
+            )
+    job = Job(
+        kind=kind,
+        chapter_id=chapter_id,
+        payload=payload,
+        status="QUEUED",
+        priority=priority,
+        system_id=system_id,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+        run_after=datetime.utcnow()
+    )
+    db.add(job)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Outro request criou o job entre a consulta e o insert (ux_jobs_active_chapter)
+        await db.rollback()
+        existing = await active_job(db, kind, chapter_id)
+        if existing is None:
+            raise
+        return existing, False
+    return job, True
+
+
+def _eligible(now: datetime):
+    """QUEUED já liberado (run_after) ou RUNNING com lease vencido (worker morreu)."""
+    return and_(
+        Job.kind.in_(list(JOB_HANDLERS)),
+        or_(
+            and_(Job.status == "QUEUED", Job.run_after <= now, Job.cancel_requested_at.is_(None)),
+            and_(Job.status == "RUNNING", Job.locked_until < now)
+        )
+    )
+
+
+async def _claim_order(db: AsyncSession, now: datetime) -> list[tuple[int, int | None]]:
+    """
+    Ordem em que os grupos (faixa, sistema) com jobs elegíveis devem ser tentados.
+    Faixa primeiro (com envelhecimento: a cada JOB_LANE_AGING_SECONDS de espera o grupo
+    sobe uma faixa, para manutenção não esperar para sempre). Dentro da faixa, o sistema
+    que menos usou os workers na janela recente, dividido pelo peso (JOB_SYSTEM_WEIGHTS).
+    """
+    groups = (await db.execute(
+        select(Job.priority, Job.system_id, func.min(Job.run_after))
+        .where(_eligible(now))
+        .group_by(Job.priority, Job.system_id)
+    )).all()
+    if not groups:
+        return []
+
+    since = now - timedelta(seconds=settings.JOB_FAIR_WINDOW_SECONDS)
+    usage = dict((await db.execute(
+        select(Job.system_id, func.count(Job.id))
+        .where(or_(Job.status == "RUNNING", Job.started_at >= since))
+        .group_by(Job.system_id)
+    )).all())
+
+    def rank(group):
+        priority, system_id, oldest = group
+        lane = priority
+        if settings.JOB_LANE_AGING_SECONDS > 0:
+            promoted = int((now - oldest).total_seconds() // settings.JOB_LANE_AGING_SECONDS)
+            # Envelhecer nunca leva à faixa interativa: ela não espera atrás de análise de vídeo
+            lane = max(min(priority, PRIORITY_UPLOAD), priority - promoted)
+        share = usage.get(system_id, 0) / settings.JOB_SYSTEM_WEIGHTS.get(system_id, 1.0)
+        return (lane, share, priority, oldest)
+
+    return [(priority, system_id) for priority, system_id, _ in sorted(groups, key=rank)]
+
+
+async def _fail_chapter(db: AsyncSession, job: Job):
+    """Capítulo FAILED (UPDATE condicional ao status do job) e evento failed, sem commit."""
+    expected = CHAPTER_STATUS.get(job.kind)
+    if job.chapter_id is None or expected is None:
+        return
+    result = await db.execute(
+        update(Chapter)
+        .where(Chapter.id == job.chapter_id, Chapter.status == expected)
+        .values(status="FAILED")
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        await progress.notify(db, job.chapter_id, "failed", status="FAILED", error=job.last_error)
+
+
+async def claim_job(db: AsyncSession, worker_id: str) -> Job | None:
+    """
+    Pega o próximo job elegível, na ordem de _claim_order; dentro do grupo, o mais antigo.
+    SKIP LOCKED deixa N workers disputarem a fila sem se bloquear nem pegar o mesmo job.
+    """
+    now = datetime.utcnow()
+    job = None
+    for priority, system_id in await _claim_order(db, now):
+        stmt = (
+            select(Job)
+            .where(
+                _eligible(now),
+                Job.priority == priority,
+                Job.system_id.is_(None) if system_id is None else Job.system_id == system_id
+            )
+            .order_by(Job.run_after, Job.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        job = (await db.execute(stmt)).scalar_one_or_none()
+        if job:
+            break
+    if not job:
+        await db.rollback()
+        return None
+
+    if job.status == "RUNNING":
+        # O worker anterior morreu no meio (sem heartbeat): conta como tentativa falha
+        print(f"[Jobs] Job {job.id} abandonado por {job.locked_by}; retomando")
+        if job.cancel_requested_at is not None:
+            job.status = "CANCELLED"
+            job.finished_at = now
+            job.locked_by = None
+            job.locked_until = None
+            await db.commit()
+            return None
+        if job.attempts >= job.max_attempts:
+            job.status = "FAILED"
+            job.last_error = f"Lease vencido após {job.attempts} tentativas (último worker: {job.locked_by})"
+            job.finished_at = now
+            job.locked_by = None
+            job.locked_until = None
+            # O handler não chegou a marcar o capítulo: mesma transação do job
+            await _fail_chapter(db, job)
+            await db.commit()
+            return None
+    else:
+        job.wait_seconds = (now - job.run_after).total_seconds()
+
+    job.status = "RUNNING"
+    job.attempts += 1
+    job.locked_by = worker_id
+    job.locked_until = now + timedelta(seconds=settings.JOB_VISIBILITY_TIMEOUT)
+    job.heartbeat_at = now
+    job.started_at = now
+    await db.commit()
+    return job
+
+
+async def _heartbeat(job_id: int, worker_id: str, renew: bool = True) -> str:
+    """
+    Confere o job e, se renew, renova o lease.
+    "ok", "cancelled" (cancelamento pedido) ou "lost" (o job não é mais deste worker).
+    """
+    now = datetime.utcnow()
+    mine = (Job.id == job_id, Job.locked_by == worker_id, Job.status == "RUNNING")
+    async with AsyncSessionLocal() as db:
+        if renew:
+            row = (await db.execute(
+                update(Job)
+                .where(*mine)
+                .values(
+                    locked_until=now + timedelta(seconds=settings.JOB_VISIBILITY_TIMEOUT),
+                    heartbeat_at=now
+                )
+                .returning(Job.cancel_requested_at)
+            )).first()
+            await db.commit()
+        else:
+            row = (await db.execute(select(Job.cancel_requested_at).where(*mine))).first()
+    if row is None:
+        return "lost"
+    return "cancelled" if row[0] is not None else "ok"
+
+
+def _apply_outcome(job: Job, error: str | None, cancelled: bool, defer: float | None, now: datetime):
+    """
+    Estado do job depois da execução. Adiamento devolve a tentativa; com os adiamentos
+    esgotados o job termina FAILED (o handler já marcou o capítulo, ver can_defer).
+    """
+    job.locked_by = None
+    job.locked_until = None
+    if cancelled or job.cancel_requested_at is not None:
+        job.status = "CANCELLED"
+        job.finished_at = now
+    elif defer is not None and job.deferrals < settings.JOB_MAX_DEFERRALS:
+        job.status = "QUEUED"
+        job.run_after = now + timedelta(seconds=defer)
+        job.attempts -= 1
+        job.deferrals += 1
+        job.last_error = error
+    elif error is None:
+        job.status = "SUCCEEDED"
+        job.finished_at = now
+    elif defer is None and job.attempts < job.max_attempts:
+        job.status = "QUEUED"
+        job.run_after = now + timedelta(seconds=30 * 2 ** (job.attempts - 1))
+        job.last_error = error
+    else:
+        job.status = "FAILED"
+        job.finished_at = now
+        job.last_error = error
+
+
+async def _finish(job_id: int, worker_id: str, error: str | None, cancelled: bool = False, defer: float | None = None):
+    """
+    Marca SUCCEEDED, ou devolve para a fila com backoff / FAILED após a última tentativa.
+    Job com cancelamento pedido termina CANCELLED, sem nova tentativa.
+    defer: volta para a fila daqui a `defer` segundos devolvendo a tentativa (limite de taxa).
+    """
+    async with AsyncSessionLocal() as db:
+        job = await db.get(Job, job_id, with_for_update=True)
+        if not job or job.locked_by != worker_id:
+            return # Outro worker assumiu o job
+        _apply_outcome(job, error, cancelled, defer, datetime.utcnow())
+        await db.commit()
+
+
+class JobWorker:
+    """
+    Loop de um processo worker: pega até `concurrency` jobs por vez,
+    renova o lease de cada um enquanto roda e registra o resultado.
+    Vários processos (em vários nós) podem rodar ao mesmo tempo.
+    """
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._active: set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        slots = ", ".join(f"{name}={pool['slots']}" for name, pool in stage_stats().items())
+        print(f"[Worker {self.worker_id}] Iniciado (concorrência {self.concurrency}, estágios: {slots}, jobs: {', '.join(JOB_HANDLERS)})")
+        while not self._stopping.is_set():
+            if len(self._active) >= self.concurrency:
+                await asyncio.wait(self._active, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            try:
+                async with AsyncSessionLocal() as db:
+                    job = await claim_job(db, self.worker_id)
+            except Exception as e:
+                print(f"[Worker {self.worker_id}] Erro ao buscar job: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._execute(job))
+            self._active.add(task)
+            task.add_done_callback(self._active.discard)
+
+        # Desligamento: espera os jobs em andamento. Se o processo for morto antes,
+        # o lease vence e outro worker retoma.
+        if self._active:
+            print(f"[Worker {self.worker_id}] Aguardando {len(self._active)} job(s) em andamento...")
+            await asyncio.wait(self._active)
+        print(f"[Worker {self.worker_id}] Pools por estágio: {stage_stats()}")
+        print(f"[Worker {self.worker_id}] Pool do banco: {pool_metrics.stats(engine.sync_engine.pool)}")
+        from app.services.circuit_breaker import breaker_stats
+        print(f"[Worker {self.worker_id}] Disjuntores: {breaker_stats()}")
+
+    async def _execute(self, job: Job):
+        handler = JOB_HANDLERS[job.kind]
+        print(f"[Worker {self.worker_id}] Job {job.id} ({job.kind}, faixa {LANES.get(job.priority, job.priority)}) tentativa {job.attempts}")
+        # Os pools por estágio atendem primeiro quem tem prioridade melhor (a task herda o contexto)
+        job_priority.set(job.priority)
+        ctx = JobContext(job.id, self.worker_id, job.attempts, job.max_attempts, job.deferrals)
+        current_job.set(ctx)
+        run = asyncio.create_task(handler(**job.payload))
+        error = None
+        cancelled = False
+        defer = None
+        last_beat = time.monotonic()
+        try:
+            while True:
+                # Pedido de cancelamento é conferido a cada JOB_CANCEL_POLL_INTERVAL;
+                # o lease é renovado a cada JOB_HEARTBEAT_INTERVAL.
+                done, _ = await asyncio.wait({run}, timeout=settings.JOB_CANCEL_POLL_INTERVAL)
+                if done:
+                    run.result()
+                    break
+                renew = time.monotonic() - last_beat >= settings.JOB_HEARTBEAT_INTERVAL
+                try:
+                    state = await _heartbeat(job.id, self.worker_id, renew)
+                except Exception as e:
+                    # Banco fora do ar: segue rodando; se não voltar, o lease vence
+                    print(f"[Worker {self.worker_id}] Heartbeat do job {job.id} falhou: {e}")
+                    continue
+                if renew:
+                    last_beat = time.monotonic()
+                if state == "ok":
+                    continue
+
+                # Interrompe o handler e espera a limpeza (ffmpeg morto, arquivo do Gemini apagado)
+                ctx.cancelled = True
+                run.cancel()
+                await asyncio.wait({run})
+                if state == "lost":
+                    print(f"[Worker {self.worker_id}] Lease do job {job.id} perdido; interrompido")
+                    return
+                print(f"[Worker {self.worker_id}] Job {job.id} cancelado; interrompido")
+                cancelled = True
+                break
+        except asyncio.CancelledError:
+            run.cancel()
+            raise
+        except JobCancelled as e:
+            # O próprio handler viu o cancelamento (ponto cooperativo ou UPDATE condicional)
+            print(f"[Worker {self.worker_id}] {e}")
+            cancelled = True
+        except JobDeferred as e:
+            error = f"{type(e).__name__}: {e}"
+            defer = e.delay
+            print(f"[Worker {self.worker_id}] Job {job.id} adiado {e.delay:.0f}s: {e}")
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"[Worker {self.worker_id}] Job {job.id} falhou: {error}")
+
+        await _finish(job.id, self.worker_id, error, cancelled, defer)
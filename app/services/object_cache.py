@@ -0,0 +1,169 @@
+import asyncio
+import fcntl
+import hashlib
+import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from app.core.config import settings
+from app.services.storage import async_storage
+
+
+class ObjectCache:
+    """
+    Cache local em disco (read-through) para objetos do MinIO usados pelos workers.
+
+    - Chave: nome do objeto + ETag (se o objeto mudar, o ETag muda e a entrada antiga
+      simplesmente deixa de ser usada até ser despejada).
+    - Preenchimento atômico: baixa para um arquivo temporário e faz os.replace.
+    - Despejo LRU por mtime (cada hit "toca" o arquivo) até caber em max_bytes.
+    - Arquivos em uso (pinados via open()) nunca são despejados, nem por outro processo
+      que divide o diretório: o pin é um flock compartilhado no arquivo e o despejo só
+      apaga com flock exclusivo.
+
+    Os arquivos devolvidos são compartilhados: trate-os como somente leitura.
+    """
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._fill_locks: dict[str, list] = {} # caminho -> [lock, interessados]
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.bytes_downloaded = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    def _local_path(self, object_name: str, etag: str) -> str:
+        digest = hashlib.sha256(f"{object_name}:{etag}".encode()).hexdigest()
+        ext = os.path.splitext(object_name)[1]
+        return os.path.join(self.root, f"{digest}{ext}")
+
+    @asynccontextmanager
+    async def open(self, object_path: str) -> AsyncIterator[str]:
+        """
+        Garante o objeto no disco local e devolve o caminho, pinado enquanto o bloco roda.
+        Uso: async with object_cache.open("bucket/video.webm") as path: ...
+        """
+        object_name = async_storage.object_name(object_path)
+        stat = await async_storage.stat_object(object_name)
+        path = self._local_path(object_name, stat["etag"])
+
+        fd = None
+        while fd is None:
+            await self._ensure(object_name, path, stat["size"])
+            fd = self._pin(path)
+        # Só depois do pin: o despejo não apaga o arquivo que acabamos de baixar.
+        # scandir/stat/unlink em thread: não bloqueiam o event loop com o diretório cheio
+        try:
+            await asyncio.to_thread(self._evict)
+            yield path
+        finally:
+            os.close(fd) # Solta o flock
+
+    def _pin(self, path: str) -> int | None:
+        """
+        flock compartilhado num descritor do arquivo, mantido enquanto o arquivo está em uso.
+        None se outro processo despejou o arquivo entre o _ensure e o lock (baixa de novo).
+        """
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        try:
+            # O despejo pode ter apagado o caminho enquanto esperávamos o lock
+            same = os.stat(path).st_ino == os.fstat(fd).st_ino
+        except FileNotFoundError:
+            same = False
+        if not same:
+            os.close(fd)
+            return None
+        return fd
+
+    async def _ensure(self, object_name: str, path: str, size: int):
+        # Um único download por arquivo, mesmo com vários jobs pedindo ao mesmo tempo.
+        # O lock sai do dict só quando o último interessado termina (também no download
+        # que falhou): quem chega enquanto há fila espera no mesmo lock
+        entry = self._fill_locks.setdefault(path, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if os.path.exists(path):
+                    os.utime(path) # LRU: marca como usado agora
+                    self.hits += 1
+                    self.bytes_saved += size
+                    return
+
+                self.misses += 1
+                tmp_path = os.path.join(self.root, f".{uuid.uuid4()}.part")
+                try:
+                    await async_storage.download_file(object_name, tmp_path)
+                    os.replace(tmp_path, path) # Atômico: ninguém vê arquivo pela metade
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                self.bytes_downloaded += size
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._fill_locks[path]
+
+    def _evict(self):
+        """Remove os arquivos menos usados recentemente até caber no limite."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.root):
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue # Despejado por outro processo depois do scandir
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if self._remove_unpinned(path):
+                total -= size
+
+    def _remove_unpinned(self, path: str) -> bool:
+        """Apaga o arquivo se ninguém (deste ou de outro processo) o tem pinado."""
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return True # Outro processo já despejou
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False # Pinado
+            try:
+                if os.stat(path).st_ino != os.fstat(fd).st_ino:
+                    return False # Substituído por um download novo depois do scandir
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return True
+        finally:
+            os.close(fd)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        used = sum(
+            e.stat().st_size for e in os.scandir(self.root)
+            if e.is_file() and not e.name.startswith(".")
+        )
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "bytes_downloaded": self.bytes_downloaded,
+            "used_bytes": used,
+            "max_bytes": self.max_bytes,
+        }
+
+# Instância única
+object_cache = ObjectCache(settings.OBJECT_CACHE_DIR, settings.OBJECT_CACHE_MAX_MB * 1024 * 1024)
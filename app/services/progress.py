@@ -0,0 +1,175 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from sqlalchemy import text
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+
+# Canal do Postgres por onde o worker (outro processo) avisa a API
+CHANNEL = "chapter_progress"
+
+# Estágios do processamento e o percentual em que cada um começa
+STAGES = {
+    "queued": 0,
+    "started": 2,
+    "download": 5,
+    "proxy": 15,
+    "gemini_upload": 30,
+    "gemini_wait": 40,
+    "generate": 55,
+    "tts": 70,
+    "stitch": 10,
+    "save": 95,
+    "done": 100,
+    "failed": 100,
+    "cancelled": 100,
+}
+TERMINAL = {"done", "failed", "cancelled"}
+
+# Capítulo do job em execução: os serviços (IA, TTS) reportam sem receber o ID
+current_chapter: ContextVar[int | None] = ContextVar("current_chapter", default=None)
+
+
+def _event(chapter_id: int, stage: str, percent: float | None, extra: dict) -> dict:
+    return {
+        "chapter_id": chapter_id,
+        "stage": stage,
+        "percent": round(STAGES.get(stage, 0) if percent is None else percent, 1),
+        "at": time.time(),
+        **extra,
+    }
+
+
+def status_event(chapter_id: int, status: str) -> dict:
+    """Estado atual a partir do status do capítulo (para quem conecta sem evento em memória)."""
+    stage = {"PENDING": "queued", "PROCESSING": "queued", "FAILED": "failed"}.get(status, "done")
+    return _event(chapter_id, stage, None, {"status": status})
+
+
+async def notify(db, chapter_id: int, stage: str, percent: float | None = None, **extra):
+    """
+    Enfileira o evento na transação da sessão: o Postgres só entrega o NOTIFY no commit,
+    então quem recebe o evento já enxerga a mudança de status no banco.
+    """
+    event = _event(chapter_id, stage, percent, extra)
+    await db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": json.dumps(event)})
+
+
+async def report(stage: str, percent: float | None = None, chapter_id: int | None = None, **extra):
+    """
+    Publica a transição de estágio do capítulo do job atual (NOTIFY numa sessão curta).
+    Progresso é informativo: se o banco falhar aqui, o job segue.
+    """
+    chapter_id = chapter_id if chapter_id is not None else current_chapter.get()
+    if chapter_id is None:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            await notify(db, chapter_id, stage, percent, **extra)
+            await db.commit()
+    except Exception as e:
+        print(f"[Progress] Falha ao publicar progresso do capítulo {chapter_id}: {e}")
+
+
+class ProgressBus:
+    """
+    Barramento em memória da API: uma conexão dedicada faz LISTEN no canal e
+    distribui cada evento para as filas dos streams (SSE) que observam o capítulo.
+    Um stream pode observar vários capítulos; o último evento de cada capítulo
+    fica guardado para quem conectar no meio do processamento.
+    """
+    def __init__(self, max_last: int = 1000, queue_size: int = 100):
+        self.max_last = max_last
+        self.queue_size = queue_size
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+        self._last: OrderedDict[int, dict] = OrderedDict()
+        self._task: asyncio.Task | None = None
+        self.received = 0
+        self.dropped = 0
+
+    def subscribe(self, chapter_ids: set[int]) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        for chapter_id in chapter_ids:
+            self._subscribers.setdefault(chapter_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue, chapter_ids: set[int]):
+        for chapter_id in chapter_ids:
+            queues = self._subscribers.get(chapter_id)
+            if queues:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[chapter_id]
+
+    def last(self, chapter_id: int) -> dict | None:
+        return self._last.get(chapter_id)
+
+    def dispatch(self, event: dict):
+        chapter_id = event["chapter_id"]
+        self.received += 1
+        self._last[chapter_id] = event
+        self._last.move_to_end(chapter_id)
+        while len(self._last) > self.max_last:
+            self._last.popitem(last=False)
+        for queue in self._subscribers.get(chapter_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Cliente lento: perde eventos intermediários, o próximo traz o estado atual
+                self.dropped += 1
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            self.dispatch(json.loads(payload))
+        except (ValueError, KeyError) as e:
+            print(f"[Progress] Evento inválido no canal {channel}: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        # Conexão própria (fora do pool): o LISTEN precisa dela aberta o tempo todo
+        import asyncpg
+        dsn = settings.SQLALCHEMY_DATABASE_URI.replace("postgresql+asyncpg://", "postgresql://")
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _: lost.set())
+                await connection.add_listener(CHANNEL, self._on_notify)
+                print(f"[Progress] Escutando o canal {CHANNEL}")
+                await lost.wait()
+                print("[Progress] Conexão do LISTEN caiu; reconectando")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Progress] Erro no LISTEN: {e}")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(5)
+
+    def stats(self) -> dict:
+        return {
+            "listening": self._task is not None and not self._task.done(),
+            "watched_chapters": len(self._subscribers),
+            "streams": len({id(q) for queues in self._subscribers.values() for q in queues}),
+            "received": self.received,
+            "dropped": self.dropped,
+        }
+
+
+progress_bus = ProgressBus()
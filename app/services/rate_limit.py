@@ -0,0 +1,160 @@
+import asyncio
+import random
+import re
+import time
+from collections import deque
+from datetime import timedelta
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.rate_limit import RateLimitBucket
+from app.services.jobs import JobDeferred
+
+# Horário do banco em UTC (sem fuso, como as outras colunas DateTime): todos os workers
+# usam o mesmo relógio, sem depender do relógio de cada nó
+DB_NOW = func.timezone("utc", func.now())
+
+
+class RateLimited(JobDeferred):
+    """Cota do provedor esgotada por mais tempo do que vale esperar dentro do job: volta para a fila."""
+
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """
+    Quanto o provedor pediu para esperar: RetryInfo nos detalhes do erro (gRPC) ou
+    "retry in 12.5s" / "retry_delay { seconds: 12 }" na mensagem (REST).
+    """
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    message = str(error)
+    match = re.search(r"retry in ([\d.]+)\s*s", message, re.IGNORECASE) or re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", message)
+    return float(match.group(1)) if match else None
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Backoff exponencial com jitter total (attempt começa em 0)."""
+    cap = min(settings.GEMINI_BACKOFF_MAX_SECONDS, settings.GEMINI_BACKOFF_BASE_SECONDS * 2 ** attempt)
+    return random.uniform(cap / 2, cap)
+
+
+class SharedTokenBucket:
+    """
+    Token bucket guardado no Postgres (tabela rate_limits), compartilhado por todos os workers:
+    o limite vale para o cluster, não por processo. Retirar um token é um único UPDATE
+    condicional (reabastece pelo tempo decorrido e desconta 1), sem lock entre workers.
+    """
+    def __init__(self, name: str, rate_per_minute: float, burst: int):
+        self.name = name
+        self.rate = rate_per_minute / 60
+        self.capacity = float(max(1, burst))
+        self.acquired = 0
+        self.deferred = 0
+        self.throttled = 0
+        self._wait_ms = deque(maxlen=1000)
+
+    def _refilled(self):
+        elapsed = func.extract("epoch", DB_NOW - RateLimitBucket.updated_at)
+        return func.least(self.capacity, RateLimitBucket.tokens + elapsed * self.rate)
+
+    async def _take(self) -> float:
+        """Tenta retirar um token. Retorna 0 se conseguiu, senão quantos segundos faltam."""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(RateLimitBucket)
+                .where(
+                    RateLimitBucket.name == self.name,
+                    self._refilled() >= 1,
+                    or_(RateLimitBucket.blocked_until.is_(None), RateLimitBucket.blocked_until <= DB_NOW)
+                )
+                .values(tokens=self._refilled() - 1, updated_at=DB_NOW)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount:
+                await db.commit()
+                return 0.0
+
+            row = (await db.execute(
+                select(self._refilled(), RateLimitBucket.blocked_until, DB_NOW).where(RateLimitBucket.name == self.name)
+            )).first()
+            if row is None:
+                # Primeiro uso: bucket cheio
+                await db.execute(
+                    insert(RateLimitBucket)
+                    .values(name=self.name, tokens=self.capacity, updated_at=DB_NOW, throttled=0)
+                    .on_conflict_do_nothing(index_elements=["name"])
+                )
+                await db.commit()
+                return 0.05
+            await db.commit()
+
+        tokens, blocked_until, now = row
+        blocked = (blocked_until - now).total_seconds() if blocked_until else 0.0
+        return max(blocked, (1 - tokens) / self.rate, 0.05)
+
+    async def acquire(self, max_wait: float):
+        """
+        Espera um token por até max_wait segundos. Se a espera necessária passar disso,
+        levanta RateLimited para o job voltar à fila em vez de ocupar o worker.
+        """
+        started = time.monotonic()
+        while True:
+            try:
+                wait = await self._take()
+            except Exception as e:
+                # Banco indisponível: não trava a IA por causa do limitador
+                print(f"[RateLimit] {self.name}: falha ao consultar o bucket ({e}); seguindo sem limite")
+                wait = 0.0
+            if wait == 0:
+                self.acquired += 1
+                self._wait_ms.append((time.monotonic() - started) * 1000)
+                return
+            waited = time.monotonic() - started
+            if waited + wait > max_wait:
+                self.deferred += 1
+                raise RateLimited(f"Limite de taxa '{self.name}': próximo token em {wait:.1f}s", wait)
+            # Jitter: workers acordando juntos não disputam o mesmo token
+            await asyncio.sleep(wait + random.uniform(0, min(1.0, wait)))
+
+    async def block(self, seconds: float):
+        """O provedor respondeu 429: ninguém chama de novo antes de `seconds` (vale para todos os workers)."""
+        self.throttled += 1
+        until = DB_NOW + timedelta(seconds=seconds)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(RateLimitBucket)
+                    .where(RateLimitBucket.name == self.name)
+                    .values(
+                        blocked_until=func.greatest(func.coalesce(RateLimitBucket.blocked_until, until), until),
+                        tokens=0,
+                        updated_at=DB_NOW,
+                        throttled=RateLimitBucket.throttled + 1
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+        except Exception as e:
+            print(f"[RateLimit] {self.name}: falha ao registrar bloqueio ({e})")
+
+    def stats(self) -> dict:
+        ordered = sorted(self._wait_ms)
+
+        def p(q):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 1) if ordered else 0.0
+
+        return {
+            "rate_per_minute": round(self.rate * 60, 2),
+            "burst": int(self.capacity),
+            "acquired": self.acquired,
+            "deferred": self.deferred,
+            "throttled": self.throttled,
+            "wait_ms_p50": p(0.5),
+            "wait_ms_p95": p(0.95),
+        }
+
+
+# Chamadas de análise (generate_content) ao Gemini, somando todos os workers
+gemini_limiter = SharedTokenBucket("gemini", settings.GEMINI_REQUESTS_PER_MINUTE, settings.GEMINI_BURST)
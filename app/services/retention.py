@@ -0,0 +1,239 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, or_, select
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.chapter import Chapter
+from app.models.video_hash import VideoHash
+from app.models.job import PRIORITY_MAINTENANCE
+from app.services.jobs import enqueue, ARCHIVE_RAW
+from app.services.stages import run_ffmpeg
+from app.services.storage import async_storage
+
+
+def _low_priority_prefix() -> list[str]:
+    """nice/ionice para o re-encode não competir com os jobs interativos."""
+    prefix = []
+    if shutil.which("nice"):
+        prefix += ["nice", "-n", "19"]
+    if shutil.which("ionice"):
+        prefix += ["ionice", "-c", "3"]
+    return prefix
+
+
+def _archive_key(raw_key: str) -> str:
+    stem = os.path.splitext(os.path.basename(raw_key))[0]
+    return f"archive/{stem}.mp4"
+
+
+class RawRetention:
+    """
+    Retenção dos originais brutos (WebM VP9) de capítulos já publicados com vídeo final.
+    Depois de RAW_RETENTION_DAYS, o original é re-encodado num perfil de arquivo
+    (H.264 CRF alto, no máximo RAW_ARCHIVE_MAX_HEIGHT linhas) ou descartado (mode "drop").
+    A passada periódica (na API) só enfileira um job ARCHIVE_RAW por original, na faixa de
+    manutenção; o re-encode roda nos workers (archive_chapter), com prioridade baixa de CPU/IO.
+    """
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.last_run: dict | None = None
+
+    async def _candidates(self) -> list[tuple[int, str]]:
+        """(capítulo, original) vencidos, do mais antigo para o mais novo."""
+        cutoff = datetime.utcnow() - timedelta(days=settings.RAW_RETENTION_DAYS)
+        async with AsyncSessionLocal() as db:
+            stmt = (
+                select(Chapter.id, Chapter.raw_video_url)
+                .where(
+                    Chapter.status == "COMPLETED",
+                    Chapter.stitched_video_url.is_not(None),
+                    Chapter.raw_video_url.is_not(None),
+                    Chapter.raw_video_url != Chapter.stitched_video_url,
+                    Chapter.raw_archived_at.is_(None),
+                    Chapter.created_at < cutoff
+                )
+                .order_by(Chapter.created_at)
+            )
+            return [tuple(row) for row in (await db.execute(stmt)).all()]
+
+    async def _shared_with(self, raw_key: str) -> list[int] | None:
+        """
+        Capítulos que compartilham o original (deduplicação por hash).
+        None se algum deles ainda depende do original (não publicado / tocando o bruto).
+        """
+        name = async_storage.object_name(raw_key)
+        paths = [name, f"{async_storage.bucket_name}/{name}"]
+        async with AsyncSessionLocal() as db:
+            in_use = await db.scalar(
+                select(Chapter.id).where(or_(
+                    Chapter.video_url.in_(paths),
+                    Chapter.stitched_video_url.in_(paths),
+                    Chapter.raw_video_url.in_(paths) & (Chapter.status != "COMPLETED")
+                )).limit(1)
+            )
+            if in_use is not None:
+                return None
+            return list((await db.scalars(
+                select(Chapter.id).where(Chapter.raw_video_url.in_(paths)).order_by(Chapter.id)
+            )).all())
+
+    async def _recompress(self, raw_key: str, temp_dir: str) -> str:
+        src = os.path.join(temp_dir, "raw" + os.path.splitext(raw_key)[1])
+        out = os.path.join(temp_dir, "archive.mp4")
+        await async_storage.download_file(raw_key, src)
+
+        cmd = _low_priority_prefix() + [
+            "ffmpeg", "-hide_banner", "-y",
+            "-i", src,
+            "-vf", f"scale=-2:'min({settings.RAW_ARCHIVE_MAX_HEIGHT},ih)'",
+            "-c:v", "libx264", "-preset", "slow", "-crf", str(settings.RAW_ARCHIVE_CRF),
+            "-c:a", "aac", "-b:a", "64k",
+            "-threads", "2",
+            "-movflags", "+faststart",
+            out
+        ]
+        returncode, stderr = await run_ffmpeg(cmd)
+        if returncode != 0:
+            raise RuntimeError(f"FFmpeg falhou ao recomprimir {raw_key}: {stderr.decode()[-500:]}")
+        return out
+
+    async def archive_chapter(self, chapter_id: int) -> int:
+        """
+        Aplica a retenção ao original de um capítulo (handler do job ARCHIVE_RAW, no worker).
+        Retorna os bytes economizados.
+        """
+        async with AsyncSessionLocal() as db:
+            chapter = await db.get(Chapter, chapter_id)
+            # Já arquivado (ex.: por outro capítulo que compartilha o original)
+            raw_key = chapter.raw_video_url if chapter and chapter.raw_archived_at is None else None
+        if not raw_key:
+            return 0
+
+        chapter_ids = await self._shared_with(raw_key)
+        if not chapter_ids:
+            print(f"[Retention] Original {raw_key} ainda em uso; capítulo {chapter_id} fica para depois")
+            return 0
+
+        original_size = (await async_storage.stat_object(raw_key))["size"]
+        new_key = None
+        saved = original_size
+
+        if settings.RAW_RETENTION_MODE == "recompress":
+            with tempfile.TemporaryDirectory() as temp_dir:
+                archive_path = await self._recompress(raw_key, temp_dir)
+                archive_size = os.path.getsize(archive_path)
+                if archive_size < original_size:
+                    new_key = _archive_key(raw_key)
+                    await async_storage.upload_file(archive_path, new_key, "video/mp4")
+                    new_key = f"{async_storage.bucket_name}/{new_key}"
+                    saved = original_size - archive_size
+                else:
+                    # Já era pequeno: mantém o original e não tenta de novo
+                    new_key = raw_key
+                    saved = 0
+
+        # Banco primeiro, storage depois: se cair no meio, sobra só um órfão para o GC
+        name = async_storage.object_name(raw_key)
+        async with AsyncSessionLocal() as db:
+            chapters = (await db.scalars(
+                select(Chapter).where(Chapter.id.in_(chapter_ids), Chapter.raw_archived_at.is_(None))
+            )).all()
+            now = datetime.utcnow()
+            for i, chap in enumerate(chapters):
+                chap.raw_video_url = new_key
+                chap.raw_archived_at = now
+                # A economia é contada uma vez só, no primeiro capítulo que compartilha o original
+                chap.raw_bytes_saved = saved if i == 0 else 0
+            if new_key != raw_key:
+                # O hash é do conteúdo original; a cópia de arquivo não serve para deduplicar
+                await db.execute(delete(VideoHash).where(
+                    VideoHash.video_url.in_([name, f"{async_storage.bucket_name}/{name}"])
+                ))
+            await db.commit()
+
+        if new_key != raw_key:
+            await async_storage.remove_object(raw_key)
+
+        print(f"[Retention] Capítulo {chapter_id}: {raw_key} -> {new_key or 'descartado'} ({saved} bytes economizados)")
+        return saved
+
+    async def run_once(self) -> dict:
+        """
+        Enfileira um job de retenção por original vencido (faixa de manutenção).
+        Capítulos que compartilham o original (deduplicação) geram um job só; job já
+        na fila para o capítulo não é duplicado. Nada de ffmpeg no processo da API.
+        """
+        report = {
+            "mode": settings.RAW_RETENTION_MODE,
+            "started_at": datetime.utcnow().isoformat(),
+            "originals": 0,
+            "enqueued": 0,
+            "already_queued": 0,
+        }
+        seen = set()
+        async with AsyncSessionLocal() as db:
+            for chapter_id, raw_key in await self._candidates():
+                if raw_key in seen:
+                    continue
+                seen.add(raw_key)
+                report["originals"] += 1
+                _, created = await enqueue(
+                    db, ARCHIVE_RAW, {"chapter_id": chapter_id},
+                    chapter_id=chapter_id, priority=PRIORITY_MAINTENANCE
+                )
+                report["enqueued" if created else "already_queued"] += 1
+        report["finished_at"] = datetime.utcnow().isoformat()
+        self.last_run = report
+        print(f"[Retention] {report['enqueued']} job(s) de retenção enfileirado(s) ({report['originals']} original(is) vencido(s))")
+        return report
+
+    async def summary(self) -> dict:
+        """Bytes economizados por capítulo e no total (para dimensionar o volume do MinIO)."""
+        async with AsyncSessionLocal() as db:
+            totals = (await db.execute(
+                select(func.count(Chapter.id), func.coalesce(func.sum(Chapter.raw_bytes_saved), 0))
+                .where(Chapter.raw_archived_at.is_not(None))
+            )).one()
+            per_chapter = (await db.execute(
+                select(Chapter.id, Chapter.title, Chapter.raw_video_url, Chapter.raw_archived_at, Chapter.raw_bytes_saved)
+                .where(Chapter.raw_archived_at.is_not(None))
+                .order_by(Chapter.raw_bytes_saved.desc())
+                .limit(50)
+            )).all()
+        return {
+            "archived_chapters": totals[0],
+            "total_bytes_saved": int(totals[1]),
+            "pending_chapters": len(await self._candidates()),
+            "last_run": self.last_run,
+            "top_chapters": [
+                {"id": r[0], "title": r[1], "raw_video_url": r[2], "archived_at": r[3], "bytes_saved": r[4]}
+                for r in per_chapter
+            ],
+        }
+
+    def start(self):
+        if self._task is None and settings.RAW_RETENTION_INTERVAL_HOURS > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.RAW_RETENTION_INTERVAL_HOURS * 3600)
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[Retention] Erro na passada: {e}")
+
+# Instância única
+raw_retention = RawRetention()
@@ -0,0 +1,174 @@
+import asyncio
+import heapq
+import itertools
+import os
+import signal
+import subprocess
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from app.core.config import settings
+from app.models.job import LANES, PRIORITY_INTERACTIVE
+from app.services import job_metrics
+
+# Prioridade (faixa) de quem está pedindo a vaga. O JobWorker define a do job;
+# fora de um job (request da API) vale a interativa.
+job_priority: ContextVar[int] = ContextVar("job_priority", default=PRIORITY_INTERACTIVE)
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class StagePool:
+    """
+    Limite de concorrência de um estágio do pipeline (ffmpeg, IA, TTS).
+    Cada job passa pelos estágios em sequência, mas só ocupa a vaga do estágio
+    em que está: com vários jobs no worker, um faz ffmpeg enquanto outro espera
+    o Gemini e outro gera áudio, sem estourar CPU nem cota de provedor.
+    Vaga liberada vai para o próximo da fila de maior prioridade (job_priority), FIFO entre iguais.
+    As chamadas bloqueantes do estágio rodam num executor próprio (threads > 0).
+    """
+    def __init__(self, name: str, slots: int, threads: int = 0):
+        self.name = name
+        self.slots = max(1, slots)
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"stage-{name}") if threads else None
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._waiting = 0
+        self._active = 0
+        self._calls = 0
+        self._errors = 0
+        self._wait_ms: dict[int, deque] = defaultdict(lambda: deque(maxlen=1000))
+        self._busy_ms = deque(maxlen=1000)
+
+    async def _acquire(self, priority: int):
+        if self._active < self.slots and not self._waiting:
+            self._active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        self._waiting += 1
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # A vaga chegou junto com o cancelamento: devolve
+                self._release()
+            else:
+                self._waiting -= 1
+            raise
+
+    def _release(self):
+        # Entrega a vaga direto ao próximo (o contador de ativos não muda)
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                self._waiting -= 1
+                fut.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        """Ocupa uma vaga do estágio enquanto o bloco roda."""
+        priority = job_priority.get()
+        queued = time.monotonic()
+        await self._acquire(priority)
+        started = time.monotonic()
+        self._wait_ms[priority].append((started - queued) * 1000)
+        try:
+            yield
+        except BaseException:
+            self._errors += 1
+            raise
+        finally:
+            self._calls += 1
+            self._busy_ms.append((time.monotonic() - started) * 1000)
+            self._release()
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        """Executa uma função bloqueante no executor do estágio (o chamador já está num slot)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    async def run(self, fn, *args, **kwargs):
+        """Slot + executor: para chamadas bloqueantes avulsas."""
+        async with self.slot():
+            return await self.run_blocking(fn, *args, **kwargs)
+
+    def stats(self) -> dict:
+        def p(values, q):
+            if not values:
+                return 0.0
+            ordered = sorted(values)
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 1)
+
+        return {
+            "slots": self.slots,
+            "active": self._active,
+            "waiting": self._waiting,
+            "calls": self._calls,
+            "errors": self._errors,
+            "wait_ms_by_lane": {
+                LANES.get(priority, str(priority)): {"p50": p(values, 0.5), "p95": p(values, 0.95), "samples": len(values)}
+                for priority, values in sorted(self._wait_ms.items())
+            },
+            "busy_ms_p50": p(self._busy_ms, 0.5),
+            "busy_ms_p95": p(self._busy_ms, 0.95),
+        }
+
+
+# ffmpeg: CPU. Cada processo usa FFMPEG_THREADS threads, então cabem núcleos / threads por vez.
+FFMPEG_SLOTS = settings.FFMPEG_CONCURRENCY or max(1, _cpu_count() // max(1, settings.FFMPEG_THREADS))
+# As threads só esperam o processo terminar (os.wait4), uma por vaga
+ffmpeg_pool = StagePool("ffmpeg", FFMPEG_SLOTS, threads=FFMPEG_SLOTS)
+# IA (upload/poll/generate no Gemini): limitado pela cota do provedor, não pela máquina
+ai_pool = StagePool("ai", settings.AI_CONCURRENCY, threads=settings.AI_CONCURRENCY)
+# TTS: I/O (Edge-TTS é async; gTTS e a leitura da duração do MP3 são bloqueantes)
+tts_pool = StagePool("tts", settings.TTS_CONCURRENCY, threads=settings.TTS_CONCURRENCY)
+
+STAGE_POOLS = {pool.name: pool for pool in (ffmpeg_pool, ai_pool, tts_pool)}
+
+
+def _wait_process(proc: subprocess.Popen):
+    """Lê o stderr e colhe o processo com os.wait4, que devolve o uso de recursos só deste filho."""
+    stderr = proc.stderr.read()
+    proc.stderr.close()
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, stderr, usage
+
+
+async def run_ffmpeg(cmd: list[str]) -> tuple[int, bytes]:
+    """
+    Roda um comando ffmpeg (lista completa, com nice/ionice se for o caso) numa vaga
+    do pool de CPU. Retorna (returncode, stderr). Se a task for cancelada, o processo é morto.
+    CPU e RSS máximo do processo vão para as métricas do job em execução.
+    """
+    async with ffmpeg_pool.slot():
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        wait = asyncio.ensure_future(ffmpeg_pool.run_blocking(_wait_process, proc))
+        try:
+            returncode, stderr, usage = await asyncio.shield(wait)
+        except asyncio.CancelledError:
+            # Job cancelado: o ffmpeg não pode continuar queimando CPU sozinho
+            # (os.kill direto: Popen.kill faria poll() e colheria o processo antes do wait4)
+            if proc.returncode is None:
+                try:
+                    os.kill(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            await wait
+            raise
+        job_metrics.record_child(usage)
+        return returncode, stderr
+
+
+def stage_stats() -> dict:
+    return {name: pool.stats() for name, pool in STAGE_POOLS.items()}
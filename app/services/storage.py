@@ -1,91 +1,409 @@
 from datetime import timedelta
-from minio import Minio
-from minio.error import S3Error
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
 from app.core.config import settings
+from app.services.storage_backends import StorageBackend, create_backend
+import asyncio
+import hashlib
 import io
+import threading
+import time
+from typing import AsyncIterator, BinaryIO
+
+class PresignCache:
+    """
+    Cache LRU de URLs assinadas (GET).
+    Chave: (objeto, validade pedida). Uma URL em cache só é servida enquanto
+    ainda tiver pelo menos `min_remaining` segundos de vida; assim o navegador
+    nunca recebe uma URL prestes a expirar.
+    """
+    def __init__(self, max_entries: int, min_remaining: int):
+        self.max_entries = max_entries
+        self.min_remaining = min_remaining
+        self._entries: OrderedDict[tuple[str, int], tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, object_name: str, expiration_seconds: int) -> str | None:
+        key = (object_name, expiration_seconds)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] - time.time() >= min(self.min_remaining, expiration_seconds / 2):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[key] # Perto de expirar: assina de novo
+            self.misses += 1
+            return None
+
+    def put(self, object_name: str, expiration_seconds: int, url: str, signed_at: float):
+        key = (object_name, expiration_seconds)
+        with self._lock:
+            self._entries[key] = (url, signed_at + expiration_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, object_name: str):
+        """Remove todas as URLs de um objeto (ex: objeto apagado)."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == object_name]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "evictions": self.evictions,
+            }
 
 class StorageService:
-    def __init__(self):
-        self.client = Minio(
-            settings.MINIO_ENDPOINT,
-            access_key=settings.MINIO_ACCESS_KEY,
-            secret_key=settings.MINIO_SECRET_KEY,
-            secure=settings.MINIO_SECURE
+    """
+    Operações de armazenamento usadas pela aplicação.
+    O trabalho de verdade é feito pelo backend configurado (MinIO, disco local ou memória).
+    """
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+        self.bucket_name = backend.bucket_name
+        self.presign_cache = PresignCache(
+            settings.PRESIGN_CACHE_SIZE,
+            settings.PRESIGN_CACHE_MIN_REMAINING_SECONDS
         )
-        self.bucket_name = settings.MINIO_BUCKET_RAW
-        self._ensure_bucket_exists()
 
-    def _ensure_bucket_exists(self):
-        """Verifica se o bucket existe, se não, cria."""
-        try:
-            if not self.client.bucket_exists(self.bucket_name):
-                self.client.make_bucket(self.bucket_name)
-                print(f"Bucket '{self.bucket_name}' criado com sucesso.")
-        except S3Error as e:
-            print(f"Erro ao verificar/criar bucket: {e}")
+    def object_name(self, path: str) -> str:
+        """
+        Converte o caminho salvo no banco no nome do objeto dentro do bucket.
+        Ex: "documentacao/audio/xyz.mp3" -> "audio/xyz.mp3" (remove só o bucket do início).
+        """
+        prefix = f"{self.bucket_name}/"
+        return path[len(prefix):] if path.startswith(prefix) else path
+
+    def ensure_ready(self):
+        """Verifica/cria o bucket. Chamado no startup da aplicação (não no import)."""
+        self.backend.ensure_ready()
 
     def save_video(self, file_data: bytes, filename: str, content_type: str) -> str:
         """
-        Envia o arquivo para o MinIO e retorna a URL (ou path).
+        Envia o arquivo para o storage e retorna o path (bucket/arquivo).
         """
         try:
             # Converte bytes para stream (file-like object)
-            file_stream = io.BytesIO(file_data)
-            
-            self.client.put_object(
-                self.bucket_name,
-                filename,
-                file_stream,
-                length=len(file_data),
-                content_type=content_type
-            )
-            
-            # Monta a URL de acesso (assumindo bucket público ou uso interno)
-            # Para simplificar, retornamos o path relativo (bucket/arquivo)
-            # ou a URL completa se preferir.
+            self.backend.put(filename, io.BytesIO(file_data), len(file_data), content_type)
             return f"{self.bucket_name}/{filename}"
-            
-        except S3Error as e:
-            print(f"Erro ao salvar no MinIO: {e}")
+
+        except Exception as e:
+            print(f"Erro ao salvar no storage: {e}")
+            raise e
+
+    def save_stream(self, stream: BinaryIO, filename: str, content_type: str, part_size: int) -> str:
+        """
+        Envia um stream (file-like) para o storage em partes,
+        sem carregar o arquivo inteiro em memória.
+        """
+        try:
+            self.backend.put(filename, stream, -1, content_type, part_size=part_size)
+            return f"{self.bucket_name}/{filename}"
+
+        except Exception as e:
+            print(f"Erro ao salvar stream no storage: {e}")
+            raise e
+
+    # --- Multipart manual (uploads retomáveis) ---
+
+    def create_multipart_upload(self, filename: str, content_type: str) -> str:
+        """Inicia um multipart upload e retorna o upload_id."""
+        return self.backend.create_multipart(filename, content_type)
+
+    def upload_part(self, filename: str, upload_id: str, part_number: int, data: bytes) -> str:
+        """Envia uma parte (part_number começa em 1) e retorna o ETag."""
+        return self.backend.upload_part(filename, upload_id, part_number, data)
+
+    def complete_multipart_upload(self, filename: str, upload_id: str, parts: list[dict]) -> str:
+        """Junta as partes enviadas no objeto final. parts: [{"part_number", "etag"}]."""
+        self.backend.complete_multipart(filename, upload_id, parts)
+        return f"{self.bucket_name}/{filename}"
+
+    def abort_multipart_upload(self, filename: str, upload_id: str):
+        """Descarta as partes de um multipart upload não finalizado."""
+        try:
+            self.backend.abort_multipart(filename, upload_id)
+        except Exception as e:
+            print(f"Erro ao abortar multipart upload: {e}")
+
+    def get_presigned_put_url(self, filename: str, expiration_seconds: int = 3600) -> str:
+        """
+        URL assinada para o navegador enviar o arquivo direto ao MinIO (PUT).
+        Levanta NotImplementedError em backends sem upload direto.
+        """
+        url = self.backend.presign_put(filename, timedelta(seconds=expiration_seconds))
+        return self._public_url(url)
+
+    def get_presigned_part_url(self, filename: str, upload_id: str, part_number: int, expiration_seconds: int = 3600) -> str:
+        """URL assinada para enviar uma parte de um multipart upload direto ao MinIO."""
+        url = self.backend.presign_part(
+            filename, upload_id, part_number, timedelta(seconds=expiration_seconds)
+        )
+        return self._public_url(url)
+
+    def stat_object(self, filename: str) -> dict:
+        """Metadados do objeto (tamanho, content-type, etag) sem baixar o conteúdo."""
+        return self.backend.stat(self.object_name(filename))
+
+    def hash_object(self, filename: str, chunk_size: int = 1024 * 1024) -> tuple[str, int]:
+        """Calcula o SHA-256 de um objeto lendo-o em streaming. Retorna (sha256, tamanho)."""
+        hasher = hashlib.sha256()
+        size = 0
+        response = self.get_object(filename)
+        try:
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                size += len(chunk)
+        finally:
+            response.close()
+            response.release_conn()
+        return hasher.hexdigest(), size
+
+    def remove_object(self, filename: str):
+        """Remove um objeto do bucket."""
+        self.backend.delete(self.object_name(filename))
+        self.presign_cache.invalidate(self.object_name(filename))
+
+    def list_objects(self, prefix: str = ""):
+        """Itera sobre os objetos do bucket (paginado, sem carregar a listagem inteira)."""
+        return self.backend.list_objects(prefix)
+
+    def remove_objects(self, filenames: list[str]) -> list[str]:
+        """Remove vários objetos de uma vez (multi-object delete). Retorna os que falharam."""
+        names = [self.object_name(f) for f in filenames]
+        failed = self.backend.delete_many(names)
+        for name in names:
+            self.presign_cache.invalidate(name)
+        return failed
+
+    def upload_file(self, file_path: str, filename: str, content_type: str, metadata: dict | None = None) -> str:
+        """
+        Envia um arquivo do disco local para o storage (multipart automático no MinIO).
+        metadata aceita headers HTTP padrão (ex: Cache-Control), devolvidos pelo /stream.
+        """
+        try:
+            self.backend.put_file(filename, file_path, content_type, metadata=metadata)
+            return f"{self.bucket_name}/{filename}"
+        except Exception as e:
+            print(f"Erro ao enviar arquivo ao storage: {e}")
             raise e
 
     def download_file(self, object_name: str, dest_path: str):
-        """Baixa um arquivo do MinIO para o disco local."""
+        """Baixa um arquivo do storage para o disco local."""
         try:
-            # object_name pode vir como 'bucket/arquivo.ext', precisamos só do 'arquivo.ext'
-            # se estivermos usando sempre o self.bucket_name
-            actual_object_name = object_name.split("/")[-1]
-            
-            self.client.fget_object(
-                self.bucket_name,
-                actual_object_name,
-                dest_path
-            )
+            # object_name pode vir como 'bucket/arquivo.ext'; removemos só o bucket
+            self.backend.get_file(self.object_name(object_name), dest_path)
             return dest_path
-        except S3Error as e:
-            print(f"Erro ao baixar do MinIO: {e}")
+        except Exception as e:
+            print(f"Erro ao baixar do storage: {e}")
             raise e
 
+    def get_object(self, filename: str, offset: int = 0, length: int = 0):
+        """
+        Abre o objeto para leitura em streaming (read/close/release_conn). Feche após o uso.
+        offset/length leem só um trecho (length=0 vai até o fim).
+        """
+        return self.backend.get(self.object_name(filename), offset=offset, length=length)
+
     def get_presigned_url(self, filename: str, expiration_seconds: int = 3600) -> str:
         """Gera uma URL temporária assinada para visualização."""
+        # Se o filename vier com o bucket (formato antigo/hardcoded), remove
+        # Ex: documentacao/arquivo.webm -> arquivo.webm
+        filename = self.object_name(filename)
+
+        # A URL continua válida por uma hora: reaproveita a assinatura (HMAC)
+        cached = self.presign_cache.get(filename, expiration_seconds)
+        if cached:
+            return cached
+        return self.sign_url(filename, expiration_seconds)
+
+    def sign_url(self, filename: str, expiration_seconds: int) -> str:
+        """Assina a URL de GET (sem consultar o cache) e guarda o resultado no cache."""
         try:
-            # Se o filename vier com o bucket (formato antigo/hardcoded), remove
-            # Ex: documentacao/arquivo.webm -> arquivo.webm
-            if "/" in filename:
-                filename = filename.split("/")[-1]
-
-            url = self.client.presigned_get_object(
-                self.bucket_name,
-                filename,
-                expires=timedelta(seconds=expiration_seconds)
-            )
-            
-            # Hack para desenvolvimento local (Docker -> Browser)
-            # O container vê 'minio' ou 'host.docker.internal', mas o browser quer 'localhost'
-            return url.replace("minio:9000", "localhost:9000").replace("host.docker.internal:9000", "localhost:9000")
-        except S3Error as e:
+            signed_at = time.time()
+            url = self._public_url(self.backend.presign_get(
+                filename, timedelta(seconds=expiration_seconds)
+            ))
+            self.presign_cache.put(filename, expiration_seconds, url, signed_at)
+            return url
+        except Exception as e:
             print(f"Erro ao gerar URL assinada: {e}")
             return ""
 
+    def _public_url(self, url: str) -> str:
+        # Hack para desenvolvimento local (Docker -> Browser)
+        # O container vê 'minio' ou 'host.docker.internal', mas o browser quer 'localhost'
+        return url.replace("minio:9000", "localhost:9000").replace("host.docker.internal:9000", "localhost:9000")
+
+
+class AsyncStorageService:
+    """
+    Fachada assíncrona do StorageService.
+    As chamadas dos backends (minio-py, disco) são síncronas (bloqueiam o event loop), então rodam
+    num pool de threads dedicado e limitado (STORAGE_IO_WORKERS).
+    Também mede fila, chamadas em andamento e latência para observabilidade.
+    """
+    def __init__(self, service: StorageService, max_workers: int):
+        self.sync = service
+        self.bucket_name = service.bucket_name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage-io")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._calls = 0
+        self._errors = 0
+        self._wait_ms = deque(maxlen=1000)
+        self._total_ms = deque(maxlen=1000)
+
+    async def run(self, fn, *args, **kwargs):
+        """Executa uma função bloqueante no pool de I/O do storage."""
+        submitted = time.monotonic()
+        with self._lock:
+            self._queued += 1
+
+        def call():
+            started = time.monotonic()
+            with self._lock:
+                self._queued -= 1
+                self._in_flight += 1
+                self._wait_ms.append((started - submitted) * 1000)
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                with self._lock:
+                    self._errors += 1
+                raise
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._calls += 1
+                    self._total_ms.append((time.monotonic() - submitted) * 1000)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, call)
+
+    @property
+    def supports_presigned_upload(self) -> bool:
+        return self.sync.backend.supports_presigned_upload
+
+    def object_name(self, path: str) -> str:
+        return self.sync.object_name(path)
+
+    async def ensure_ready(self):
+        return await self.run(self.sync.ensure_ready)
+
+    async def save_video(self, file_data: bytes, filename: str, content_type: str) -> str:
+        return await self.run(self.sync.save_video, file_data, filename, content_type)
+
+    async def save_stream(self, stream: BinaryIO, filename: str, content_type: str, part_size: int) -> str:
+        return await self.run(self.sync.save_stream, stream, filename, content_type, part_size)
+
+    async def upload_file(self, file_path: str, filename: str, content_type: str, metadata: dict | None = None) -> str:
+        return await self.run(self.sync.upload_file, file_path, filename, content_type, metadata)
+
+    async def download_file(self, object_name: str, dest_path: str) -> str:
+        return await self.run(self.sync.download_file, object_name, dest_path)
+
+    async def create_multipart_upload(self, filename: str, content_type: str) -> str:
+        return await self.run(self.sync.create_multipart_upload, filename, content_type)
+
+    async def upload_part(self, filename: str, upload_id: str, part_number: int, data: bytes) -> str:
+        return await self.run(self.sync.upload_part, filename, upload_id, part_number, data)
+
+    async def complete_multipart_upload(self, filename: str, upload_id: str, parts: list[dict]) -> str:
+        return await self.run(self.sync.complete_multipart_upload, filename, upload_id, parts)
+
+    async def abort_multipart_upload(self, filename: str, upload_id: str):
+        return await self.run(self.sync.abort_multipart_upload, filename, upload_id)
+
+    async def get_presigned_url(self, filename: str, expiration_seconds: int = 3600) -> str:
+        # Cache hit é só um lookup em memória: responde sem passar pelo pool de threads
+        filename = self.object_name(filename)
+        cached = self.sync.presign_cache.get(filename, expiration_seconds)
+        if cached:
+            return cached
+        return await self.run(self.sync.sign_url, filename, expiration_seconds)
+
+    async def get_presigned_put_url(self, filename: str, expiration_seconds: int = 3600) -> str:
+        return await self.run(self.sync.get_presigned_put_url, filename, expiration_seconds)
+
+    async def get_presigned_part_url(self, filename: str, upload_id: str, part_number: int, expiration_seconds: int = 3600) -> str:
+        return await self.run(self.sync.get_presigned_part_url, filename, upload_id, part_number, expiration_seconds)
+
+    async def stat_object(self, filename: str) -> dict:
+        return await self.run(self.sync.stat_object, filename)
+
+    async def hash_object(self, filename: str) -> tuple[str, int]:
+        return await self.run(self.sync.hash_object, filename)
+
+    async def remove_object(self, filename: str):
+        return await self.run(self.sync.remove_object, filename)
+
+    async def remove_objects(self, filenames: list[str]) -> list[str]:
+        return await self.run(self.sync.remove_objects, filenames)
+
+    async def iter_object(
+        self,
+        filename: str,
+        chunk_size: int = 64 * 1024,
+        offset: int = 0,
+        length: int = 0
+    ) -> AsyncIterator[bytes]:
+        """Lê o objeto (ou um trecho) em pedaços sem bloquear o loop (cada read roda no pool)."""
+        response = await self.run(self.sync.get_object, filename, offset, length)
+        try:
+            while True:
+                chunk = await self.run(response.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            response.close()
+            response.release_conn()
+
+    def stats(self) -> dict:
+        """Fila, chamadas em andamento e latência (ms) do pool de I/O."""
+        with self._lock:
+            wait = sorted(self._wait_ms)
+            total = sorted(self._total_ms)
+            stats = {
+                "max_workers": self.max_workers,
+                "queue_depth": self._queued,
+                "in_flight": self._in_flight,
+                "calls": self._calls,
+                "errors": self._errors,
+            }
+        stats["wait_ms"] = _percentiles(wait)
+        stats["latency_ms"] = _percentiles(total)
+        stats["presign_cache"] = self.sync.presign_cache.stats()
+        return stats
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "p50": round(values[len(values) // 2], 2),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 2),
+        "max": round(values[-1], 2),
+    }
+
 # Instância única
-storage = StorageService()
+storage = StorageService(create_backend())
+async_storage = AsyncStorageService(storage, settings.STORAGE_IO_WORKERS)
@@ -0,0 +1,572 @@
+"""
+Backends de armazenamento de objetos.
+
+O StorageService fala só com a interface StorageBackend; qual implementação
+é usada vem de settings.STORAGE_BACKEND:
+- "minio":  produção (MinIO / S3)
+- "local":  sistema de arquivos local (benchmarks em uma máquina só)
+- "memory": tudo em RAM (testes e benchmarks sem disco)
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Iterator
+from urllib.parse import quote
+from minio import Minio
+from minio.datatypes import Part
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error
+from app.core.config import settings
+import certifi
+import hashlib
+import io
+import json
+import mmap
+import os
+import threading
+import urllib3
+import uuid
+
+
+def _build_http_client() -> urllib3.PoolManager:
+    """
+    Pool HTTP do minio ajustado ao pool de threads de I/O:
+    uma conexão reaproveitável por thread (o padrão do minio é 10) e timeouts explícitos.
+    Sem block=True: streams abertos (iter_object) seguram conexões entre leituras,
+    e bloquear novas chamadas esperando conexão poderia travar o pool inteiro.
+    """
+    return urllib3.PoolManager(
+        maxsize=settings.STORAGE_IO_WORKERS,
+        timeout=urllib3.Timeout(
+            connect=settings.STORAGE_CONNECT_TIMEOUT,
+            read=settings.STORAGE_READ_TIMEOUT
+        ),
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=certifi.where(),
+        retries=urllib3.Retry(
+            total=3,
+            backoff_factor=0.2,
+            status_forcelist=[500, 502, 503, 504]
+        )
+    )
+
+
+class StorageBackend(ABC):
+    """
+    Operações mínimas sobre objetos de um bucket.
+    `name` é sempre o nome do objeto dentro do bucket (sem o prefixo do bucket).
+    stat() devolve: size, content_type, etag, last_modified, metadata.
+    get() devolve um leitor com read(n), close() e release_conn().
+    """
+    bucket_name: str
+    # O navegador consegue enviar direto ao backend via URL assinada (PUT)?
+    supports_presigned_upload = False
+
+    def ensure_ready(self):
+        """Prepara o backend (ex: cria o bucket). Chamado no startup, não no import."""
+
+    @abstractmethod
+    def put(self, name: str, stream: BinaryIO, length: int, content_type: str,
+            part_size: int = 0, metadata: dict | None = None) -> str:
+        """Grava o stream (length=-1: tamanho desconhecido, lido em partes). Retorna o ETag."""
+
+    def put_file(self, name: str, file_path: str, content_type: str, metadata: dict | None = None) -> str:
+        with open(file_path, "rb") as f:
+            return self.put(name, f, os.path.getsize(file_path), content_type, metadata=metadata)
+
+    @abstractmethod
+    def get(self, name: str, offset: int = 0, length: int = 0):
+        """Abre o objeto (ou o trecho offset..offset+length) para leitura."""
+
+    def get_file(self, name: str, dest_path: str):
+        reader = self.get(name)
+        try:
+            with open(dest_path, "wb") as f:
+                while True:
+                    chunk = reader.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+        finally:
+            reader.close()
+            reader.release_conn()
+
+    @abstractmethod
+    def stat(self, name: str) -> dict:
+        ...
+
+    @abstractmethod
+    def delete(self, name: str):
+        ...
+
+    @abstractmethod
+    def list_objects(self, prefix: str = "") -> Iterator[dict]:
+        """Lista o bucket em streaming (paginado): {"name", "size", "last_modified"}."""
+
+    def delete_many(self, names: list[str]) -> list[str]:
+        """Remove vários objetos. Retorna os nomes que falharam."""
+        failed = []
+        for name in names:
+            try:
+                self.delete(name)
+            except Exception:
+                failed.append(name)
+        return failed
+
+    @abstractmethod
+    def presign_get(self, name: str, expires: timedelta) -> str:
+        ...
+
+    def presign_put(self, name: str, expires: timedelta) -> str:
+        raise NotImplementedError("Upload direto (presigned) só é suportado pelo backend MinIO")
+
+    def presign_part(self, name: str, upload_id: str, part_number: int, expires: timedelta) -> str:
+        raise NotImplementedError("Upload direto (presigned) só é suportado pelo backend MinIO")
+
+    @abstractmethod
+    def create_multipart(self, name: str, content_type: str) -> str:
+        ...
+
+    @abstractmethod
+    def upload_part(self, name: str, upload_id: str, part_number: int, data: bytes) -> str:
+        ...
+
+    @abstractmethod
+    def complete_multipart(self, name: str, upload_id: str, parts: list[dict]) -> str:
+        ...
+
+    @abstractmethod
+    def abort_multipart(self, name: str, upload_id: str):
+        ...
+
+
+# --- MinIO ---
+
+class MinioBackend(StorageBackend):
+    supports_presigned_upload = True
+
+    def __init__(self, client, bucket_name: str):
+        self.client = client
+        self.bucket_name = bucket_name
+
+    def ensure_ready(self):
+        """Verifica se o bucket existe, se não, cria."""
+        try:
+            if not self.client.bucket_exists(self.bucket_name):
+                self.client.make_bucket(self.bucket_name)
+                print(f"Bucket '{self.bucket_name}' criado com sucesso.")
+        except S3Error as e:
+            print(f"Erro ao verificar/criar bucket: {e}")
+
+    def put(self, name, stream, length, content_type, part_size=0, metadata=None):
+        # num_parallel_uploads=1 garante que apenas uma parte fica em memória
+        # por vez (o pool paralelo do minio lê o stream inteiro para a fila).
+        result = self.client.put_object(
+            self.bucket_name,
+            name,
+            stream,
+            length=length,
+            part_size=part_size,
+            content_type=content_type,
+            metadata=metadata,
+            num_parallel_uploads=1
+        )
+        return result.etag
+
+    def put_file(self, name, file_path, content_type, metadata=None):
+        result = self.client.fput_object(
+            self.bucket_name, name, file_path, content_type=content_type, metadata=metadata
+        )
+        return result.etag
+
+    def get(self, name, offset=0, length=0):
+        return self.client.get_object(self.bucket_name, name, offset=offset, length=length)
+
+    def get_file(self, name, dest_path):
+        self.client.fget_object(self.bucket_name, name, dest_path)
+
+    def stat(self, name):
+        stat = self.client.stat_object(self.bucket_name, name)
+        return {
+            "size": stat.size,
+            "content_type": stat.content_type,
+            "etag": stat.etag,
+            "last_modified": stat.last_modified,
+            "metadata": dict(stat.metadata or {}),
+        }
+
+    def delete(self, name):
+        self.client.remove_object(self.bucket_name, name)
+
+    def list_objects(self, prefix=""):
+        # O minio-py pagina o ListObjectsV2 sozinho (1000 por página) à medida que iteramos
+        for obj in self.client.list_objects(self.bucket_name, prefix=prefix or None, recursive=True):
+            if obj.is_dir:
+                continue
+            yield {"name": obj.object_name, "size": obj.size, "last_modified": obj.last_modified}
+
+    def delete_many(self, names):
+        # Multi-object delete: uma requisição por até 1000 objetos.
+        # remove_objects é preguiçoso; os erros só aparecem consumindo o iterador.
+        errors = self.client.remove_objects(self.bucket_name, (DeleteObject(n) for n in names))
+        return [e.name for e in errors]
+
+    def presign_get(self, name, expires):
+        return self.client.presigned_get_object(self.bucket_name, name, expires=expires)
+
+    def presign_put(self, name, expires):
+        return self.client.presigned_put_object(self.bucket_name, name, expires=expires)
+
+    def presign_part(self, name, upload_id, part_number, expires):
+        return self.client.get_presigned_url(
+            "PUT",
+            self.bucket_name,
+            name,
+            expires=expires,
+            extra_query_params={"uploadId": upload_id, "partNumber": str(part_number)}
+        )
+
+    # O minio-py não expõe o multipart publicamente; usamos os métodos
+    # internos que o próprio put_object usa. Por isso o minio fica numa versão exata
+    # (requirements.txt) e tests/test_storage_backends.py confere as assinaturas.
+
+    def create_multipart(self, name, content_type):
+        return self.client._create_multipart_upload(
+            self.bucket_name, name, {"Content-Type": content_type}
+        )
+
+    def upload_part(self, name, upload_id, part_number, data):
+        return self.client._upload_part(self.bucket_name, name, data, None, upload_id, part_number)
+
+    def complete_multipart(self, name, upload_id, parts):
+        ordered = sorted(parts, key=lambda p: p["part_number"])
+        result = self.client._complete_multipart_upload(
+            self.bucket_name,
+            name,
+            upload_id,
+            [Part(p["part_number"], p["etag"]) for p in ordered]
+        )
+        return result.etag
+
+    def abort_multipart(self, name, upload_id):
+        self.client._abort_multipart_upload(self.bucket_name, name, upload_id)
+
+
+# --- Leitores para os backends locais ---
+
+class _BytesReader(io.BytesIO):
+    """BytesIO com a mesma interface de fechamento do HTTPResponse do urllib3."""
+    def release_conn(self):
+        pass
+
+
+class _MmapReader:
+    """Lê um trecho de arquivo via mmap (sem cópia extra do kernel para um buffer Python)."""
+    def __init__(self, path: str, offset: int, length: int):
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._pos = offset
+        self._end = size if not length else min(size, offset + length)
+
+    def read(self, size: int = -1) -> bytes:
+        if self._map is None or self._pos >= self._end:
+            return b""
+        end = self._end if size is None or size < 0 else min(self._end, self._pos + size)
+        data = self._map[self._pos:end]
+        self._pos = end
+        return data
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def release_conn(self):
+        pass
+
+
+def _multipart_etag(part_etags: list[str]) -> str:
+    """ETag no formato do S3 para objetos multipart: md5(md5s das partes)-N."""
+    digest = hashlib.md5(b"".join(bytes.fromhex(e) for e in part_etags)).hexdigest()
+    return f"{digest}-{len(part_etags)}"
+
+
+def _proxy_url(bucket_name: str, name: str) -> str:
+    """Backends locais não têm URL própria: o navegador lê pelo proxy /stream da API."""
+    return f"/api/v1/stream?path={quote(f'{bucket_name}/{name}')}"
+
+
+# --- Sistema de arquivos local ---
+
+class LocalFSBackend(StorageBackend):
+    """
+    Objetos como arquivos em <root>/<bucket>/<nome>, metadados num arquivo
+    irmão "<nome>.meta.json". Gravações são atômicas (arquivo temporário + os.replace).
+    Leituras usam os.sendfile (download para arquivo) e mmap (leituras por trecho).
+    """
+    META_SUFFIX = ".meta.json"
+
+    def __init__(self, root: str, bucket_name: str):
+        self.bucket_name = bucket_name
+        self.base = os.path.join(root, bucket_name)
+        self.multipart_dir = os.path.join(root, ".multipart")
+
+    def ensure_ready(self):
+        os.makedirs(self.base, exist_ok=True)
+        os.makedirs(self.multipart_dir, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        path = os.path.normpath(os.path.join(self.base, name))
+        if not path.startswith(self.base + os.sep):
+            raise ValueError(f"Nome de objeto inválido: {name}")
+        return path
+
+    def _write_meta(self, path: str, content_type: str, etag: str, metadata: dict | None):
+        with open(path + self.META_SUFFIX, "w") as f:
+            json.dump({"content_type": content_type, "etag": etag, "metadata": metadata or {}}, f)
+
+    def _commit(self, tmp_path: str, name: str, content_type: str, etag: str, metadata: dict | None):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._write_meta(path, content_type, etag, metadata)
+        os.replace(tmp_path, path)
+
+    def put(self, name, stream, length, content_type, part_size=0, metadata=None):
+        self.ensure_ready()
+        tmp_path = os.path.join(self.multipart_dir, f"{uuid.uuid4()}.tmp")
+        md5 = hashlib.md5()
+        chunk_size = part_size or 1024 * 1024
+        try:
+            with open(tmp_path, "wb") as f:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    md5.update(chunk)
+                    f.write(chunk)
+            etag = md5.hexdigest()
+            self._commit(tmp_path, name, content_type, etag, metadata)
+            return etag
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get(self, name, offset=0, length=0):
+        return _MmapReader(self._path(name), offset, length)
+
+    def get_file(self, name, dest_path):
+        # os.sendfile copia arquivo -> arquivo dentro do kernel (zero-copy)
+        src_path = self._path(name)
+        with open(src_path, "rb") as src, open(dest_path, "wb") as dst:
+            remaining = os.fstat(src.fileno()).st_size
+            offset = 0
+            while remaining > 0:
+                sent = os.sendfile(dst.fileno(), src.fileno(), offset, remaining)
+                if sent == 0:
+                    break
+                offset += sent
+                remaining -= sent
+
+    def stat(self, name):
+        path = self._path(name)
+        st = os.stat(path)
+        try:
+            with open(path + self.META_SUFFIX) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            meta = {}
+        return {
+            "size": st.st_size,
+            "content_type": meta.get("content_type", "application/octet-stream"),
+            "etag": meta.get("etag", f"{int(st.st_mtime_ns)}-{st.st_size}"),
+            "last_modified": datetime.fromtimestamp(st.st_mtime, tz=timezone.utc),
+            "metadata": meta.get("metadata", {}),
+        }
+
+    def delete(self, name):
+        path = self._path(name)
+        for p in (path, path + self.META_SUFFIX):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    def list_objects(self, prefix=""):
+        for dirpath, _, filenames in os.walk(self.base):
+            for filename in filenames:
+                if filename.endswith(self.META_SUFFIX):
+                    continue
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.base).replace(os.sep, "/")
+                if not name.startswith(prefix):
+                    continue
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield {
+                    "name": name,
+                    "size": st.st_size,
+                    "last_modified": datetime.fromtimestamp(st.st_mtime, tz=timezone.utc),
+                }
+
+    def presign_get(self, name, expires):
+        return _proxy_url(self.bucket_name, name)
+
+    def _upload_dir(self, upload_id: str) -> str:
+        path = os.path.normpath(os.path.join(self.multipart_dir, upload_id))
+        if not path.startswith(self.multipart_dir + os.sep):
+            raise ValueError(f"upload_id inválido: {upload_id}")
+        return path
+
+    def create_multipart(self, name, content_type):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._upload_dir(upload_id))
+        with open(os.path.join(self._upload_dir(upload_id), "upload.json"), "w") as f:
+            json.dump({"name": name, "content_type": content_type}, f)
+        return upload_id
+
+    def upload_part(self, name, upload_id, part_number, data):
+        part_path = os.path.join(self._upload_dir(upload_id), f"{part_number:05d}.part")
+        with open(part_path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(part_path + ".tmp", part_path)
+        return hashlib.md5(data).hexdigest()
+
+    def complete_multipart(self, name, upload_id, parts):
+        upload_dir = self._upload_dir(upload_id)
+        with open(os.path.join(upload_dir, "upload.json")) as f:
+            content_type = json.load(f)["content_type"]
+
+        ordered = sorted(parts, key=lambda p: p["part_number"])
+        tmp_path = os.path.join(self.multipart_dir, f"{uuid.uuid4()}.tmp")
+        with open(tmp_path, "wb") as dst:
+            for part in ordered:
+                part_path = os.path.join(upload_dir, f"{part['part_number']:05d}.part")
+                with open(part_path, "rb") as src:
+                    size = os.fstat(src.fileno()).st_size
+                    offset = 0
+                    while offset < size:
+                        offset += os.sendfile(dst.fileno(), src.fileno(), offset, size - offset)
+        etag = _multipart_etag([p["etag"] for p in ordered])
+        self._commit(tmp_path, name, content_type, etag, None)
+        self.abort_multipart(name, upload_id)
+        return etag
+
+    def abort_multipart(self, name, upload_id):
+        upload_dir = self._upload_dir(upload_id)
+        if os.path.isdir(upload_dir):
+            for entry in os.scandir(upload_dir):
+                os.remove(entry.path)
+            os.rmdir(upload_dir)
+
+
+# --- Memória ---
+
+class MemoryBackend(StorageBackend):
+    """Objetos num dicionário em RAM. Some ao reiniciar o processo."""
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+        self._objects: dict[str, dict] = {}
+        self._uploads: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def put(self, name, stream, length, content_type, part_size=0, metadata=None):
+        data = stream.read() if length < 0 else stream.read(length)
+        etag = hashlib.md5(data).hexdigest()
+        with self._lock:
+            self._objects[name] = {
+                "data": data,
+                "content_type": content_type,
+                "etag": etag,
+                "last_modified": datetime.now(timezone.utc),
+                "metadata": metadata or {},
+            }
+        return etag
+
+    def _object(self, name: str) -> dict:
+        with self._lock:
+            obj = self._objects.get(name)
+        if obj is None:
+            raise FileNotFoundError(name)
+        return obj
+
+    def get(self, name, offset=0, length=0):
+        data = self._object(name)["data"]
+        end = len(data) if not length else offset + length
+        return _BytesReader(data[offset:end])
+
+    def stat(self, name):
+        obj = self._object(name)
+        return {
+            "size": len(obj["data"]),
+            "content_type": obj["content_type"],
+            "etag": obj["etag"],
+            "last_modified": obj["last_modified"],
+            "metadata": dict(obj["metadata"]),
+        }
+
+    def delete(self, name):
+        with self._lock:
+            self._objects.pop(name, None)
+
+    def list_objects(self, prefix=""):
+        with self._lock:
+            snapshot = [(name, obj) for name, obj in self._objects.items() if name.startswith(prefix)]
+        for name, obj in snapshot:
+            yield {"name": name, "size": len(obj["data"]), "last_modified": obj["last_modified"]}
+
+    def presign_get(self, name, expires):
+        return _proxy_url(self.bucket_name, name)
+
+    def create_multipart(self, name, content_type):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {"content_type": content_type, "parts": {}}
+        return upload_id
+
+    def upload_part(self, name, upload_id, part_number, data):
+        with self._lock:
+            self._uploads[upload_id]["parts"][part_number] = bytes(data)
+        return hashlib.md5(data).hexdigest()
+
+    def complete_multipart(self, name, upload_id, parts):
+        with self._lock:
+            upload = self._uploads.pop(upload_id)
+        ordered = sorted(parts, key=lambda p: p["part_number"])
+        data = b"".join(upload["parts"][p["part_number"]] for p in ordered)
+        etag = _multipart_etag([p["etag"] for p in ordered])
+        with self._lock:
+            self._objects[name] = {
+                "data": data,
+                "content_type": upload["content_type"],
+                "etag": etag,
+                "last_modified": datetime.now(timezone.utc),
+                "metadata": {},
+            }
+        return etag
+
+    def abort_multipart(self, name, upload_id):
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+
+
+def create_backend() -> StorageBackend:
+    """Instancia o backend configurado em settings.STORAGE_BACKEND."""
+    kind = settings.STORAGE_BACKEND.lower()
+    if kind == "minio":
+        client = Minio(
+            settings.MINIO_ENDPOINT,
+            access_key=settings.MINIO_ACCESS_KEY,
+            secret_key=settings.MINIO_SECRET_KEY,
+            secure=settings.MINIO_SECURE,
+            http_client=_build_http_client()
+        )
+        return MinioBackend(client, settings.MINIO_BUCKET_RAW)
+    if kind == "local":
+        return LocalFSBackend(settings.STORAGE_LOCAL_ROOT, settings.MINIO_BUCKET_RAW)
+    if kind == "memory":
+        return MemoryBackend(settings.MINIO_BUCKET_RAW)
+    raise ValueError(f"STORAGE_BACKEND desconhecido: {settings.STORAGE_BACKEND}")
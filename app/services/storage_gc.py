@@ -0,0 +1,150 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.chapter import Chapter
+from app.models.configuration import Configuration
+from app.models.upload_session import UploadSession
+from app.models.video_hash import VideoHash
+from app.services.cleanup import BATCH_SIZE, normalize_key, chapter_object_keys
+from app.services.storage import async_storage
+
+
+async def referenced_keys(db: AsyncSession, include_hashes: bool = True) -> set[str]:
+    """
+    Fase "mark": todo objeto que alguma linha do banco ainda usa.
+    Os capítulos vêm em streaming (text_content pode ser grande).
+    include_hashes=False: video_hashes não conta como uso (a fila de remoção apaga o hash junto).
+    """
+    keys: set[str] = set()
+
+    stmt = select(
+        Chapter.video_url, Chapter.stitched_video_url, Chapter.raw_video_url, Chapter.text_content, Chapter.checkpoints
+    )
+    result = await db.stream(stmt.execution_options(yield_per=500))
+    async for row in result:
+        keys |= chapter_object_keys(row)
+
+    configs = await db.execute(select(
+        Configuration.intro_video_url,
+        Configuration.outro_video_url,
+        Configuration.logo_url,
+        Configuration.logo_variants
+    ))
+    for intro, outro, logo, logo_variants in configs.all():
+        keys.update(normalize_key(p) for p in (intro, outro))
+        keys.update(normalize_key(p) for p in (logo_variants or {}).values())
+        # logo_url pode ser base64 ou URL externa; só conta se for um caminho do bucket
+        if logo and not logo.startswith(("data:", "http://", "https://")):
+            keys.add(normalize_key(logo))
+
+    if include_hashes:
+        keys.update(normalize_key(p) for p in (await db.scalars(select(VideoHash.video_url))).all())
+
+    # Uploads em andamento: o objeto pode existir antes de o capítulo ser criado
+    open_uploads = await db.scalars(select(UploadSession.object_key).where(UploadSession.status.in_(["OPEN", "COMPLETING"])))
+    keys.update(open_uploads.all())
+
+    keys.discard(None)
+    return keys
+
+
+def _sweep_candidates(referenced: set[str], cutoff: datetime) -> dict:
+    """
+    Fase "sweep" (roda no pool de I/O): percorre a listagem paginada do bucket
+    e separa os órfãos mais velhos que a carência.
+    """
+    report = {
+        "scanned_objects": 0,
+        "scanned_bytes": 0,
+        "referenced_objects": 0,
+        "recent_orphans": 0,
+        "orphans": [],
+    }
+    for obj in async_storage.sync.list_objects():
+        report["scanned_objects"] += 1
+        report["scanned_bytes"] += obj["size"] or 0
+        if obj["name"] in referenced:
+            report["referenced_objects"] += 1
+        elif obj["last_modified"] and obj["last_modified"] > cutoff:
+            report["recent_orphans"] += 1
+        else:
+            report["orphans"].append((obj["name"], obj["size"] or 0))
+    return report
+
+
+class StorageGC:
+    """
+    Coletor mark-and-sweep de objetos órfãos do storage: áudios trocados no
+    regenerate_audio, stitches que falharam, uploads abandonados etc.
+    Com dry_run=True só relata o que seria apagado e quantos bytes voltariam.
+    """
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self.last_report: dict | None = None
+
+    async def collect(self, dry_run: bool = True, grace_hours: int | None = None) -> dict:
+        grace = settings.STORAGE_GC_GRACE_HOURS if grace_hours is None else grace_hours
+        # Uma coleta por vez (a periódica e a manual usam o mesmo lock)
+        async with self._lock:
+            started = time.monotonic()
+            # Objetos mais novos que a carência podem ser de uploads/stitches
+            # que ainda não gravaram a referência no banco
+            cutoff = datetime.now(timezone.utc) - timedelta(hours=grace)
+
+            async with AsyncSessionLocal() as db:
+                referenced = await referenced_keys(db)
+
+            report = await async_storage.run(_sweep_candidates, referenced, cutoff)
+            orphans = report.pop("orphans")
+            report["dry_run"] = dry_run
+            report["grace_hours"] = grace
+            report["orphan_objects"] = len(orphans)
+            report["reclaimable_bytes"] = sum(size for _, size in orphans)
+            report["sample"] = [name for name, _ in orphans[:50]]
+            report["deleted"] = 0
+            report["failed"] = 0
+
+            if not dry_run:
+                names = [name for name, _ in orphans]
+                for i in range(0, len(names), BATCH_SIZE):
+                    failed = await async_storage.remove_objects(names[i:i + BATCH_SIZE])
+                    report["deleted"] += len(names[i:i + BATCH_SIZE]) - len(failed)
+                    report["failed"] += len(failed)
+
+            report["seconds"] = round(time.monotonic() - started, 2)
+            report["finished_at"] = datetime.now(timezone.utc).isoformat()
+            self.last_report = report
+            print(
+                f"[GC] {'(dry-run) ' if dry_run else ''}{report['orphan_objects']} órfãos, "
+                f"{report['reclaimable_bytes']} bytes recuperáveis, {report['deleted']} apagados"
+            )
+            return report
+
+    def start(self):
+        if self._task is None and settings.STORAGE_GC_INTERVAL_HOURS > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.STORAGE_GC_INTERVAL_HOURS * 3600)
+            try:
+                await self.collect(dry_run=False)
+            except Exception as e:
+                print(f"[GC] Erro na coleta: {e}")
+
+# Instância única
+storage_gc = StorageGC()
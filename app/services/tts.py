@@ -1,14 +1,60 @@
+import asyncio
 import edge_tts
-from app.services.storage import storage
+from app.core.config import settings
+from app.services.storage import async_storage
 import uuid
 import os
 from mutagen.mp3 import MP3
+from app.services.circuit_breaker import CircuitOpen, edge_tts_breaker, gtts_breaker
+from app.services.jobs import check_cancelled
+from app.services.stages import tts_pool
+
+
+def _gtts_save(text: str, path: str):
+    from gtts import gTTS
+    tts = gTTS(text=text, lang='pt', slow=False)
+    tts.save(path)
+
+
+def _mp3_duration(path: str) -> float:
+    return MP3(path).info.length
+
+
+DEFAULT_VOICE = "pt-BR-AntonioNeural"
+
 
 class TTSService:
-    async def generate_audio(self, text: str, voice: str = "pt-BR-AntonioNeural") -> tuple[str | None, float | None]:
+    async def _synthesize(self, text: str, voice: str, path: str) -> bool:
+        """
+        Edge-TTS e, se falhar, gTTS, cada um atrás do seu disjuntor: com o Edge-TTS fora
+        do ar, os passos vão direto para o gTTS sem esperar timeout. Retorna False se nenhum gerou.
+        """
+        try:
+            with edge_tts_breaker.guard():
+                # Tenta Edge TTS Primeiro
+                communicate = edge_tts.Communicate(text, voice)
+                await asyncio.wait_for(communicate.save(path), timeout=settings.EDGE_TTS_TIMEOUT_SECONDS)
+            return True
+        except CircuitOpen as e:
+            print(f"TTS: {e}; usando gTTS direto.")
+        except Exception as e:
+            print(f"⚠️ Edge-TTS falhou ({type(e).__name__}: {e}). Ativando Fallback para gTTS...")
+
+        try:
+            with gtts_breaker.guard():
+                # Fallback: gTTS (bloqueante: roda no executor do pool)
+                await tts_pool.run_blocking(_gtts_save, text, path)
+            print("TTS: Gerado via gTTS (Fallback).")
+            return True
+        except Exception as e2:
+            print(f"❌ Erro fatal no TTS (nem gTTS salvou): {e2}")
+            return False
+
+    async def generate_audio(self, text: str, voice: str = DEFAULT_VOICE) -> tuple[str | None, float | None]:
         """
         Gera áudio a partir do texto usando Microsoft Edge TTS (Melhor qualidade).
         Fallback: Se falhar, usa gTTS (Google Translate TTS - Mais robótico, mas garantido).
+        Provedor com disjuntor aberto é pulado (ver app/services/circuit_breaker.py).
         Salva no MinIO e retorna (caminho_minio, duracao_segundos).
         """
         if not text:
@@ -18,40 +64,26 @@ class TTSService:
         temp_filename = f"{uuid.uuid4()}.mp3"
         temp_path = f"/tmp/{temp_filename}"
         
-        try:
-            # Tenta Edge TTS Primeiro
-            print("TTS: Tentando Edge-TTS...")
-            communicate = edge_tts.Communicate(text, voice)
-            await communicate.save(temp_path)
-        except Exception as e:
-            print(f"⚠️ Edge-TTS falhou ({e}). Ativando Fallback para gTTS...")
-            try:
-                # Fallback: gTTS
-                from gtts import gTTS
-                tts = gTTS(text=text, lang='pt', slow=False)
-                tts.save(temp_path)
-                print("TTS: Gerado via gTTS (Fallback).")
-            except Exception as e2:
-                print(f"❌ Erro fatal no TTS (nem gTTS salvou): {e2}")
+        # Uma vaga do pool de TTS por áudio (síntese + duração); o upload vai pelo pool do storage
+        async with tts_pool.slot():
+            check_cancelled()
+            if not await self._synthesize(text, voice, temp_path):
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
                 return None, None
 
-        try:
             # Obter duração com Mutagen
             try:
-                audio = MP3(temp_path)
-                duration = audio.info.length
+                duration = await tts_pool.run_blocking(_mp3_duration, temp_path)
             except Exception as e:
                 print(f"Erro ao ler duração do áudio: {e}")
                 duration = 0.0
 
-            # Lê os bytes
-            with open(temp_path, "rb") as f:
-                file_data = f.read()
-            
-            # Salva no MinIO
+        try:
+            # Salva no MinIO (direto do disco, pelo pool de I/O do storage)
             minio_path = f"audio/{temp_filename}"
             # Usa 'audio/mpeg' para garantir que toque no navegador
-            saved_path = storage.save_video(file_data, minio_path, "audio/mpeg")
+            saved_path = await async_storage.upload_file(temp_path, minio_path, "audio/mpeg")
             
             print(f"Áudio salvo no MinIO: {saved_path} ({duration:.2f}s)")
             return saved_path, duration
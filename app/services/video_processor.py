@@ -1,12 +1,15 @@
 import os
 import tempfile
-import asyncio
-from app.services.storage import storage
+from contextlib import AsyncExitStack
+from app.services.storage import async_storage
+from app.services.object_cache import object_cache
+from app.services.stages import run_ffmpeg
 
 class VideoProcessor:
     async def stitch_videos(self, main_video_key: str, intro_key: str | None, outro_key: str | None) -> str:
         """
-        Downloads main video, intro and outro from MinIO.
+        Downloads main video, intro and outro from MinIO (through the local object cache,
+        so the same intro/outro are not downloaded again for every publish).
         Stitches them using FFmpeg (concat demuxer).
         Uploads the result back to MinIO.
         Returns the new MinIO key.
@@ -15,19 +18,15 @@ class VideoProcessor:
         if not intro_key and not outro_key:
             return main_video_key
 
-        with tempfile.TemporaryDirectory() as temp_dir:
+        async with AsyncExitStack() as cached_files:
+            temp_dir = cached_files.enter_context(tempfile.TemporaryDirectory())
             file_list_path = os.path.join(temp_dir, "files.txt")
             output_path = os.path.join(temp_dir, "stitched.mp4")
             files_to_concat = []
 
-            # Helper to download
+            # Helper to download: cached files stay pinned until stitching ends
             async def download(key, local_name):
-                path = os.path.join(temp_dir, local_name)
-                # O storage.download_file assume que o key é completo path/to/file
-                # Mas storage method 'download_file' é sincrono ou async? Verificar service.
-                # Assumindo sincrono wrapper ou boto3
-                await asyncio.to_thread(storage.client.fget_object, storage.bucket_name, key, path)
-                return path
+                return await cached_files.enter_async_context(object_cache.open(key))
 
             # 1. Download Intro
             if intro_key:
@@ -72,14 +71,10 @@ class VideoProcessor:
                 "-y", output_path
             ]
             
-            proc = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await proc.communicate()
+            # Vaga no pool de CPU do ffmpeg (compartilhado com os outros jobs do worker)
+            returncode, stderr = await run_ffmpeg(cmd)
             
-            if proc.returncode != 0:
+            if returncode != 0:
                 print(f"FFmpeg error: {stderr.decode()}")
                 # Fallback: se falhar o copy (codecs diferentes?), tentar re-encode?
                 # Por simplicidade neste MVP, lançamos erro ou retornamos original.
@@ -89,13 +84,7 @@ class VideoProcessor:
             # Upload Result
             # Nome: stitcheds/timestamp_original.mp4
             new_key = f"stitched/final_{os.path.basename(main_video_key)}"
-            await asyncio.to_thread(
-                storage.client.fput_object, 
-                storage.bucket_name, 
-                new_key, 
-                output_path,
-                content_type="video/mp4"
-            )
+            await async_storage.upload_file(output_path, new_key, content_type="video/mp4")
             
             return new_key
 
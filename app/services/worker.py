@@ -1,11 +1,18 @@
 import asyncio
 import logging
 import os
-from app.services.ai_processor import ai_processor
+from app.services.ai_processor import ai_processor, MODEL_NAME
 from app.db.session import AsyncSessionLocal
-from app.models import Chapter, Module, System, Collection
-from sqlalchemy import select
-from app.services.tts import tts_service
+from app.models import Chapter, Module, System, Collection, Configuration
+from sqlalchemy import select, update
+from app.services.tts import tts_service, DEFAULT_VOICE
+from app.services.checkpoints import Checkpoints, input_hash, TTS_PREFIX
+from app.services.ingest import find_existing_analysis, register_video_hash
+from app.services.retention import raw_retention
+from app.services.storage import async_storage
+from app.services import job_metrics, progress
+from app.services.video_processor import video_processor
+from app.services.jobs import job_handler, can_defer, check_cancelled, current_job, final_attempt, still_current, JobCancelled, JobDeferred, ARCHIVE_RAW, PROCESS_VIDEO, REGENERATE_AUDIO, STITCH_PUBLISH
 
 # Configure logging
 log_dir = "logs"
@@ -33,85 +40,349 @@ f_handler.setFormatter(f_format)
 if not logger.handlers:
     logger.addHandler(f_handler)
 
-async def process_video_job(chapter_id: int, user_goal: str):
+async def _save_guarded(chapter_id: int, expected_status: str, values: dict):
     """
-    Background Task que orquestra a IA.
+    Grava o resultado num único UPDATE condicional: só passa se o capítulo continua no
+    estado em que o job o pegou e o job não foi cancelado. Senão levanta JobCancelled.
+    Sessão própria e curta: nenhuma conexão fica presa durante os estágios longos.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(Chapter)
+            .where(Chapter.id == chapter_id, Chapter.status == expected_status, still_current())
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+    if result.rowcount == 0:
+        raise JobCancelled(f"Capítulo {chapter_id} cancelado ou alterado durante o job; resultado descartado")
+
+async def _load_chapter_context(chapter_id: int) -> dict | None:
+    """Tudo o que o job precisa do banco, lido de uma vez (a sessão fecha antes da IA)."""
+    async with AsyncSessionLocal() as db:
+        # Busca dados completos com relacionamentos para obter o Contexto
+        from sqlalchemy.orm import selectinload
+        stmt = (
+            select(Chapter)
+            .where(Chapter.id == chapter_id)
+            .options(
+                selectinload(Chapter.collection)
+                .selectinload(Collection.module)
+                .selectinload(Module.system)
+            )
+        )
+        chapter = (await db.execute(stmt)).scalar_one_or_none()
+        if not chapter:
+            return None
+
+        # Recupera Contextos da Hierarquia
+        system_context_str = ""
+        module_context_str = ""
+        
+        if chapter.collection and chapter.collection.module:
+            mod = chapter.collection.module
+            module_context_str = mod.context_prompt or f"Module Name: {mod.name}"
+            
+            if mod.system:
+                sys = mod.system
+                system_context_str = sys.context_prompt or f"System Name: {sys.name}"
+
+        return {
+            "status": chapter.status,
+            "video_url": chapter.video_url,
+            "checkpoints": chapter.checkpoints,
+            "system_context": system_context_str,
+            "module_context": module_context_str,
+        }
+
+async def _synthesize(checkpoints: Checkpoints, text: str) -> tuple[str | None, float | None]:
+    """Áudio de um passo: reaproveita o do checkpoint se o texto (e a voz) não mudou."""
+    text_hash = input_hash(text, DEFAULT_VOICE)
+    stage = TTS_PREFIX + text_hash
+    cached = checkpoints.get(stage, text_hash)
+    if cached:
+        return cached["audio_url"], cached["duration"]
+    audio_url, duration = await tts_service.generate_audio(text, DEFAULT_VOICE)
+    if audio_url:
+        await checkpoints.put(stage, text_hash, {"audio_url": audio_url, "duration": duration})
+    return audio_url, duration
+
+async def _synthesize_all(checkpoints: Checkpoints, texts: list[str]) -> list[tuple[str | None, float | None]]:
+    """Todos os passos de uma vez (o pool de TTS limita o paralelismo), reportando o avanço."""
+    start, end = progress.STAGES["tts"], progress.STAGES["save"]
+    done = 0
+
+    async def one(text: str):
+        nonlocal done
+        audio = await _synthesize(checkpoints, text)
+        done += 1
+        await progress.report("tts", start + (end - start) * done / len(texts), steps_done=done, steps_total=len(texts))
+        return audio
+
+    return await asyncio.gather(*(one(text) for text in texts))
+
+async def _deduplicate(chapter_id: int, expected_status: str, video_url: str) -> tuple[str, bool]:
+    """
+    Upload confirmado sem hash (upload direto, sessão retomada): o SHA-256 é calculado aqui,
+    fora do request, e o vídeo é deduplicado como no /upload. Retorna (video_url, se a
+    análise foi reaproveitada). A cópia nova só é apagada depois que o capítulo aponta
+    para o original.
+    """
+    sha256, size = await async_storage.hash_object(video_url)
+    async with AsyncSessionLocal() as db:
+        original = await register_video_hash(db, sha256, video_url, size, remove_duplicate=False)
+        if original == video_url:
+            return video_url, False
+        text_content = await find_existing_analysis(db, original)
+
+    values = {"video_url": original}
+    if text_content:
+        values.update(text_content=text_content, status="DRAFT")
+    await _save_guarded(chapter_id, expected_status, values)
+    await async_storage.remove_object(video_url)
+    return original, text_content is not None
+
+
+@job_handler(PROCESS_VIDEO)
+async def process_video_job(chapter_id: int, user_goal: str, dedup: bool = False):
+    """
+    Job que orquestra a IA (roda no worker, app/run_worker.py).
     Recebe o ID do Capítulo (Video recém criado) e o Objetivo do Usuário.
+    dedup: o upload não trouxe hash; deduplica antes da IA (pode reaproveitar a análise).
+    Só abre sessão do banco para ler o contexto, gravar checkpoints e salvar o resultado;
+    download, ffmpeg, Gemini e TTS rodam sem conexão emprestada do pool.
     """
     print(f"[Worker] Iniciando job para Chapter ID: {chapter_id}")
+    expected_status = "PENDING"
+    progress.current_chapter.set(chapter_id)
+    run = None
     
+    try:
+        # 1. Contexto do capítulo (sessão curta)
+        context = await _load_chapter_context(chapter_id)
+        if not context:
+            logger.warning(f"Chapter {chapter_id} não encontrado.")
+            return
+        expected_status = context["status"]
+        await progress.report("started")
+        if dedup:
+            context["video_url"], reused = await _deduplicate(chapter_id, expected_status, context["video_url"])
+            if reused:
+                logger.info(f"Chapter {chapter_id}: vídeo já analisado; análise reaproveitada.")
+                await progress.report("done", status="DRAFT")
+                return
+        # Linha em processing_jobs com o tempo de cada estágio, tokens e recursos do ffmpeg
+        job = current_job.get()
+        run = await job_metrics.start_run(chapter_id, context["video_url"], MODEL_NAME, job.job_id if job else None)
+        
+        logger.info(f"Processando vídeo: {context['video_url']}")
+        
+        # Artefatos da execução anterior: estágios com as mesmas entradas são pulados
+        checkpoints = Checkpoints(chapter_id, context["checkpoints"])
+
+        # 2. Chama IA
+        result = await ai_processor.analyze_video(
+            video_path_minio=context["video_url"],
+            system_context=context["system_context"],
+            module_context=context["module_context"],
+            user_goal=user_goal,
+            checkpoints=checkpoints
+        )
+        
+        logger.info(f"IA finalizou. Título: {result.get('title')}")
+        check_cancelled()
+
+        # 3. Gera Áudio (TTS)
+        if "steps" in result:
+            logger.info(f"Gerando áudio para {len(result['steps'])} passos...")
+            steps = [step for step in result["steps"] if step.get("description", "")]
+            await progress.report("tts", steps_done=0, steps_total=len(steps))
+            with job_metrics.stage("tts"):
+                audios = await _synthesize_all(checkpoints, [step["description"] for step in steps])
+            for step, (audio_url, duration) in zip(steps, audios):
+                step["audio_url"] = audio_url
+                step["duration"] = duration
+            check_cancelled()
+
+            # Áudios de textos que saíram do manual deixam de ser checkpoint (o GC remove)
+            used = {TTS_PREFIX + input_hash(step["description"], DEFAULT_VOICE) for step in steps}
+            await checkpoints.drop(*(stage for stage in checkpoints.stages(TTS_PREFIX) if stage not in used))
+        if checkpoints.hits:
+            logger.info(f"Checkpoints reaproveitados no capítulo {chapter_id}: {len(checkpoints.hits)} estágio(s)")
+
+        # 4. Salva Resultado Final (DRAFT: pronto para workbench), só se não foi cancelado
+        import json
+        await progress.report("save")
+        with job_metrics.stage("save"):
+            await _save_guarded(chapter_id, expected_status, {
+                "text_content": json.dumps(result, ensure_ascii=False),
+                "status": "DRAFT"
+            })
+        await job_metrics.finish_run(run, "completed")
+        await progress.report("done", status="DRAFT")
+        logger.info(f"Job {chapter_id} concluído com sucesso!")
+
+    except JobCancelled:
+        # Áudios já enviados ficam órfãos e saem no GC do storage
+        logger.info(f"Job {chapter_id} cancelado; nada gravado.")
+        if run:
+            await job_metrics.finish_run(run, "cancelled")
+        await progress.report("cancelled")
+        raise
+    except JobDeferred as e:
+        if not can_defer():
+            # Adiamentos esgotados: a fila não devolve mais o job, o capítulo não pode ficar PENDING
+            logger.error(f"Job {chapter_id} adiado vezes demais; desistindo: {e}")
+            await _process_video_failed(chapter_id, expected_status, run, e)
+            raise
+        # Cota do Gemini: o capítulo continua PENDING e o job volta para a fila
+        # (proxy, arquivo no Google e áudios ficam nos checkpoints para a próxima vez)
+        logger.warning(f"Job {chapter_id} adiado {e.delay:.0f}s: {e}")
+        if run:
+            await job_metrics.finish_run(run, "throttled", str(e))
+        await progress.report("queued", status="PENDING", reason="rate_limited", retry_in=round(e.delay))
+        raise
+    except Exception as e:
+        if not final_attempt():
+            # A fila tenta de novo com backoff; o capítulo continua PENDING até lá
+            logger.warning(f"Job {chapter_id} falhou; nova tentativa depois: {e}")
+            if run:
+                await job_metrics.finish_run(run, "retrying", str(e))
+            await progress.report("queued", status="PENDING", reason="retry", error=str(e))
+            raise
+        logger.error(f"Erro fatal no job {chapter_id}: {e}", exc_info=True)
+        await _process_video_failed(chapter_id, expected_status, run, e)
+        raise
+
+
+async def _process_video_failed(chapter_id: int, expected_status: str, run, error: Exception):
+    """Falha definitiva do process_video: métricas, capítulo FAILED com o erro e evento failed."""
+    if run:
+        await job_metrics.finish_run(run, "failed", str(error))
+    try:
+        # Persist error state so we can debug via DB/Frontend
+        import json
+        await _save_guarded(chapter_id, expected_status, {
+            "status": "FAILED",
+            "text_content": json.dumps({
+                "error": "Processing Failed",
+                "details": str(error)
+            }, ensure_ascii=False)
+        })
+        await progress.report("failed", status="FAILED", error=str(error))
+    except Exception as db_err:
+        print(f"[Worker] Falha ao salvar estado de erro no DB: {db_err}")
+
+
+@job_handler(STITCH_PUBLISH)
+async def stitch_and_publish_job(chapter_id: int):
+    """Job do publish: junta intro/outro ao vídeo (ffmpeg) e marca o capítulo COMPLETED."""
+    # Leitura numa sessão curta: o ffmpeg roda sem conexão do pool
     async with AsyncSessionLocal() as db:
+        chapter = await db.get(Chapter, chapter_id)
+        if not chapter: return
+        expected_status = chapter.status
+        video_url = chapter.video_url
+        raw_video_url = chapter.raw_video_url
+        raw_archived = chapter.raw_archived_at is not None
+        
+        # Get Config
+        config = await db.scalar(select(Configuration).limit(1))
+        intro = config.intro_video_url if config else None
+        outro = config.outro_video_url if config else None
+    
+    progress.current_chapter.set(chapter_id)
+    try:
+        # Guarda o original bruto no primeiro publish (video_url passa a ser o vídeo final).
+        # Se a retenção já descartou o original, mantém o vídeo final que existe.
+        values = {}
+        if raw_video_url is None and not raw_archived:
+            raw_video_url = values["raw_video_url"] = video_url
+
+        # Stitch
+        if (intro or outro) and raw_video_url:
+            print(f"Stitching chapter {chapter_id} with intro={intro}, outro={outro}")
+            await progress.report("stitch")
+            final_url = await video_processor.stitch_videos(raw_video_url, intro, outro)
+            values["stitched_video_url"] = final_url
+            values["video_url"] = final_url # Update main URL to pointed to stitched? Or keep raw?
+            # User asked: "inserido no vídeo automaticamente". 
+            # Let's update `video_url` to be the stitched one so the player plays the final version.
+            # But keep `stitched_video_url` just in case we want to revert/debug.
+        
+        values["status"] = "COMPLETED"
+        await progress.report("save")
+        await _save_guarded(chapter_id, expected_status, values)
+        await progress.report("done", status="COMPLETED")
+        print(f"Chapter {chapter_id} published successfully.")
+        
+    except JobCancelled:
+        await progress.report("cancelled")
+        raise
+    except Exception as e:
+        print(f"Stitching failed: {e}")
+        if not final_attempt():
+            await progress.report("queued", status=expected_status, reason="retry", error=str(e))
+            raise
         try:
-            # 1. Busca dados completos com relacionamentos para obter o Contexto
-            from sqlalchemy.orm import selectinload
-            stmt = (
-                select(Chapter)
-                .where(Chapter.id == chapter_id)
-                .options(
-                    selectinload(Chapter.collection)
-                    .selectinload(Collection.module)
-                    .selectinload(Module.system)
-                )
-            )
-            result = await db.execute(stmt)
-            chapter = result.scalar_one_or_none()
-            
-            if not chapter:
-                logger.warning(f"Chapter {chapter_id} não encontrado.")
-                return
-            
-            # Recupera Contextos da Hierarquia
-            system_context_str = ""
-            module_context_str = ""
-            
-            if chapter.collection and chapter.collection.module:
-                mod = chapter.collection.module
-                module_context_str = mod.context_prompt or f"Module Name: {mod.name}"
-                
-                if mod.system:
-                    sys = mod.system
-                    system_context_str = sys.context_prompt or f"System Name: {sys.name}"
-            
-            logger.info(f"Processando vídeo: {chapter.video_url}")
-            
-            # 2. Chama IA
-            result = await ai_processor.analyze_video(
-                video_path_minio=chapter.video_url,
-                system_context=system_context_str,
-                module_context=module_context_str,
-                user_goal=user_goal
+            await _save_guarded(chapter_id, expected_status, {"status": "FAILED"}) # Or revert to draft?
+            await progress.report("failed", status="FAILED", error=str(e))
+        except Exception as db_err:
+            # Inclusive JobCancelled: não esconde o erro original do job
+            print(f"[Worker] Falha ao salvar estado de erro no DB: {db_err}")
+        raise
+
+
+@job_handler(ARCHIVE_RAW)
+async def archive_raw_job(chapter_id: int):
+    """Job de manutenção: retenção do original bruto de um capítulo publicado."""
+    await raw_retention.archive_chapter(chapter_id)
+
+
+@job_handler(REGENERATE_AUDIO)
+async def regenerate_audio_job(chapter_id: int, step_index: int, text: str):
+    """
+    Job do editor (faixa interativa): novo áudio de um passo com o texto editado.
+    O resultado vai no evento done (step_index, audio_url, duration) que o request espera.
+    Falha não mexe no status do capítulo: só o áudio do passo deixa de ser trocado.
+    """
+    import json
+    progress.current_chapter.set(chapter_id)
+    job = current_job.get()
+    event = {"job_id": job.job_id if job else None, "step_index": step_index}
+    try:
+        await progress.report("tts", steps_done=0, steps_total=1, **event)
+        audio_path, duration = await tts_service.generate_audio(text)
+        if not audio_path:
+            raise RuntimeError("Failed to generate audio")
+        check_cancelled()
+
+        # Lê e grava com a linha travada: um PUT do editor no meio não perde a troca do áudio
+        async with AsyncSessionLocal() as db:
+            chapter = await db.get(Chapter, chapter_id, with_for_update=True)
+            if not chapter or not chapter.text_content:
+                raise RuntimeError(f"Chapter {chapter_id} sem conteúdo")
+            content = json.loads(chapter.text_content)
+            step = content["steps"][step_index]
+            step["description"] = text
+            step["audio_url"] = audio_path
+            step["duration"] = duration
+            result = await db.execute(
+                update(Chapter)
+                .where(Chapter.id == chapter_id, still_current())
+                .values(text_content=json.dumps(content, ensure_ascii=False))
+                .execution_options(synchronize_session=False)
             )
-            
-            logger.info(f"IA finalizou. Título: {result.get('title')}")
-
-            # 3. Gera Áudio (TTS)
-            if "steps" in result:
-                logger.info(f"Gerando áudio para {len(result['steps'])} passos...")
-                for step in result["steps"]:
-                    description = step.get("description", "")
-                    if description:
-                        audio_url, duration = await tts_service.generate_audio(description)
-                        step["audio_url"] = audio_url
-                        step["duration"] = duration
-
-            # 4. Salva Resultado Final
-            import json
-            chapter.text_content = json.dumps(result, ensure_ascii=False)
-            chapter.status = "DRAFT" # Pronto para workbench
-            
+            if result.rowcount == 0:
+                raise JobCancelled(f"Áudio do chapter {chapter_id} não gravado: job cancelado")
             await db.commit()
-            logger.info(f"Job {chapter_id} concluído com sucesso!")
-
-        except Exception as e:
-            logger.error(f"Erro fatal no job {chapter_id}: {e}", exc_info=True)
-            try:
-                # Persist error state so we can debug via DB/Frontend
-                import json
-                chapter.status = "FAILED"
-                chapter.text_content = json.dumps({
-                    "error": "Processing Failed",
-                    "details": str(e)
-                }, ensure_ascii=False)
-                await db.commit()
-            except Exception as db_err:
-                print(f"[Worker] Falha ao salvar estado de erro no DB: {db_err}")
+        await progress.report("done", audio_url=audio_path, duration=duration, **event)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        print(f"[Worker] Falha ao regenerar áudio do chapter {chapter_id}, passo {step_index}: {e}")
+        if final_attempt():
+            await progress.report("failed", error=str(e), **event)
+        else:
+            await progress.report("queued", reason="retry", error=str(e), **event)
+        raise
@@ -2,11 +2,11 @@ import { useEffect, useState, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import {
     Container, Title, Button, Group, Stack, TextInput,
-    Textarea, Card, Badge, Loader, Text, ActionIcon
+    Textarea, Card, Badge, Loader, Text, ActionIcon, Progress
 } from '@mantine/core';
 import { IconArrowLeft, IconDeviceFloppy, IconRefresh, IconEye } from '@tabler/icons-react';
 import { api } from '../services/api';
-import type { Chapter } from '../types';
+import type { Chapter, ProgressEvent } from '../types';
 import { Timeline } from '../components/Timeline';
 
 interface Step {
@@ -21,6 +21,22 @@ interface ManualContent {
     steps: Step[];
 }
 
+// Regenerar áudio: espera pela conexão do stream antes do POST e pelo job depois do 202
+const STREAM_OPEN_TIMEOUT_MS = 5_000;
+const AUDIO_JOB_TIMEOUT_MS = 120_000;
+
+const STAGE_LABELS: Record<string, string> = {
+    queued: 'Na fila',
+    started: 'Iniciando',
+    download: 'Baixando o vídeo',
+    proxy: 'Otimizando o vídeo',
+    gemini_upload: 'Enviando para a IA',
+    gemini_wait: 'IA preparando o vídeo',
+    generate: 'IA criando o passo-a-passo',
+    tts: 'Gerando narração',
+    save: 'Salvando',
+};
+
 export function EditorPage() {
     const { id } = useParams();
     const navigate = useNavigate();
@@ -34,6 +50,7 @@ export function EditorPage() {
     const [activeStep, setActiveStep] = useState<number>(-1);
     const [videoDuration, setVideoDuration] = useState(0);
     const [currentTime, setCurrentTime] = useState(0);
+    const [progress, setProgress] = useState<ProgressEvent | null>(null);
     const vidRef = useRef<HTMLVideoElement>(null);
     const audioRefs = useRef<(HTMLAudioElement | null)[]>([]);
 
@@ -42,6 +59,21 @@ export function EditorPage() {
         fetchChapter();
     }, [id]);
 
+    // Enquanto processa, acompanha o job pelo stream SSE (em vez de buscar o capítulo a cada 3s)
+    // e só recarrega o capítulo quando o job termina.
+    useEffect(() => {
+        if (!chapter || chapter.status !== 'PENDING') return;
+        setProgress(null);
+        const stop = api.chapters.watchProgress([chapter.id], (event) => {
+            setProgress(event);
+            if (['done', 'failed', 'cancelled'].includes(event.stage)) {
+                stop();
+                fetchChapter();
+            }
+        });
+        return stop;
+    }, [chapter?.id, chapter?.status]);
+
     useEffect(() => {
         if (content && content.steps) {
             audioRefs.current = audioRefs.current.slice(0, content.steps.length);
@@ -54,15 +86,11 @@ export function EditorPage() {
             const data = await api.chapters.get(Number(id));
             setChapter(data);
 
-            // POLLING LOGIC
-            // POLLING LOGIC
+            // Processando: o stream de progresso avisa quando terminar
             if (data.status === 'PENDING') {
-                // Optimize: Only update state if not already in pending state (empty steps)
-                // This prevents the video/page from "reloading" or flickering every 3 seconds
                 if (!content || (content.steps && content.steps.length > 0)) {
                     setContent({ title: data.title, steps: [] });
                 }
-                setTimeout(fetchChapter, 3000); // Retry in 3s
                 return;
             }
 
@@ -115,16 +143,53 @@ export function EditorPage() {
     const handleRegenerateAudio = async (index: number) => {
         if (!content || !chapter) return;
 
+        // Inscreve no stream de progresso antes do POST: o worker pode terminar entre a
+        // resposta 202 e a inscrição. Eventos que chegam antes da resposta ficam guardados.
+        const seen: ProgressEvent[] = [];
+        let onJobEvent: ((event: ProgressEvent) => void) | null = null;
+        let opened = () => {};
+        const ready = new Promise<void>((resolve) => { opened = () => resolve(); });
+        const stop = api.chapters.watchProgress(
+            [chapter.id],
+            (event) => {
+                if (onJobEvent) onJobEvent(event);
+                else seen.push(event);
+            },
+            () => opened()
+        );
+
         try {
-            // Indicar loading no botão (usando state local ou apenas global loading se preferir, 
-            // mas local é melhor UI. Para simplicidade, vamos de loading global rápido ou alert)
-            // Ideal seria ter um loading por passo, mas vamos usar um toast/alert simples por enquanto
+            // Sem conexão no stream, segue mesmo assim: o timeout abaixo cobre o pior caso
+            await Promise.race([ready, new Promise((resolve) => setTimeout(resolve, STREAM_OPEN_TIMEOUT_MS))]);
+
             const step = content.steps[index];
             const result = await api.chapters.regenerateAudio(chapter.id, index, step.description);
+            let audioUrl = result.audio_url;
+            if (!audioUrl) {
+                // Fila ocupada: o worker ainda não terminou; o resultado chega pelo stream de progresso
+                audioUrl = await new Promise<string>((resolve, reject) => {
+                    const timer = setTimeout(
+                        () => reject(new Error('Tempo esgotado esperando o áudio')),
+                        AUDIO_JOB_TIMEOUT_MS
+                    );
+                    const handle = (event: ProgressEvent) => {
+                        if (event.job_id !== result.job_id) return;
+                        if (event.stage === 'done' && event.audio_url) {
+                            clearTimeout(timer);
+                            resolve(`/api/v1/stream?path=${event.audio_url}`);
+                        } else if (event.stage === 'failed' || event.stage === 'cancelled') {
+                            clearTimeout(timer);
+                            reject(new Error(event.error || 'Falha ao gerar áudio'));
+                        }
+                    };
+                    onJobEvent = handle;
+                    seen.splice(0).forEach(handle);
+                });
+            }
 
             // Atualizar audio_url do passo
             const newSteps = [...content.steps];
-            newSteps[index] = { ...newSteps[index], audio_url: result.audio_url };
+            newSteps[index] = { ...newSteps[index], audio_url: audioUrl };
             setContent({ ...content, steps: newSteps });
 
             // Force reload audio element
@@ -135,6 +200,8 @@ export function EditorPage() {
         } catch (error) {
             console.error(error);
             alert("Erro ao regenerar áudio.");
+        } finally {
+            stop();
         }
     };
 
@@ -293,6 +360,16 @@ export function EditorPage() {
                                 <Text c="dimmed" size="sm">A inteligência artificial está analisando o vídeo e criando o passo-a-passo.</Text>
                                 <Text c="dimmed" size="xs">Isso pode levar alguns segundos.</Text>
                             </div>
+                            {progress && (
+                                <Stack gap={4} w="100%" maw={360}>
+                                    <Progress value={progress.percent} animated />
+                                    <Text c="dimmed" size="xs" ta="center">
+                                        {STAGE_LABELS[progress.stage] || progress.stage}
+                                        {progress.steps_total ? ` (${progress.steps_done}/${progress.steps_total})` : ''}
+                                        {` · ${Math.round(progress.percent)}%`}
+                                    </Text>
+                                </Stack>
+                            )}
                             <Button
                                 color="red"
                                 variant="subtle"
@@ -338,7 +415,7 @@ export function EditorPage() {
                                         try {
                                             // @ts-ignore
                                             await api.chapters.reprocess(chapter.id);
-                                            // Polling will handle the rest
+                                            // O stream de progresso acompanha o resto
                                         } catch (e) {
                                             alert("Erro ao reiniciar processamento.");
                                             setChapter({ ...chapter, status: 'FAILED' }); // Revert on error
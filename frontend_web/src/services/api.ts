@@ -1,4 +1,4 @@
-import type { Chapter, System, Module } from '../types';
+import type { Chapter, System, Module, ProgressEvent } from '../types';
 
 const API_BASE = '/api/v1';
 
@@ -48,7 +48,8 @@ export const api = {
         get: (id: number) => request<Chapter>(`/chapters/${id}`),
         delete: (id: number) => request(`/chapters/${id}`, { method: 'DELETE' }),
         regenerateAudio: (id: number, stepIndex: number, text: string) =>
-            request<{ audio_url: string }>(`/chapters/${id}/regenerate_audio`, {
+            // 202: o job ainda está no worker; audio_url chega pelo watchProgress (evento done do job_id)
+            request<{ audio_url?: string; duration?: number; job_id?: number }>(`/chapters/${id}/regenerate_audio`, {
                 method: 'POST',
                 body: JSON.stringify({ step_index: stepIndex, text })
             }),
@@ -61,6 +62,15 @@ export const api = {
         cancel: (id: number) => request<{ message: string; status: string }>(`/chapters/${id}/cancel`, { method: 'POST' }),
         publish: (id: number) => request<{ message: string; status: string }>(`/chapters/${id}/publish`, { method: 'POST' }),
         toggleFavorite: (id: number) => request<{ ok: boolean; is_favorite: boolean }>(`/chapters/${id}/favorite`, { method: 'POST' }),
+        // Um único stream SSE para vários capítulos; o navegador reconecta sozinho se cair.
+        // onOpen: a API já está inscrita (eventos publicados a partir daqui chegam).
+        // Retorna a função que fecha o stream.
+        watchProgress: (ids: number[], onEvent: (event: ProgressEvent) => void, onOpen?: () => void) => {
+            const source = new EventSource(`${API_BASE}/chapters/progress?ids=${ids.join(',')}`);
+            source.addEventListener('progress', (e) => onEvent(JSON.parse((e as MessageEvent).data)));
+            if (onOpen) source.addEventListener('open', onOpen);
+            return () => source.close();
+        },
     },
     observability: {
         stats: () => request<any>('/observability/analytics/stats'),
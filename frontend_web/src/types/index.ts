@@ -24,3 +24,18 @@ export interface Chapter {
     // Future fields for Sprint 4
     content?: any;
 }
+
+// Evento do stream SSE de progresso (GET /chapters/progress)
+export interface ProgressEvent {
+    chapter_id: number;
+    stage: 'queued' | 'started' | 'download' | 'proxy' | 'gemini_upload' | 'gemini_wait' | 'generate' | 'tts' | 'stitch' | 'save' | 'done' | 'failed' | 'cancelled';
+    percent: number;
+    status?: Chapter['status'];
+    steps_done?: number;
+    steps_total?: number;
+    error?: string;
+    // Jobs do editor (regenerar áudio de um passo)
+    job_id?: number;
+    step_index?: number;
+    audio_url?: string;
+}
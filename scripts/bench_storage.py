@@ -0,0 +1,84 @@
+"""
+Benchmark dos backends de armazenamento (sem rede quando usado com local/memory).
+
+Uso:
+    STORAGE_BACKEND=local STORAGE_LOCAL_ROOT=/tmp/bench python -m scripts.bench_storage
+    STORAGE_BACKEND=memory python -m scripts.bench_storage --size-mb 50 --runs 5
+
+Mede, para o backend configurado: upload em streaming (save_stream), download
+para arquivo (download_file), leitura completa e leituras por trecho (Range),
+com os mesmos tamanhos de parte usados pela aplicação.
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+import uuid
+from app.core.config import settings
+from app.services.storage import storage
+
+
+def _timed(fn) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def _read_all(filename: str, offset: int = 0, length: int = 0, chunk_size: int = 256 * 1024) -> int:
+    response = storage.get_object(filename, offset, length)
+    total = 0
+    try:
+        while True:
+            chunk = response.read(chunk_size)
+            if not chunk:
+                break
+            total += len(chunk)
+    finally:
+        response.close()
+        response.release_conn()
+    return total
+
+
+def bench(size_mb: int, runs: int, range_kb: int):
+    storage.ensure_ready()
+    payload = os.urandom(size_mb * 1024 * 1024)
+    size = len(payload)
+    range_size = range_kb * 1024
+    results = {"upload": [], "download_file": [], "read": [], "range_read": []}
+
+    for _ in range(runs):
+        filename = f"bench/{uuid.uuid4()}.bin"
+        results["upload"].append(_timed(
+            lambda: storage.save_stream(io.BytesIO(payload), filename, "application/octet-stream", settings.UPLOAD_PART_SIZE)
+        ))
+
+        with tempfile.NamedTemporaryFile() as tmp:
+            results["download_file"].append(_timed(lambda: storage.download_file(filename, tmp.name)))
+
+        results["read"].append(_timed(lambda: _read_all(filename)))
+
+        # 100 leituras de trechos espalhados pelo arquivo (como um player fazendo seek)
+        step = max(1, (size - range_size) // 100)
+        results["range_read"].append(_timed(
+            lambda: [_read_all(filename, offset, range_size) for offset in range(0, size - range_size, step)]
+        ))
+
+        storage.remove_object(filename)
+
+    print(f"Backend: {settings.STORAGE_BACKEND} | objeto: {size_mb} MB | execuções: {runs}")
+    for name, times in results.items():
+        best = min(times)
+        if name == "range_read":
+            print(f"  {name:<14} melhor {best * 1000:8.1f} ms  (100 x {range_kb} KB, {best * 10:.2f} ms/leitura)")
+        else:
+            print(f"  {name:<14} melhor {best * 1000:8.1f} ms  ({size_mb / best:8.1f} MB/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do backend de armazenamento configurado")
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--range-kb", type=int, default=256)
+    args = parser.parse_args()
+    bench(args.size_mb, args.runs, args.range_kb)
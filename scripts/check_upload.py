@@ -17,7 +17,7 @@ import io
 
 async def check_upload_local():
     print("Initializing Storage Service...")
-    print(f"Endpoint: {storage.client._base_url}")
+    print(f"Endpoint: {storage.backend.client._base_url}")
     
     try:
         data = b"Test Upload Content"
@@ -10,15 +10,15 @@ async def debug_minio():
     
     print(f"Testing MinIO connection to bucket: {storage.bucket_name}")
     try:
-        exists = storage.client.bucket_exists(storage.bucket_name)
+        exists = storage.backend.client.bucket_exists(storage.bucket_name)
         print(f"Bucket exists: {exists}")
         if not exists:
             print("Creating bucket...")
-            storage.client.make_bucket(storage.bucket_name)
+            storage.backend.client.make_bucket(storage.bucket_name)
             
         print("Uploading test file...")
         data = b"Hello World"
-        storage.client.put_object(
+        storage.backend.client.put_object(
             storage.bucket_name,
             "test_debug.txt",
             io.BytesIO(data),
@@ -0,0 +1,20 @@
+import asyncio
+from sqlalchemy import select
+from app.db.session import AsyncSessionLocal
+from app.models.configuration import Configuration
+from app.routers.configuration import _migrate_inline_logo
+
+async def migrate_logos():
+    """Move logos em base64 da tabela configurations para variantes no storage."""
+    async with AsyncSessionLocal() as db:
+        configs = (await db.scalars(select(Configuration))).all()
+        for config in configs:
+            size = len(config.logo_url or "")
+            if await _migrate_inline_logo(config):
+                print(f"Configuration {config.id}: logo base64 ({size} chars) -> {config.logo_variants}")
+            else:
+                print(f"Configuration {config.id}: nada a migrar")
+        await db.commit()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_logos())
@@ -0,0 +1,100 @@
+import asyncio
+from sqlalchemy import text
+from app.db.session import engine
+from app.models.job import ACTIVE_JOB_PREDICATE
+
+async def migrate():
+    async with engine.begin() as conn:
+        print("Migrating Database Schema for Upload/Pipeline Features...")
+
+        # IF NOT EXISTS: um ALTER com erro abortaria a transação inteira (engine.begin)
+        # 1. upload_sessions (tabela criada pelo init_db; colunas adicionadas depois)
+        try:
+            await conn.execute(text("ALTER TABLE upload_sessions ADD COLUMN IF NOT EXISTS expected_size BIGINT"))
+            print("Added 'expected_size' to upload_sessions.")
+        except Exception as e:
+            print(f"Skipped 'expected_size' (probably exists): {e}")
+
+        # 2. chapters: original bruto, retenção (cold tier), checkpoints e objetivo do upload
+        for column, ddl in [
+            ("raw_video_url", "VARCHAR(500)"),
+            ("raw_archived_at", "TIMESTAMP"),
+            ("raw_bytes_saved", "BIGINT DEFAULT 0"),
+            ("checkpoints", "JSON"),
+            ("user_goal", "TEXT"),
+        ]:
+            try:
+                await conn.execute(text(f"ALTER TABLE chapters ADD COLUMN IF NOT EXISTS {column} {ddl}"))
+                print(f"Added '{column}' to chapters.")
+            except Exception as e:
+                print(f"Skipped '{column}' (probably exists): {e}")
+
+        # 3. configurations: variantes do logo (base64 antigo -> scripts/migrate_logos.py)
+        try:
+            await conn.execute(text("ALTER TABLE configurations ADD COLUMN IF NOT EXISTS logo_variants JSON"))
+            print("Added 'logo_variants' to configurations.")
+        except Exception as e:
+            print(f"Skipped 'logo_variants' (probably exists): {e}")
+
+        # 4. jobs: faixas de prioridade, fair share por sistema e cancelamento
+        for column, ddl in [
+            ("priority", "INTEGER NOT NULL DEFAULT 1"),
+            ("system_id", "INTEGER"),
+            ("wait_seconds", "DOUBLE PRECISION"),
+            ("cancel_requested_at", "TIMESTAMP"),
+            ("deferrals", "INTEGER NOT NULL DEFAULT 0"),
+        ]:
+            try:
+                await conn.execute(text(f"ALTER TABLE jobs ADD COLUMN IF NOT EXISTS {column} {ddl}"))
+                print(f"Added '{column}' to jobs.")
+            except Exception as e:
+                print(f"Skipped '{column}' (probably exists): {e}")
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_jobs_lane ON jobs (status, priority, system_id)"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_jobs_started ON jobs (started_at)"))
+        # Um job ativo por capítulo/tipo. Duplicatas antigas: cancela todas menos a mais recente.
+        await conn.execute(text(f"""
+            UPDATE jobs
+            SET cancel_requested_at = now(),
+                status = CASE WHEN status = 'QUEUED' THEN 'CANCELLED' ELSE status END
+            WHERE {ACTIVE_JOB_PREDICATE}
+              AND id NOT IN (
+                  SELECT max(id) FROM jobs WHERE {ACTIVE_JOB_PREDICATE} GROUP BY chapter_id, kind
+              )
+        """))
+        await conn.execute(text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_active_chapter ON jobs (chapter_id, kind) WHERE {ACTIVE_JOB_PREDICATE}"
+        ))
+
+        # 5. idempotency_keys é tabela nova (init_db cria); locked_until veio depois
+        try:
+            await conn.execute(text("ALTER TABLE idempotency_keys ADD COLUMN IF NOT EXISTS locked_until TIMESTAMP"))
+            print("Added 'locked_until' to idempotency_keys.")
+        except Exception as e:
+            print(f"Skipped 'locked_until' (probably exists): {e}")
+
+        # 6. processing_jobs: uma linha por execução com tempo por estágio e recursos
+        for column, ddl in [
+            ("chapter_id", "INTEGER"),
+            ("job_id", "INTEGER"),
+            ("stage_ms", "JSON"),
+            ("child_cpu_seconds", "DOUBLE PRECISION DEFAULT 0"),
+            ("child_max_rss_kb", "INTEGER DEFAULT 0"),
+            ("input_bytes", "BIGINT"),
+            ("proxy_bytes", "BIGINT"),
+        ]:
+            try:
+                await conn.execute(text(f"ALTER TABLE processing_jobs ADD COLUMN IF NOT EXISTS {column} {ddl}"))
+                print(f"Added '{column}' to processing_jobs.")
+            except Exception as e:
+                print(f"Skipped '{column}' (probably exists): {e}")
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_processing_jobs_chapter_id ON processing_jobs (chapter_id)"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_processing_jobs_created_at ON processing_jobs (created_at)"))
+
+        # 7. rate_limits é tabela nova (init_db cria)
+
+        # 8. pending_deletions (fila de remoção do storage) é tabela nova (init_db cria)
+
+        print("Migration complete.")
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,63 @@
+import os
+import pytest
+
+# Configuração mínima para importar o app sem Postgres/MinIO (Settings exige estas variáveis).
+# O banco nunca é acessado: os testes trocam as funções que abrem sessão via monkeypatch.
+for name, value in {
+    "POSTGRES_USER": "u",
+    "POSTGRES_PASSWORD": "p",
+    "POSTGRES_HOST": "127.0.0.1",
+    "POSTGRES_PORT": "5",
+    "POSTGRES_DB": "d",
+    "MINIO_ENDPOINT": "127.0.0.1:9",
+    "MINIO_ACCESS_KEY": "a",
+    "MINIO_SECRET_KEY": "bbbbbbbb",
+    "MINIO_BUCKET_RAW": "documentacao",
+    "MINIO_SECURE": "false",
+    "GOOGLE_API_KEY": "x",
+    "STORAGE_BACKEND": "memory",
+}.items():
+    os.environ.setdefault(name, value)
+
+# Script manual de conectividade com o Gemini (rede e proxy no import), não é teste
+collect_ignore = ["test_gemini.py"]
+
+
+class NullSession:
+    """Sessão sem banco: só o async with (para trocar AsyncSessionLocal)."""
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def null_session():
+    return NullSession
+
+
+class RecordingSession:
+    """Sessão falsa: guarda (SQL, parâmetros) de cada statement e responde rowcount fixo."""
+    def __init__(self, rowcount: int = 1):
+        self.rowcount = rowcount
+        self.statements = []
+        self.committed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt, params=None):
+        self.statements.append((str(stmt), params))
+        return type("Result", (), {"rowcount": self.rowcount})()
+
+    async def commit(self):
+        self.committed = True
+
+
+@pytest.fixture
+def recording_session():
+    return RecordingSession
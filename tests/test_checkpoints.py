@@ -0,0 +1,124 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.db.session import get_db
+from app.models import Chapter
+from app.models.job import Job
+from app.routers import chapter as chapter_router
+from app.services import ai_processor, checkpoints as checkpoints_module
+from app.services.checkpoints import Checkpoints, input_hash
+from app.services.jobs import JobCancelled, JobContext, JobDeferred, current_job
+
+
+@pytest.mark.asyncio
+async def test_get_only_hits_same_inputs():
+    ckpt = Checkpoints(None, {"analysis": {"input": input_hash("a"), "artifact": {"title": "x"}}})
+    assert ckpt.get("analysis", input_hash("b")) is None
+    assert ckpt.get("analysis", input_hash("a")) == {"title": "x"}
+    assert ckpt.hits == ["analysis"]
+
+
+@pytest.mark.asyncio
+async def test_save_is_guarded_by_job_ownership(monkeypatch, recording_session):
+    db = recording_session(rowcount=1)
+    monkeypatch.setattr(checkpoints_module, "AsyncSessionLocal", lambda: db)
+    token = current_job.set(JobContext(7, "w"))
+    try:
+        await Checkpoints(42, {}).put("analysis", "h", {"title": "x"})
+    finally:
+        current_job.reset(token)
+    sql, _ = db.statements[0]
+    assert "EXISTS" in sql and "jobs.locked_by" in sql
+    assert db.committed
+
+
+@pytest.mark.asyncio
+async def test_save_after_losing_the_job_raises(monkeypatch, recording_session):
+    db = recording_session(rowcount=0)
+    monkeypatch.setattr(checkpoints_module, "AsyncSessionLocal", lambda: db)
+    token = current_job.set(JobContext(7, "w"))
+    try:
+        with pytest.raises(JobCancelled):
+            await Checkpoints(42, {}).put("analysis", "h", {"title": "x"})
+    finally:
+        current_job.reset(token)
+    assert not db.committed
+
+
+class FakeDb:
+    """Sessão do router: devolve o capítulo do SELECT ... FOR UPDATE."""
+    def __init__(self, chapter: Chapter):
+        self.chapter = chapter
+        self.committed = False
+
+    async def scalar(self, stmt):
+        return self.chapter
+
+    async def commit(self):
+        self.committed = True
+
+
+@pytest.fixture
+def reprocess(monkeypatch):
+    """POST /chapters/3/reprocess com enqueue falso e o job ativo configurável."""
+    state = {"running": None, "enqueued": [], "chapter": None}
+
+    async def active_job(db, kind, chapter_id):
+        return state["running"]
+
+    async def enqueue(db, kind, payload, **kwargs):
+        state["enqueued"].append(payload)
+        return Job(id=1, payload=payload), False
+
+    async def db():
+        yield FakeDb(state["chapter"])
+
+    monkeypatch.setattr(chapter_router, "active_job", active_job)
+    monkeypatch.setattr(chapter_router, "enqueue", enqueue)
+    app = FastAPI()
+    app.include_router(chapter_router.router)
+    app.dependency_overrides[get_db] = db
+    return TestClient(app), state
+
+
+@pytest.mark.parametrize("stored, expected", [
+    ("Cadastrar cliente", "Cadastrar cliente"),
+    (None, "Criar um manual passo a passo detalhado."),
+])
+def test_reprocess_reuses_upload_goal(reprocess, stored, expected):
+    """O título editado não muda o prompt: a análise continua vindo do checkpoint."""
+    client, state = reprocess
+    state["chapter"] = Chapter(id=3, title="Título editado", user_goal=stored, status="DRAFT")
+    response = client.post("/chapters/3/reprocess")
+    assert response.status_code == 200
+    assert state["enqueued"] == [{"chapter_id": 3, "user_goal": expected}]
+
+
+@pytest.mark.parametrize("force, status_code", [(False, 200), (True, 409)])
+def test_reprocess_leaves_running_job_alone(reprocess, force, status_code):
+    client, state = reprocess
+    checkpoints = {"analysis": {"input": "h", "artifact": {}}}
+    state["chapter"] = Chapter(id=3, title="t", status="PROCESSING", checkpoints=checkpoints)
+    state["running"] = Job(id=5, status="RUNNING")
+    response = client.post("/chapters/3/reprocess", params={"force": force})
+    assert response.status_code == status_code
+    if status_code == 200:
+        assert response.json()["job_id"] == 5 and response.json()["attached"]
+    assert state["enqueued"] == []
+    assert (state["chapter"].status, state["chapter"].checkpoints) == ("PROCESSING", checkpoints)
+
+
+@pytest.mark.parametrize("error, attempts, deferrals, keep", [
+    (JobDeferred("cota", 30), 3, 0, True),                               # adiado: não gasta tentativa
+    (JobDeferred("cota", 30), 1, settings.JOB_MAX_DEFERRALS, False),     # adiamentos esgotados: falha
+    (RuntimeError("500"), 1, 0, True),                                   # nova tentativa com backoff
+    (RuntimeError("500"), 3, 0, False),                                  # última tentativa
+])
+def test_gemini_file_is_kept_only_when_job_requeues(error, attempts, deferrals, keep):
+    token = current_job.set(JobContext(7, "w", attempts=attempts, max_attempts=3, deferrals=deferrals))
+    try:
+        assert ai_processor._requeues(error) is keep
+    finally:
+        current_job.reset(token)
+    assert ai_processor._requeues(error) is False  # fora de um job nada volta para a fila
@@ -0,0 +1,66 @@
+import pytest
+from app.services import circuit_breaker
+from app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from app.services.jobs import JobCancelled
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"t": 100.0}
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now["t"])
+    return now
+
+
+def fail(breaker: CircuitBreaker, error: Exception | None = None, **kwargs):
+    with pytest.raises(type(error or RuntimeError())):
+        with breaker.guard(**kwargs):
+            raise error or RuntimeError("provedor fora")
+
+
+def test_opens_after_threshold_and_rejects(clock):
+    breaker = CircuitBreaker("t", failure_threshold=2, reset_seconds=10, max_reset_seconds=40)
+    fail(breaker)
+    assert breaker.state == CLOSED
+    fail(breaker)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen) as exc:
+        breaker.check()
+    assert exc.value.delay == 10
+    assert breaker.rejected == 1
+
+
+def test_success_resets_consecutive_failures(clock):
+    breaker = CircuitBreaker("t", failure_threshold=2, reset_seconds=10, max_reset_seconds=40)
+    fail(breaker)
+    with breaker.guard():
+        pass
+    fail(breaker)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_one_probe_and_closes_on_success(clock):
+    breaker = CircuitBreaker("t", failure_threshold=1, reset_seconds=10, max_reset_seconds=40)
+    fail(breaker)
+    clock["t"] += 10
+    with breaker.guard():
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow()  # só uma sondagem por vez
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_doubles_open_time_up_to_max(clock):
+    breaker = CircuitBreaker("t", failure_threshold=1, reset_seconds=10, max_reset_seconds=25)
+    fail(breaker)
+    for expected in (20, 25, 25):
+        clock["t"] += breaker.retry_in()
+        fail(breaker)
+        assert breaker.state == OPEN
+        assert breaker.retry_in() == expected
+
+
+def test_ignored_errors_and_cancellation_do_not_count(clock):
+    breaker = CircuitBreaker("t", failure_threshold=1, reset_seconds=10, max_reset_seconds=40)
+    fail(breaker, ValueError("429"), ignore=lambda e: isinstance(e, ValueError))
+    fail(breaker, JobCancelled("cancelado"))
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
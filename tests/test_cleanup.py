@@ -0,0 +1,98 @@
+import json
+import pytest
+from app.models import Chapter
+from app.services import cleanup, storage_gc
+from app.services.cleanup import CleanupQueue, chapter_object_keys, normalize_key
+
+
+class FakeSession:
+    """Sessão falsa: devolve o lote da fila e guarda os statements executados."""
+    def __init__(self, batch):
+        self.batch = batch
+        self.statements = []
+        self.committed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def scalars(self, stmt):
+        self.statements.append(str(stmt))
+        return type("Scalars", (), {"all": lambda _: list(self.batch)})()
+
+    async def execute(self, stmt, params=None):
+        self.statements.append(str(stmt))
+
+    async def commit(self):
+        self.committed = True
+
+    async def rollback(self):
+        pass
+
+
+def test_normalize_key_accepts_every_stored_form():
+    assert normalize_key("documentacao/a.mp3") == "a.mp3"
+    assert normalize_key("/api/v1/stream?path=documentacao%2Fa.mp3") == "a.mp3"
+    assert normalize_key("a.mp3") == "a.mp3"
+    assert normalize_key(None) is None
+
+
+def test_chapter_object_keys_include_audios_and_checkpoints():
+    chapter = Chapter(
+        video_url="documentacao/v.webm",
+        stitched_video_url=None,
+        raw_video_url="documentacao/raw.webm",
+        text_content=json.dumps({"steps": [{"audio_url": "/api/v1/stream?path=documentacao/s1.mp3"}, {}]}),
+        checkpoints={"proxy": {"input": "h", "artifact": {"object_key": "proxies/p.mp4"}}},
+    )
+    keys = chapter_object_keys(chapter)
+    assert keys == {"v.webm", "raw.webm", "s1.mp3", "proxies/p.mp4"}
+
+
+@pytest.mark.asyncio
+async def test_enqueue_goes_in_the_callers_transaction():
+    db = FakeSession([])
+    queue = CleanupQueue(batch_size=2)
+    await queue.enqueue(db, {"a", "b", "c"})
+    assert len(db.statements) == 2
+    assert all(sql.startswith("INSERT INTO pending_deletions") and "ON CONFLICT" in sql for sql in db.statements)
+    assert not db.committed
+    assert queue.enqueued == 3
+
+
+@pytest.mark.asyncio
+async def test_batch_skips_keys_still_referenced(monkeypatch):
+    db = FakeSession(["shared.webm", "orphan.mp3"])
+    removed = []
+    marks = []
+
+    async def referenced_keys(session, include_hashes=True):
+        marks.append(include_hashes)
+        return {"shared.webm", "other.webm"}
+
+    async def remove_objects(names):
+        removed.extend(names)
+        return []
+
+    monkeypatch.setattr(cleanup, "AsyncSessionLocal", lambda: db)
+    monkeypatch.setattr(storage_gc, "referenced_keys", referenced_keys)
+    monkeypatch.setattr(cleanup.async_storage, "remove_objects", remove_objects)
+
+    queue = CleanupQueue()
+    assert await queue.process_batch() == 2
+    assert marks == [False]  # conjunto de referências montado uma vez, sem video_hashes
+    assert removed == ["orphan.mp3"]
+    assert (queue.deleted, queue.skipped) == (1, 1)
+    assert any(sql.startswith("DELETE FROM video_hashes") for sql in db.statements)
+    assert db.statements[-1].startswith("DELETE FROM pending_deletions")
+    assert db.committed
+
+
+@pytest.mark.asyncio
+async def test_empty_queue_does_nothing(monkeypatch):
+    db = FakeSession([])
+    monkeypatch.setattr(cleanup, "AsyncSessionLocal", lambda: db)
+    assert await CleanupQueue().process_batch() == 0
+    assert not db.committed
@@ -0,0 +1,59 @@
+import pytest
+from app.services import worker
+
+
+@pytest.fixture
+def storage(monkeypatch, null_session):
+    """Hash fixo, registro de hash e análise falsos; guarda a ordem das operações."""
+    calls = {"log": [], "original": "documentacao/original.webm", "analysis": '{"title": "x"}'}
+
+    async def hash_object(path):
+        calls["log"].append(("hash", path))
+        return "ab" * 32, 10
+
+    async def remove_object(path):
+        calls["log"].append(("remove", path))
+
+    async def register(db, sha256, video_path, size, remove_duplicate=True):
+        assert remove_duplicate is False
+        return calls["original"] or video_path
+
+    async def analysis(db, video_path):
+        return calls["analysis"]
+
+    async def save_guarded(chapter_id, expected_status, values):
+        calls["log"].append(("save", values))
+
+    monkeypatch.setattr(worker, "AsyncSessionLocal", null_session)
+    monkeypatch.setattr(worker.async_storage, "hash_object", hash_object)
+    monkeypatch.setattr(worker.async_storage, "remove_object", remove_object)
+    monkeypatch.setattr(worker, "register_video_hash", register)
+    monkeypatch.setattr(worker, "find_existing_analysis", analysis)
+    monkeypatch.setattr(worker, "_save_guarded", save_guarded)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_new_video_is_kept(storage):
+    storage["original"] = None
+    url, reused = await worker._deduplicate(1, "PENDING", "documentacao/novo.webm")
+    assert (url, reused) == ("documentacao/novo.webm", False)
+    assert storage["log"] == [("hash", "documentacao/novo.webm")]
+
+
+@pytest.mark.asyncio
+async def test_duplicate_reuses_analysis_and_removes_copy_after_save(storage):
+    url, reused = await worker._deduplicate(1, "PENDING", "documentacao/novo.webm")
+    assert (url, reused) == ("documentacao/original.webm", True)
+    hashed, (op, values), removed = storage["log"]
+    assert op == "save"
+    assert values == {"video_url": "documentacao/original.webm", "text_content": '{"title": "x"}', "status": "DRAFT"}
+    assert removed == ("remove", "documentacao/novo.webm")
+
+
+@pytest.mark.asyncio
+async def test_duplicate_without_analysis_points_to_original(storage):
+    storage["analysis"] = None
+    url, reused = await worker._deduplicate(1, "PENDING", "documentacao/novo.webm")
+    assert (url, reused) == ("documentacao/original.webm", False)
+    assert storage["log"][1] == ("save", {"video_url": "documentacao/original.webm"})
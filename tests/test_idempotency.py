@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+from app.models.idempotency import IdempotencyKey
+from app.services import idempotency
+
+
+class FakeRequest:
+    method = "POST"
+    url = type("URL", (), {"path": "/api/v1/chapters/12/publish"})()
+
+
+class KeySession:
+    """Sessão falsa: compila os statements (dialeto Postgres) e responde rowcount fixo."""
+    def __init__(self, rowcount: int = 1, stored: IdempotencyKey | None = None):
+        self.rowcount = rowcount
+        self.stored = stored
+        self.statements = []
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt, params=None):
+        self.statements.append(stmt.compile(dialect=postgresql.dialect()))
+        return type("Result", (), {"rowcount": self.rowcount})()
+
+    async def commit(self):
+        pass
+
+    async def get(self, model, key):
+        return self.stored
+
+
+@pytest.mark.asyncio
+async def test_reserve_takes_over_only_expired_in_progress_keys(monkeypatch):
+    session = KeySession(rowcount=1)
+    monkeypatch.setattr(idempotency, "AsyncSessionLocal", session)
+    lease = await idempotency._reserve("k1", "POST /x")
+    assert lease is not None and lease > datetime.utcnow()
+    upsert = str(session.statements[-1])
+    assert "ON CONFLICT (key) DO UPDATE" in upsert
+    where = upsert.split("WHERE", 1)[1]
+    assert "idempotency_keys.response IS NULL" in where
+    assert "idempotency_keys.scope = excluded.scope" in where
+    assert "idempotency_keys.locked_until IS NULL OR idempotency_keys.locked_until <" in where
+
+
+@pytest.mark.asyncio
+async def test_reserve_returns_none_when_key_is_held(monkeypatch):
+    monkeypatch.setattr(idempotency, "AsyncSessionLocal", KeySession(rowcount=0))
+    assert await idempotency._reserve("k1", "POST /x") is None
+
+
+@pytest.mark.asyncio
+async def test_in_progress_key_answers_409_with_retry_after(monkeypatch):
+    async def reserve(key, scope):
+        return None
+
+    stored = IdempotencyKey(
+        key="k1", scope="POST /api/v1/chapters/12/publish",
+        locked_until=datetime.utcnow() + timedelta(seconds=40)
+    )
+    monkeypatch.setattr(idempotency, "_reserve", reserve)
+    with pytest.raises(HTTPException) as exc:
+        await idempotency.idempotent(FakeRequest(), "k1", KeySession(stored=stored), lambda: None)
+    assert exc.value.status_code == 409
+    assert 1 <= int(exc.value.headers["Retry-After"]) <= 41
+
+
+@pytest.mark.asyncio
+async def test_store_and_release_only_touch_own_lease(monkeypatch):
+    session = KeySession()
+    monkeypatch.setattr(idempotency, "AsyncSessionLocal", session)
+    lease = datetime(2026, 1, 1, 12, 0, 0)
+    await idempotency._store("k1", lease, {"job_id": 3})
+    await idempotency._release("k1", lease)
+    for compiled in session.statements:
+        assert "idempotency_keys.locked_until = %(locked_until_1)s" in str(compiled)
+        assert compiled.params["locked_until_1"] == lease
+
+
+@pytest.mark.asyncio
+async def test_takeover_runs_handler_and_stores_response(monkeypatch):
+    lease = datetime(2026, 1, 1, 12, 0, 0)
+    stored = []
+
+    async def reserve(key, scope):
+        return lease
+
+    async def store(key, owner, response):
+        stored.append((key, owner, response))
+
+    async def handler():
+        return {"job_id": 3}
+
+    monkeypatch.setattr(idempotency, "_reserve", reserve)
+    monkeypatch.setattr(idempotency, "_store", store)
+    assert await idempotency.idempotent(FakeRequest(), "k1", KeySession(), handler) == {"job_id": 3}
+    assert stored == [("k1", lease, {"job_id": 3})]
+
+
+@pytest.mark.asyncio
+async def test_repeat_replays_stored_response(monkeypatch):
+    async def reserve(key, scope):
+        return None
+
+    async def handler():
+        raise AssertionError("repetição não executa de novo")
+
+    stored = IdempotencyKey(key="k1", scope="POST /api/v1/chapters/12/publish", status_code=200, response={"job_id": 3})
+    monkeypatch.setattr(idempotency, "_reserve", reserve)
+    response = await idempotency.idempotent(FakeRequest(), "k1", KeySession(stored=stored), handler)
+    assert response.status_code == 200
+    assert response.body == b'{"job_id":3}'
+    assert response.headers["Idempotent-Replayed"] == "true"
+
+
+@pytest.mark.asyncio
+async def test_key_from_another_endpoint_is_422(monkeypatch):
+    async def reserve(key, scope):
+        return None
+
+    stored = IdempotencyKey(key="k1", scope="POST /api/v1/upload", status_code=200, response={"job_id": 3})
+    monkeypatch.setattr(idempotency, "_reserve", reserve)
+    with pytest.raises(HTTPException) as exc:
+        await idempotency.idempotent(FakeRequest(), "k1", KeySession(stored=stored), lambda: None)
+    assert exc.value.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_failed_handler_releases_key(monkeypatch):
+    lease = datetime(2026, 1, 1, 12, 0, 0)
+    released = []
+
+    async def reserve(key, scope):
+        return lease
+
+    async def release(key, owner):
+        released.append((key, owner))
+
+    async def handler():
+        raise RuntimeError("MinIO caiu")
+
+    monkeypatch.setattr(idempotency, "_reserve", reserve)
+    monkeypatch.setattr(idempotency, "_release", release)
+    with pytest.raises(RuntimeError):
+        await idempotency.idempotent(FakeRequest(), "k1", KeySession(), handler)
+    assert released == [("k1", lease)]
+
+
+@pytest.mark.asyncio
+async def test_without_key_just_runs():
+    async def handler():
+        return {"ok": True}
+
+    assert await idempotency.idempotent(FakeRequest(), None, KeySession(), handler) == {"ok": True}
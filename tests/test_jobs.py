@@ -0,0 +1,202 @@
+from datetime import datetime, timedelta
+import pytest
+from app.core.config import settings
+from app.models.job import Job
+from app.services import jobs, worker
+from app.services.jobs import JobContext, JobDeferred, current_job, _apply_outcome
+
+NOW = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def make_job(**values) -> Job:
+    job = Job(kind=jobs.PROCESS_VIDEO, payload={}, status="RUNNING", locked_by="w", locked_until=NOW)
+    job.attempts = values.pop("attempts", 1)
+    job.max_attempts = values.pop("max_attempts", 3)
+    job.deferrals = values.pop("deferrals", 0)
+    job.cancel_requested_at = values.pop("cancel_requested_at", None)
+    return job
+
+
+def test_success_releases_lease():
+    job = make_job()
+    _apply_outcome(job, None, False, None, NOW)
+    assert job.status == "SUCCEEDED"
+    assert job.finished_at == NOW
+    assert job.locked_by is None and job.locked_until is None
+
+
+def test_error_retries_with_backoff_then_fails():
+    job = make_job(attempts=2, max_attempts=3)
+    _apply_outcome(job, "boom", False, None, NOW)
+    assert job.status == "QUEUED"
+    assert job.run_after == NOW + timedelta(seconds=60)
+
+    job = make_job(attempts=3, max_attempts=3)
+    _apply_outcome(job, "boom", False, None, NOW)
+    assert job.status == "FAILED"
+    assert job.last_error == "boom"
+
+
+def test_cancel_wins_over_error():
+    job = make_job(cancel_requested_at=NOW)
+    _apply_outcome(job, "boom", False, None, NOW)
+    assert job.status == "CANCELLED"
+
+
+def test_defer_returns_attempt():
+    job = make_job(attempts=2, deferrals=3)
+    _apply_outcome(job, "RateLimited: cota", False, 12.0, NOW)
+    assert job.status == "QUEUED"
+    assert job.run_after == NOW + timedelta(seconds=12)
+    assert job.attempts == 1
+    assert job.deferrals == 4
+
+
+def test_defer_exhausted_fails_even_with_attempts_left():
+    job = make_job(attempts=1, max_attempts=3, deferrals=settings.JOB_MAX_DEFERRALS)
+    _apply_outcome(job, "RateLimited: cota", False, 12.0, NOW)
+    assert job.status == "FAILED"
+    assert job.attempts == 1
+
+
+def test_can_defer_follows_context():
+    assert not jobs.can_defer()
+    token = current_job.set(JobContext(1, "w", deferrals=settings.JOB_MAX_DEFERRALS - 1))
+    try:
+        assert jobs.can_defer()
+    finally:
+        current_job.reset(token)
+    token = current_job.set(JobContext(1, "w", deferrals=settings.JOB_MAX_DEFERRALS))
+    try:
+        assert not jobs.can_defer()
+    finally:
+        current_job.reset(token)
+
+
+@pytest.fixture
+def fake_pipeline(monkeypatch):
+    """process_video_job sem banco: o Gemini levanta calls["error"]; gravações e eventos ficam registrados."""
+    calls = {"saved": [], "events": [], "error": JobDeferred("cota", 30)}
+
+    async def load(chapter_id):
+        return {"status": "PENDING", "video_url": "raw/v.webm", "checkpoints": {}, "system_context": "", "module_context": ""}
+
+    async def analyze_video(**kwargs):
+        raise calls["error"]
+
+    async def save_guarded(chapter_id, expected_status, values):
+        calls["saved"].append((chapter_id, expected_status, values))
+
+    async def report(stage, percent=None, chapter_id=None, **extra):
+        calls["events"].append((stage, extra))
+
+    async def start_run(*args):
+        return None
+
+    monkeypatch.setattr(worker, "_load_chapter_context", load)
+    monkeypatch.setattr(worker.ai_processor, "analyze_video", analyze_video)
+    monkeypatch.setattr(worker, "_save_guarded", save_guarded)
+    monkeypatch.setattr(worker.progress, "report", report)
+    monkeypatch.setattr(worker.job_metrics, "start_run", start_run)
+    return calls
+
+
+async def _run_failing(error_type, attempts: int = 1, deferrals: int = 0):
+    token = current_job.set(JobContext(7, "w", attempts=attempts, max_attempts=3, deferrals=deferrals))
+    try:
+        with pytest.raises(error_type):
+            await worker.process_video_job(42, "objetivo")
+    finally:
+        current_job.reset(token)
+
+
+@pytest.mark.asyncio
+async def test_deferred_job_keeps_chapter_pending(fake_pipeline):
+    await _run_failing(JobDeferred)
+    assert fake_pipeline["saved"] == []
+    assert fake_pipeline["events"][-1] == ("queued", {"status": "PENDING", "reason": "rate_limited", "retry_in": 30})
+
+
+@pytest.mark.asyncio
+async def test_deferrals_exhausted_fails_chapter(fake_pipeline):
+    await _run_failing(JobDeferred, deferrals=settings.JOB_MAX_DEFERRALS)
+    [(chapter_id, expected, values)] = fake_pipeline["saved"]
+    assert (chapter_id, expected, values["status"]) == (42, "PENDING", "FAILED")
+    assert "cota" in values["text_content"]
+    assert fake_pipeline["events"][-1][0] == "failed"
+
+
+@pytest.mark.asyncio
+async def test_error_before_last_attempt_is_retried(fake_pipeline):
+    fake_pipeline["error"] = RuntimeError("ffmpeg caiu")
+    await _run_failing(RuntimeError, attempts=1)
+    assert fake_pipeline["saved"] == []
+    assert fake_pipeline["events"][-1] == ("queued", {"status": "PENDING", "reason": "retry", "error": "ffmpeg caiu"})
+
+
+@pytest.mark.asyncio
+async def test_error_on_last_attempt_fails_chapter(fake_pipeline):
+    fake_pipeline["error"] = RuntimeError("ffmpeg caiu")
+    await _run_failing(RuntimeError, attempts=3)
+    [(_, _, values)] = fake_pipeline["saved"]
+    assert values["status"] == "FAILED"
+    assert fake_pipeline["events"][-1][0] == "failed"
+
+
+@pytest.mark.asyncio
+async def test_stitch_failure_keeps_original_error(monkeypatch):
+    """Cancelamento ao gravar FAILED não esconde o erro do ffmpeg."""
+    class Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def get(self, model, chapter_id):
+            return worker.Chapter(id=chapter_id, status="PROCESSING", video_url="raw/v.webm")
+
+        async def scalar(self, stmt):
+            return worker.Configuration(intro_video_url="intro.mp4")
+
+    async def stitch_videos(*args):
+        raise RuntimeError("ffmpeg caiu")
+
+    async def save_guarded(*args):
+        raise jobs.JobCancelled("cancelado")
+
+    async def report(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(worker, "AsyncSessionLocal", Session)
+    monkeypatch.setattr(worker.video_processor, "stitch_videos", stitch_videos)
+    monkeypatch.setattr(worker, "_save_guarded", save_guarded)
+    monkeypatch.setattr(worker.progress, "report", report)
+    token = current_job.set(JobContext(7, "w", attempts=3, max_attempts=3))
+    try:
+        with pytest.raises(RuntimeError, match="ffmpeg caiu"):
+            await worker.stitch_and_publish_job(42)
+    finally:
+        current_job.reset(token)
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_fails_chapter_in_same_transaction(recording_session):
+    job = make_job(attempts=3)
+    job.chapter_id = 42
+    job.last_error = "Lease vencido"
+    db = recording_session(rowcount=1)
+    await jobs._fail_chapter(db, job)
+    (update_sql, _), (notify_sql, params) = db.statements
+    assert update_sql.startswith("UPDATE chapters") and "chapters.status = :status_1" in update_sql
+    assert "pg_notify" in notify_sql
+    assert '"stage": "failed"' in params["payload"]
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_leaves_moved_chapter_alone(recording_session):
+    job = make_job(attempts=3)
+    job.chapter_id = 42
+    db = recording_session(rowcount=0)
+    await jobs._fail_chapter(db, job)
+    assert len(db.statements) == 1
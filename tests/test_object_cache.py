@@ -0,0 +1,143 @@
+import asyncio
+import fcntl
+import os
+import pytest
+from app.services import object_cache as object_cache_module
+from app.services.object_cache import ObjectCache
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    """Objetos de 10 bytes; conta os downloads e pode falhar sob demanda."""
+    state = {"downloads": 0, "fail": False}
+
+    async def stat_object(name):
+        return {"etag": "e1", "size": 10}
+
+    async def download_file(name, dest):
+        state["downloads"] += 1
+        if state["fail"]:
+            with open(dest, "wb") as f:
+                f.write(b"meio")
+            raise ConnectionError("MinIO caiu")
+        with open(dest, "wb") as f:
+            f.write(b"x" * 10)
+
+    monkeypatch.setattr(object_cache_module.async_storage, "stat_object", stat_object)
+    monkeypatch.setattr(object_cache_module.async_storage, "download_file", download_file)
+    return state
+
+
+def _other_process_pin(path: str) -> int:
+    """flock é por descrição de arquivo aberta: um open() separado se comporta como outro processo."""
+    fd = os.open(path, os.O_RDONLY)
+    fcntl.flock(fd, fcntl.LOCK_SH)
+    return fd
+
+
+@pytest.mark.asyncio
+async def test_second_open_is_a_hit(tmp_path, storage):
+    cache = ObjectCache(str(tmp_path), max_bytes=100)
+    async with cache.open("documentacao/a.webm") as first:
+        pass
+    async with cache.open("documentacao/a.webm") as second:
+        assert second == first
+    assert (cache.hits, cache.misses, storage["downloads"]) == (1, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_pinned_file_survives_eviction_from_another_process(tmp_path, storage):
+    cache = ObjectCache(str(tmp_path), max_bytes=15)
+    other = ObjectCache(str(tmp_path), max_bytes=15)
+    async with cache.open("documentacao/a.webm") as pinned:
+        # Outro processo (outra instância no mesmo diretório) enche o cache
+        async with other.open("documentacao/b.webm") as newer:
+            assert os.path.exists(pinned)
+            assert os.path.exists(newer)
+    os.utime(pinned, (0, 0))  # a é o menos usado
+    other._evict()
+    assert not os.path.exists(pinned)  # sem pin, o mais antigo sai
+
+
+@pytest.mark.asyncio
+async def test_eviction_skips_foreign_pin(tmp_path, storage):
+    cache = ObjectCache(str(tmp_path), max_bytes=5)
+    async with cache.open("documentacao/a.webm") as path:
+        pass
+    fd = _other_process_pin(path)
+    try:
+        cache._evict()
+        assert os.path.exists(path)
+    finally:
+        os.close(fd)
+    cache._evict()
+    assert not os.path.exists(path)
+
+
+@pytest.mark.asyncio
+async def test_file_evicted_before_pin_is_downloaded_again(tmp_path, storage, monkeypatch):
+    cache = ObjectCache(str(tmp_path), max_bytes=100)
+    original_pin = cache._pin
+    evicted = []
+
+    def pin_after_eviction(path):
+        if not evicted:
+            evicted.append(path)
+            os.remove(path)  # outro processo despejou entre o _ensure e o lock
+        return original_pin(path)
+
+    monkeypatch.setattr(cache, "_pin", pin_after_eviction)
+    async with cache.open("documentacao/a.webm") as path:
+        assert os.path.exists(path)
+    assert storage["downloads"] == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_download_leaves_no_lock_or_partial_file(tmp_path, storage):
+    cache = ObjectCache(str(tmp_path), max_bytes=100)
+    storage["fail"] = True
+    with pytest.raises(ConnectionError):
+        async with cache.open("documentacao/a.webm"):
+            pass
+    assert cache._fill_locks == {}
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_waiters_share_one_download_after_a_failure(tmp_path, monkeypatch):
+    """O primeiro download falha; os que estavam na fila e quem chega depois baixam uma vez só."""
+    cache = ObjectCache(str(tmp_path), max_bytes=100)
+    downloads = []
+    gates = [asyncio.Event(), asyncio.Event()]
+
+    async def stat_object(name):
+        return {"etag": "e1", "size": 10}
+
+    async def download_file(name, dest):
+        downloads.append(dest)
+        await gates[min(len(downloads), 2) - 1].wait()
+        if len(downloads) == 1:
+            raise ConnectionError("MinIO caiu")
+        with open(dest, "wb") as f:
+            f.write(b"x" * 10)
+
+    async def read():
+        async with cache.open("documentacao/a.webm") as path:
+            return path
+
+    monkeypatch.setattr(object_cache_module.async_storage, "stat_object", stat_object)
+    monkeypatch.setattr(object_cache_module.async_storage, "download_file", download_file)
+    first = asyncio.create_task(read())
+    queued = [asyncio.create_task(read()) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    gates[0].set()
+    with pytest.raises(ConnectionError):
+        await first
+    # Chega enquanto um dos que estavam na fila está baixando
+    late = asyncio.create_task(read())
+    await asyncio.sleep(0.01)
+    gates[1].set()
+    paths = await asyncio.gather(*queued, late)
+    assert len(set(paths)) == 1
+    assert len(downloads) == 2
+    assert cache._fill_locks == {}
@@ -0,0 +1,58 @@
+import pytest
+from app.services import storage
+from app.services.storage import PresignCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"t": 1000.0}
+    monkeypatch.setattr(storage.time, "time", lambda: now["t"])
+    return now
+
+
+def test_hit_while_url_has_enough_life(clock):
+    cache = PresignCache(max_entries=10, min_remaining=300)
+    assert cache.get("a.mp4", 3600) is None
+    cache.put("a.mp4", 3600, "url-a", signed_at=clock["t"])
+    clock["t"] += 3600 - 300
+    assert cache.get("a.mp4", 3600) == "url-a"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_url_close_to_expiry_is_signed_again(clock):
+    cache = PresignCache(max_entries=10, min_remaining=300)
+    cache.put("a.mp4", 3600, "url-a", signed_at=clock["t"])
+    clock["t"] += 3600 - 299
+    assert cache.get("a.mp4", 3600) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_short_expiration_uses_half_its_life(clock):
+    cache = PresignCache(max_entries=10, min_remaining=300)
+    cache.put("a.mp4", 60, "url-a", signed_at=clock["t"])
+    clock["t"] += 30
+    assert cache.get("a.mp4", 60) == "url-a"
+    clock["t"] += 1
+    assert cache.get("a.mp4", 60) is None
+
+
+def test_lru_eviction_keeps_recently_used(clock):
+    cache = PresignCache(max_entries=2, min_remaining=300)
+    cache.put("a.mp4", 3600, "url-a", signed_at=clock["t"])
+    cache.put("b.mp4", 3600, "url-b", signed_at=clock["t"])
+    cache.get("a.mp4", 3600)
+    cache.put("c.mp4", 3600, "url-c", signed_at=clock["t"])
+    assert cache.get("b.mp4", 3600) is None
+    assert cache.get("a.mp4", 3600) == "url-a"
+    assert cache.evictions == 1
+
+
+def test_invalidate_drops_every_expiration_of_the_object(clock):
+    cache = PresignCache(max_entries=10, min_remaining=300)
+    cache.put("a.mp4", 3600, "url-1h", signed_at=clock["t"])
+    cache.put("a.mp4", 7200, "url-2h", signed_at=clock["t"])
+    cache.put("b.mp4", 3600, "url-b", signed_at=clock["t"])
+    cache.invalidate("a.mp4")
+    assert cache.get("a.mp4", 3600) is None
+    assert cache.get("a.mp4", 7200) is None
+    assert cache.get("b.mp4", 3600) == "url-b"
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.db.session import get_db
+from app.models import Chapter, Collection
+from app.models.upload_session import UploadSession
+from app.routers import upload
+
+
+class SessionDb:
+    """Sessão do router: a linha de upload_sessions e a ordem de locks, commits e chamadas ao MinIO."""
+    def __init__(self, session: UploadSession, log: list):
+        self.session = session
+        self.log = log
+
+    async def execute(self, stmt):
+        sql = str(stmt)
+        if sql.startswith("UPDATE upload_sessions"):
+            self.log.append(("update", stmt.compile().params["status"]))
+            if self.session.status == "COMPLETING":
+                self.session.status = stmt.compile().params["status"]
+            return None
+        self.log.append("lock")
+        return type("Result", (), {"scalar_one_or_none": lambda _: self.session})()
+
+    async def commit(self):
+        self.log.append("commit")
+
+
+@pytest.fixture
+def complete(monkeypatch):
+    log = []
+    state = {"stat": {"size": 10, "content_type": "video/webm"}, "session": None}
+
+    async def complete_multipart_upload(object_key, upload_id, parts):
+        log.append("minio:complete")
+
+    async def stat_object(object_key):
+        log.append("minio:stat")
+        if state["stat"] is None:
+            raise FileNotFoundError(object_key)
+        return state["stat"]
+
+    async def remove_object(object_key):
+        log.append("minio:remove")
+
+    async def create_manual(db, module_id, title, video_path):
+        log.append("create_manual")
+        return Collection(id=1), Chapter(id=9, status="PENDING", video_url=video_path)
+
+    async def enqueue_and_respond(db, collection, chapter, title, dedup=False, **extra):
+        return {"status": "success", "chapter_id": chapter.id}
+
+    monkeypatch.setattr(upload.async_storage, "complete_multipart_upload", complete_multipart_upload)
+    monkeypatch.setattr(upload.async_storage, "stat_object", stat_object)
+    monkeypatch.setattr(upload.async_storage, "remove_object", remove_object)
+    monkeypatch.setattr(upload, "create_manual", create_manual)
+    monkeypatch.setattr(upload, "_enqueue_and_respond", enqueue_and_respond)
+
+    async def db():
+        yield SessionDb(state["session"], log)
+
+    app = FastAPI()
+    app.include_router(upload.router)
+    app.dependency_overrides[get_db] = db
+    return TestClient(app), state, log
+
+
+def _session(status="OPEN", updated_at=None, expected_size=10):
+    return UploadSession(
+        id="s1", object_key="s1_a.webm", upload_id="u1", module_id=1, title="Gravação",
+        chunk_size=5, expected_size=expected_size, parts=[], status=status,
+        updated_at=updated_at or datetime.utcnow()
+    )
+
+
+BODY = {"session_id": "s1", "parts": [{"part_number": 1, "etag": "e1"}]}
+
+
+def test_minio_calls_run_without_lock_or_connection(complete):
+    client, state, log = complete
+    state["session"] = _session()
+    response = client.post("/upload/complete", json=BODY)
+    assert response.status_code == 200 and response.json()["chapter_id"] == 9
+    assert log == ["lock", "commit", "minio:complete", "minio:stat", "lock", "create_manual", "commit"]
+    assert state["session"].status == "COMPLETED"
+
+
+def test_concurrent_confirmation_is_409(complete):
+    client, state, log = complete
+    state["session"] = _session(status="COMPLETING")
+    assert client.post("/upload/complete", json=BODY).status_code == 409
+    assert "minio:complete" not in log
+
+
+def test_stale_confirmation_is_taken_over(complete):
+    client, state, log = complete
+    state["session"] = _session(status="COMPLETING", updated_at=datetime.utcnow() - timedelta(hours=1))
+    assert client.post("/upload/complete", json=BODY).status_code == 200
+    assert state["session"].status == "COMPLETED"
+
+
+def test_missing_object_reopens_session(complete):
+    client, state, log = complete
+    state["session"] = _session()
+    state["stat"] = None
+    assert client.post("/upload/complete", json=BODY).status_code == 400
+    assert ("update", "OPEN") in log
+    assert state["session"].status == "OPEN"
+
+
+def test_wrong_size_aborts_session(complete):
+    client, state, log = complete
+    state["session"] = _session(expected_size=99)
+    assert client.post("/upload/complete", json=BODY).status_code == 400
+    assert "minio:remove" in log
+    assert state["session"].status == "ABORTED"
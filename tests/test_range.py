@@ -0,0 +1,24 @@
+import pytest
+from app.routers.chapter import _parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),        # sufixo maior que o arquivo: o arquivo todo
+    ("bytes=900-5000", (900, 999)),   # fim além do tamanho é cortado
+    ("BYTES = 0-0", (0, 0)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=500-100", "bytes=-0"])
+def test_unsatisfiable_ranges_are_416(header):
+    assert _parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["items=0-10", "bytes=0-10,20-30", "bytes=a-b", "bytes=0-x"])
+def test_invalid_or_multi_range_is_ignored(header):
+    assert _parse_range(header, 1000) is False
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+import pytest
+from app.core.config import settings
+from app.services import rate_limit
+from app.services.rate_limit import RateLimited, SharedTokenBucket, backoff_seconds, retry_after_seconds
+
+
+def test_retry_after_from_grpc_details():
+    error = Exception("429")
+    error.details = [SimpleNamespace(), SimpleNamespace(retry_delay=SimpleNamespace(seconds=12, nanos=500_000_000))]
+    assert retry_after_seconds(error) == 12.5
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("429 Resource exhausted. Please retry in 7.25s.", 7.25),
+    ("quota exceeded ... retry_delay { seconds: 31 }", 31.0),
+    ("500 internal error", None),
+])
+def test_retry_after_from_message(message, expected):
+    assert retry_after_seconds(Exception(message)) == expected
+
+
+def test_backoff_grows_with_full_jitter_and_is_capped():
+    base = settings.GEMINI_BACKOFF_BASE_SECONDS
+    for attempt in range(4):
+        cap = min(settings.GEMINI_BACKOFF_MAX_SECONDS, base * 2 ** attempt)
+        assert cap / 2 <= backoff_seconds(attempt) <= cap
+    assert backoff_seconds(50) <= settings.GEMINI_BACKOFF_MAX_SECONDS
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    """Bucket com _take falso (sequência de esperas) e sem dormir de verdade."""
+    bucket = SharedTokenBucket("teste", rate_per_minute=60, burst=1)
+    bucket.waits = []
+    slept = []
+
+    async def take():
+        wait = bucket.waits.pop(0)
+        if isinstance(wait, Exception):
+            raise wait
+        return wait
+
+    async def sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(bucket, "_take", take)
+    monkeypatch.setattr(rate_limit.asyncio, "sleep", sleep)
+    bucket.slept = slept
+    return bucket
+
+
+@pytest.mark.asyncio
+async def test_acquire_waits_for_short_refill(bucket):
+    bucket.waits = [0.5, 0.0]
+    await bucket.acquire(max_wait=5)
+    assert bucket.acquired == 1
+    assert 0.5 <= bucket.slept[0] <= 1.0
+
+
+@pytest.mark.asyncio
+async def test_acquire_defers_when_wait_exceeds_max(bucket):
+    bucket.waits = [30.0]
+    with pytest.raises(RateLimited) as exc:
+        await bucket.acquire(max_wait=5)
+    assert exc.value.delay == 30.0
+    assert (bucket.acquired, bucket.deferred, bucket.slept) == (0, 1, [])
+
+
+@pytest.mark.asyncio
+async def test_acquire_fails_open_when_database_is_down(bucket):
+    bucket.waits = [ConnectionError("banco fora")]
+    await bucket.acquire(max_wait=5)
+    assert bucket.acquired == 1
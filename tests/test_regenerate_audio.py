@@ -0,0 +1,82 @@
+import asyncio
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.db.session import get_db
+from app.models import Chapter
+from app.models.job import Job, PRIORITY_INTERACTIVE
+from app.routers import chapter as chapter_router
+from app.services.jobs import REGENERATE_AUDIO
+from app.services.progress import progress_bus
+
+CONTENT = json.dumps({"steps": [{"description": "a"}, {"description": "b"}]})
+
+
+class FakeDb:
+    async def get(self, model, chapter_id):
+        return Chapter(id=chapter_id, title="t", text_content=CONTENT) if chapter_id == 1 else None
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Endpoint com fila falsa: o 'worker' publica o evento do job no barramento."""
+    state = {"enqueued": [], "worker_event": {"stage": "done", "audio_url": "documentacao/n.mp3", "duration": 2.5}, "active": None}
+
+    async def enqueue(db, kind, payload, chapter_id=None, priority=None, system_id=None):
+        state["enqueued"].append((kind, payload, priority))
+        if state["active"] is not None:
+            return Job(id=6, payload=state["active"]), False
+        if state["worker_event"] is not None:
+            event = {"chapter_id": chapter_id, "job_id": 5, "step_index": payload["step_index"], **state["worker_event"]}
+            asyncio.get_running_loop().call_soon(progress_bus.dispatch, event)
+        return Job(id=5, payload=payload), True
+
+    async def db():
+        yield FakeDb()
+
+    monkeypatch.setattr(chapter_router, "enqueue", enqueue)
+    monkeypatch.setattr(settings, "AUDIO_REGENERATE_WAIT_SECONDS", 0.2)
+    app = FastAPI()
+    app.include_router(chapter_router.router)
+    app.dependency_overrides[get_db] = db
+    return TestClient(app), state
+
+
+def test_waits_for_worker_result(api):
+    client, state = api
+    response = client.post("/chapters/1/regenerate_audio", json={"step_index": 1, "text": "novo"})
+    assert response.status_code == 200
+    assert response.json() == {"audio_url": "/api/v1/stream?path=documentacao/n.mp3", "duration": 2.5}
+    assert state["enqueued"] == [(REGENERATE_AUDIO, {"chapter_id": 1, "step_index": 1, "text": "novo"}, PRIORITY_INTERACTIVE)]
+
+
+def test_slow_worker_returns_202(api):
+    client, state = api
+    state["worker_event"] = None
+    response = client.post("/chapters/1/regenerate_audio", json={"step_index": 0, "text": "novo"})
+    assert response.status_code == 202
+    assert response.json() == {"status": "queued", "job_id": 5, "step_index": 0}
+
+
+def test_worker_failure_is_500(api):
+    client, state = api
+    state["worker_event"] = {"stage": "failed", "error": "TTS fora do ar"}
+    response = client.post("/chapters/1/regenerate_audio", json={"step_index": 0, "text": "novo"})
+    assert response.status_code == 500
+    assert response.json()["detail"] == "TTS fora do ar"
+
+
+def test_other_step_in_progress_is_409(api):
+    client, state = api
+    state["active"] = {"chapter_id": 1, "step_index": 0, "text": "outro"}
+    response = client.post("/chapters/1/regenerate_audio", json={"step_index": 1, "text": "novo"})
+    assert response.status_code == 409
+
+
+def test_invalid_step_is_rejected_before_enqueue(api):
+    client, state = api
+    assert client.post("/chapters/1/regenerate_audio", json={"step_index": 5, "text": "x"}).status_code == 400
+    assert client.post("/chapters/2/regenerate_audio", json={"step_index": 0, "text": "x"}).status_code == 404
+    assert state["enqueued"] == []
@@ -0,0 +1,33 @@
+import pytest
+from app.models.job import PRIORITY_MAINTENANCE
+from app.services import retention
+from app.services.jobs import ARCHIVE_RAW, JOB_HANDLERS
+from app.services.retention import RawRetention
+
+
+@pytest.mark.asyncio
+async def test_run_once_only_enqueues_one_job_per_original(monkeypatch, null_session):
+    queued = []
+
+    async def candidates(self):
+        return [(1, "documentacao/a.webm"), (2, "documentacao/a.webm"), (3, "documentacao/b.webm")]
+
+    async def enqueue(db, kind, payload, chapter_id=None, priority=None, system_id=None):
+        queued.append((kind, payload, chapter_id, priority))
+        return None, chapter_id != 3
+
+    monkeypatch.setattr(RawRetention, "_candidates", candidates)
+    monkeypatch.setattr(retention, "enqueue", enqueue)
+    monkeypatch.setattr(retention, "AsyncSessionLocal", null_session)
+
+    report = await RawRetention().run_once()
+    assert queued == [
+        (ARCHIVE_RAW, {"chapter_id": 1}, 1, PRIORITY_MAINTENANCE),
+        (ARCHIVE_RAW, {"chapter_id": 3}, 3, PRIORITY_MAINTENANCE),
+    ]
+    assert (report["originals"], report["enqueued"], report["already_queued"]) == (2, 1, 1)
+
+
+def test_archive_job_runs_in_worker():
+    import app.services.worker  # noqa: F401 (registra os handlers)
+    assert ARCHIVE_RAW in JOB_HANDLERS
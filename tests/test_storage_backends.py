@@ -0,0 +1,47 @@
+import inspect
+import pytest
+from minio import Minio
+from app.services.storage_backends import MinioBackend
+
+
+@pytest.mark.parametrize("method, params", [
+    ("_create_multipart_upload", ["bucket_name", "object_name", "headers"]),
+    ("_upload_part", ["bucket_name", "object_name", "data", "headers", "upload_id", "part_number"]),
+    ("_complete_multipart_upload", ["bucket_name", "object_name", "upload_id", "parts"]),
+    ("_abort_multipart_upload", ["bucket_name", "object_name", "upload_id"]),
+])
+def test_minio_private_multipart_api_is_unchanged(method, params):
+    """MinioBackend chama estes métodos internos por posição: se o minio-py mudar, falha aqui."""
+    assert hasattr(Minio, method), f"minio-py removeu {method}; revise MinioBackend antes de atualizar"
+    assert list(inspect.signature(getattr(Minio, method)).parameters)[1:] == params
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+
+    def _create_multipart_upload(self, bucket_name, object_name, headers):
+        self.calls.append(("create", bucket_name, object_name, headers))
+        return "u1"
+
+    def _upload_part(self, bucket_name, object_name, data, headers, upload_id, part_number):
+        self.calls.append(("part", object_name, data, upload_id, part_number))
+        return f"e{part_number}"
+
+    def _complete_multipart_upload(self, bucket_name, object_name, upload_id, parts):
+        self.calls.append(("complete", upload_id, [(p.part_number, p.etag) for p in parts]))
+        return type("Result", (), {"etag": "final"})()
+
+    def _abort_multipart_upload(self, bucket_name, object_name, upload_id):
+        self.calls.append(("abort", upload_id))
+
+
+def test_multipart_round_trip_orders_parts():
+    client = FakeClient()
+    backend = MinioBackend(client, "documentacao")
+    upload_id = backend.create_multipart("a.webm", "video/webm")
+    etags = [backend.upload_part("a.webm", upload_id, n, b"x") for n in (2, 1)]
+    parts = [{"part_number": 2, "etag": etags[0]}, {"part_number": 1, "etag": etags[1]}]
+    assert backend.complete_multipart("a.webm", upload_id, parts) == "final"
+    assert client.calls[0] == ("create", "documentacao", "a.webm", {"Content-Type": "video/webm"})
+    assert client.calls[-1] == ("complete", "u1", [(1, "e1"), (2, "e2")])
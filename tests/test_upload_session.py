@@ -0,0 +1,99 @@
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from app.models.upload_session import UploadSession
+from app.routers import upload_session
+
+
+@pytest.fixture
+def live(monkeypatch, null_session):
+    """/upload/live sem banco nem MinIO: a sessão muda de status entre o início e o stop."""
+    state = {"status_at_stop": "OPEN", "completed": 0}
+
+    def make(status):
+        return UploadSession(
+            id="s1", object_key="s1_capture.webm", upload_id="u1", module_id=1, title="Gravação",
+            content_type="video/webm", chunk_size=5 * 1024 * 1024, committed_offset=0, parts=[],
+            status=status, chapter_id=9 if status == "COMPLETED" else None
+        )
+
+    async def get_session(db, session_id, for_update=False):
+        return make(state["status_at_stop"] if for_update else "OPEN")
+
+    async def upload_part(*args):
+        return "etag"
+
+    async def record_part(*args):
+        return None
+
+    async def complete_session(*args, **kwargs):
+        state["completed"] += 1
+        raise AssertionError("sessão fechada não pode ser finalizada de novo")
+
+    monkeypatch.setattr(upload_session, "AsyncSessionLocal", null_session)
+    monkeypatch.setattr(upload_session, "_get_session", get_session)
+    monkeypatch.setattr(upload_session.async_storage, "upload_part", upload_part)
+    monkeypatch.setattr(upload_session, "_record_part", record_part)
+    monkeypatch.setattr(upload_session, "_complete_session", complete_session)
+
+    app = FastAPI()
+    app.include_router(upload_session.router)
+    return TestClient(app), state
+
+
+def _record_and_stop(client):
+    with client.websocket_connect("/upload/live") as ws:
+        ws.send_json({"session_id": "s1"})
+        assert ws.receive_json()["type"] == "ready"
+        ws.send_bytes(b"video")
+        ws.send_json({"type": "stop"})
+        ack = ws.receive_json()
+        assert ack == {"type": "ack", "committed_offset": 5}
+        return ws.receive_json()
+
+
+def test_stop_on_aborted_session_is_rejected(live):
+    client, state = live
+    state["status_at_stop"] = "ABORTED"
+    reply = _record_and_stop(client)
+    assert reply == {"type": "error", "detail": "Sessão está ABORTED"}
+    assert state["completed"] == 0
+
+
+def test_stop_on_finalized_session_returns_existing_chapter(live):
+    client, state = live
+    state["status_at_stop"] = "COMPLETED"
+    reply = _record_and_stop(client)
+    assert reply["type"] == "done" and reply["chapter_id"] == 9
+    assert state["completed"] == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status", ["COMPLETED", "ABORTED"])
+async def test_part_racing_finalize_is_rejected_under_lock(monkeypatch, status):
+    """O chunk leu a sessão OPEN, mas o finalize fechou antes do _record_part travar a linha."""
+    session = UploadSession(
+        id="s1", object_key="k", upload_id="u1", chunk_size=5, committed_offset=5,
+        parts=[{"part_number": 1, "etag": "e1", "size": 5}], status=status
+    )
+
+    class Db:
+        committed = False
+
+        async def rollback(self):
+            pass
+
+        async def commit(self):
+            self.committed = True
+
+    async def get_session(db, session_id, for_update=False):
+        assert for_update
+        return session
+
+    db = Db()
+    monkeypatch.setattr(upload_session, "_get_session", get_session)
+    with pytest.raises(HTTPException) as exc:
+        await upload_session._record_part(db, "s1", 2, "e2", 5)
+    assert exc.value.status_code == 409
+    assert session.parts == [{"part_number": 1, "etag": "e1", "size": 5}]
+    assert not db.committed